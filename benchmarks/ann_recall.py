@@ -0,0 +1,65 @@
+# benchmarks/ann_recall.py
+"""Recall-vs-brute-force report for the IVF candidate index.
+
+Usage:
+    python benchmarks/ann_recall.py --source polymarket          # index built from DB_PATH
+    python benchmarks/ann_recall.py --synthetic 50000 --dim 1024  # offline, clustered random vectors
+
+Prints one JSON object per nprobe with recall@k and per-query latency, so nlist/nprobe
+can be tuned against the exact matrix scan.
+"""
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from market_sync.ann import IVFIndex, recall_report
+from market_sync.vectors import normalize_rows
+
+def synthetic_vectors(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    x = centers[rng.integers(0, clusters, n)] + 0.35 * rng.normal(size=(n, dim)).astype(np.float32)
+    return normalize_rows(x)
+
+def index_from_db(source: str) -> IVFIndex:
+    from market_sync.config import DB_PATH, VOYAGE_MODEL
+    from market_sync.db import open_db
+    from market_sync.embeddings import EmbeddingCache
+    from market_sync.repo import Repo
+
+    conn = open_db(DB_PATH)
+    cache = EmbeddingCache(conn)
+    rows = Repo(conn).fetch_active_bets_by_source(source)
+    vecs = cache.get_many((r[4] for r in rows), VOYAGE_MODEL)
+    keep = [r for r in rows if r[4] in vecs]
+    matrix = normalize_rows(np.stack([vecs[r[4]] for r in keep]).astype(np.float32))
+    return IVFIndex.build([r[0] for r in keep], [r[4] for r in keep], matrix)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", default="polymarket", help="Source to index from DB_PATH")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N synthetic vectors instead of the DB")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        x = synthetic_vectors(args.synthetic, args.dim, args.clusters)
+        index = IVFIndex.build([str(i) for i in range(len(x))], [""] * len(x), x)
+    else:
+        index = index_from_db(args.source)
+    rng = np.random.default_rng(1)
+    picks = rng.choice(index.vectors.shape[0], min(args.queries, index.vectors.shape[0]), replace=False)
+    # Perturb the stored vectors so queries are near, not identical to, indexed rows
+    queries = index.vectors[picks] + 0.05 * rng.normal(size=(len(picks), index.dim)).astype(np.float32)
+    for row in recall_report(index, queries, k=args.k):
+        print(json.dumps(row))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# benchmarks/coarse.py
+"""Two-stage (coarse shortlist, full rescore) matching and ranking vs the exhaustive scan.
+
+Usage:
+    python benchmarks/coarse.py --markets 20000 --dim 1024
+    python benchmarks/coarse.py --markets 20000 --coarse-dim 64 --coarse-dim 128 --shortlist 100 --shortlist 400
+
+Builds one synthetic DB like ``benchmarks/quantized.py`` and runs ``propose_and_link``
+on a copy of it per mode: exhaustive first, then ``prefix`` and ``pca`` at each
+``--coarse-dim`` / ``--shortlist``. Prints one JSON object per mode with seconds,
+projection fit seconds, pairs rescored at full dimension, auto-links, queued pairs
+and decision flips against the exhaustive run. Then, for ``MatrixCache.rank``,
+recall@k against the exact ranking and mean per-query milliseconds per mode.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from market_sync.match import propose_and_link
+from market_sync.metrics import METRICS
+from market_sync.vectors import MatrixCache, load_source_matrix
+from quantized import OTHER, SOURCES, _counter, build, decisions, open_copy
+
+def _stage_seconds(stage: str) -> float:
+    return sum(h["sum"] for h in METRICS.snapshot()["histograms"].get("stage_seconds", []) if h["labels"].get("stage") == stage)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--markets", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--coarse-dim", type=int, action="append", help="Reduced dimension(s) to try (default 64 and 128)")
+    parser.add_argument("--shortlist", type=int, action="append", help="Shortlist size(s) to try (default 200)")
+    parser.add_argument("--queries", type=int, default=200, help="UI rank queries")
+    parser.add_argument("--k", type=int, default=80)
+    args = parser.parse_args()
+    dims = args.coarse_dim or [64, 128]
+    shortlists = args.shortlist or [200]
+
+    base = os.path.join(tempfile.mkdtemp(prefix="market_sync_coarse_"), "base.sqlite")
+    t0 = time.perf_counter()
+    build(base, args.markets, args.dim, args.seed)
+    print(json.dumps({"build_seconds": round(time.perf_counter() - t0, 2), "markets": args.markets, "dim": args.dim}))
+
+    METRICS.enable()
+    modes = [(None, 0, 0)] + [(kind, d, s) for kind in ("prefix", "pca") for d in dims for s in shortlists]
+    reference = None
+    for kind, d, s in modes:
+        conn, repo, embedder = open_copy(base, f"{kind or 'exact'}_{d}_{s}", args.dim)
+        METRICS.reset()
+        t0 = time.perf_counter()
+        auto_links, queued = propose_and_link(repo, embedder, SOURCES, coarse=kind, coarse_dim=d, shortlist=s)
+        seconds = time.perf_counter() - t0
+        linked, pairs = decisions(conn)
+        if reference is None:
+            reference = (linked, pairs)
+        print(json.dumps({
+            "mode": kind or "exact", "coarse_dim": d, "shortlist": s, "seconds": round(seconds, 3),
+            "fit_seconds": round(_stage_seconds("projection_fit"), 3), "rescored": int(_counter("coarse_rescored")),
+            "auto_links": auto_links, "queued": queued,
+            "link_flips": len(linked ^ reference[0]), "queue_flips": len(pairs ^ reference[1]),
+        }))
+        conn.close()
+
+    conn, repo, embedder = open_copy(base, "rank", args.dim)
+    queries = load_source_matrix(repo, embedder, OTHER).matrix[: args.queries]
+
+    def run(cache):
+        cache.candidates(repo, embedder, ["polymarket"])
+        t0 = time.perf_counter()
+        out = [{r[:2] for r in cache.rank(repo, embedder, q, ["polymarket"], args.k)} for q in queries]
+        return out, (time.perf_counter() - t0) * 1000 / max(1, len(queries))
+
+    want, exact_ms = run(MatrixCache())
+    print(json.dumps({"rank_mode": "exact", "k": args.k, "queries": len(queries), "ms_per_query": round(exact_ms, 3)}))
+    for kind, d, s in modes[1:]:
+        got, ms = run(MatrixCache(coarse=kind, coarse_dim=d, shortlist=s))
+        recall = [len(w & g) / max(1, len(w)) for w, g in zip(want, got)]
+        print(json.dumps({
+            "rank_mode": kind, "coarse_dim": d, "shortlist": s, "k": args.k, "ms_per_query": round(ms, 3),
+            "mean_recall": round(float(np.mean(recall)), 4), "min_recall": round(float(np.min(recall)), 4),
+        }))
+
+if __name__ == "__main__":
+    main()
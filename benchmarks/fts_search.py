@@ -0,0 +1,98 @@
+# benchmarks/fts_search.py
+"""Market search latency: FTS5 (bm25, prefix) vs the old LIKE scan.
+
+Usage:
+    python benchmarks/fts_search.py --rows 100000
+    python benchmarks/fts_search.py --rows 100000 --db /tmp/fts.sqlite   # keep the DB between runs
+
+Builds a throwaway DB of synthetic markets (Zipf-distributed words) through
+``Repo.upsert_bets``, so the FTS triggers are exercised, then times common, rare,
+multi-word, prefix and missing queries ``--repeat`` times each and prints one JSON
+object per (method, query) with p50/p95 milliseconds and the hit count.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from market_sync.db import open_db
+from market_sync.models import BetBatch
+from market_sync.repo import Repo
+
+def vocabulary(size: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    words = {"".join(rng.choice(letters, rng.integers(3, 10))) for _ in range(size * 2)}
+    return np.array(sorted(words)[:size])
+
+def populate(repo: Repo, vocab: np.ndarray, rows: int, seed: int = 0, chunk: int = 10000):
+    # Zipf-distributed words, so queries range from very common to rare like real text
+    rng = np.random.default_rng(seed)
+    probs = 1.0 / np.arange(1, len(vocab) + 1)
+    probs /= probs.sum()
+    for start in range(0, rows, chunk):
+        n = min(chunk, rows - start)
+        ids = [str(start + i) for i in range(n)]
+        titles = [" ".join(rng.choice(vocab, 8, p=probs)) + "?" for _ in range(n)]
+        descs = [" ".join(rng.choice(vocab, 60, p=probs)) for _ in range(n)]
+        repo.upsert_bets(BetBatch("bench", ids, [None] * n, titles, descs, [None] * n, [None] * n))
+
+def queries(vocab: np.ndarray) -> list:
+    # Words by frequency rank, a two-word query, a 3-letter prefix and a miss
+    return [vocab[5], vocab[200], vocab[5000], f"{vocab[50]} {vocab[300]}", vocab[1000][:3], "zzzzqx"]
+
+def like_search(repo: Repo, query: str, limit: int):
+    like = f"%{query}%"
+    return repo.conn.execute(
+        """
+        SELECT source, market_id, slug, title, COALESCE(description, ''), url, COALESCE(close_time, '')
+        FROM bets WHERE source=? AND is_active=1 AND (title LIKE ? OR description LIKE ?)
+        ORDER BY last_seen_at DESC LIMIT ?
+        """,
+        ("bench", like, like, limit),
+    ).fetchall()
+
+def timed(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return out, np.percentile(samples, 50), np.percentile(samples, 95)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--db", default="", help="DB path to reuse (default: temporary)")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--vocab", type=int, default=20000)
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "fts_bench.sqlite")
+    repo = Repo(open_db(path))
+    vocab = vocabulary(args.vocab)
+    have = repo.conn.execute("SELECT COUNT(*) FROM bets WHERE source='bench'").fetchone()[0]
+    if have < args.rows:
+        t0 = time.perf_counter()
+        populate(repo, vocab, args.rows)
+        print(json.dumps({"populate_rows": args.rows, "seconds": round(time.perf_counter() - t0, 2)}))
+
+    for query in queries(vocab):
+        for method, fn in (
+            ("like", lambda: like_search(repo, query, args.limit)),
+            ("fts", lambda: repo.search_active_bets("bench", query, args.limit)),
+        ):
+            rows, p50, p95 = timed(fn, args.repeat)
+            print(json.dumps({
+                "method": method, "query": query, "rows": args.rows, "hits": len(rows),
+                "p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3),
+            }))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# benchmarks/gamma_fetch.py
+"""Serial cursor walk vs parallel offset fetch against a local Gamma stub.
+
+Usage:
+    python benchmarks/gamma_fetch.py --markets 10000 --page-size 500 --latency 0.2
+    python benchmarks/gamma_fetch.py --concurrency 1 4 8 16 --closed-every 7
+
+The stub serves ``/markets`` with ``limit``/``offset``/``cursor`` paging, sleeps
+``latency`` seconds per page, and marks every Nth market closed so the client-side
+filter is exercised. With ``--etag`` it also answers ``If-None-Match`` with 304, for
+trying the client's HTTP cache (``HTTP_CACHE_DIR``). Prints one JSON object per
+concurrency level with wall time, pages requested and whether the result matches
+the serial walk.
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from market_sync.clients.polymarket import PolymarketClient
+
+def make_markets(n: int, closed_every: int):
+    return [
+        {
+            "id": i,
+            "question": f"Will synthetic market {i} resolve yes?",
+            "description": f"Stub market {i}",
+            "slug": f"stub-{i}",
+            "active": True,
+            "closed": bool(closed_every and i % closed_every == 0),
+            "endDate": "2030-01-01T00:00:00Z",
+        }
+        for i in range(n)
+    ]
+
+def serve(markets, latency: float, etag: bool = False):
+    counter = {"pages": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != "/markets":
+                self.send_error(404)
+                return
+            q = parse_qs(url.query)
+            limit = int(q.get("limit", ["100"])[0])
+            start = int(q.get("offset", q.get("cursor", ["0"]))[0])
+            page = markets[start : start + limit]
+            body = {"data": page}
+            if start + limit < len(markets):
+                body["next_cursor"] = str(start + limit)
+            time.sleep(latency)
+            with lock:
+                counter["pages"] += 1
+            data = json.dumps(body).encode()
+            tag = '"%x"' % zlib.crc32(data)
+            if etag and self.headers.get("If-None-Match") == tag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            if etag:
+                self.send_header("ETag", tag)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, counter
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--markets", type=int, default=10000)
+    parser.add_argument("--limit", type=int, default=0, help="Client limit (default: all markets)")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds slept per page")
+    parser.add_argument("--closed-every", type=int, default=7)
+    parser.add_argument("--etag", action="store_true", help="Send ETags and honor If-None-Match")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    server, counter = serve(make_markets(args.markets, args.closed_every), args.latency, args.etag)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    limit = args.limit or args.markets
+    baseline = None
+    try:
+        for concurrency in args.concurrency:
+            client = PolymarketClient(base=base, concurrency=concurrency)
+            counter["pages"] = 0
+            t0 = time.perf_counter()
+            ids = [m["id"] for page in client.iter_open_market_pages(limit=limit, page_size=args.page_size) for m in page]
+            elapsed = time.perf_counter() - t0
+            if baseline is None:
+                baseline = ids
+            print(json.dumps({
+                "concurrency": concurrency,
+                "markets": len(ids),
+                "unique": len(set(ids)),
+                "pages": counter["pages"],
+                "seconds": round(elapsed, 3),
+                "matches_first": ids == baseline,
+            }))
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
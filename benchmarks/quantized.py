@@ -0,0 +1,129 @@
+# benchmarks/quantized.py
+"""Quantized matching and ranking vs full precision: memory, time and decision flips.
+
+Usage:
+    python benchmarks/quantized.py --markets 20000 --dim 1024
+    python benchmarks/quantized.py --markets 20000 --margin 0 --margin 0.01 --margin 0.02
+
+Builds one synthetic DB (``benchmarks/suite.py`` data: Gamma-shaped markets plus a
+reworded second source, bag-of-words fake vectors), then runs ``propose_and_link``
+on a copy of it per mode. Modes are full precision, then int8 and float16 at each
+``--margin`` (0 = no exact rescoring). Prints one JSON object per mode with the
+candidate matrix size, seconds, pairs rescored exactly, auto-links, queued pairs,
+and how many linked markets and queued pairs differ from the full-precision run
+(``link_flips``, ``queue_flips``). A last object compares ``MatrixCache.rank`` top-k overlap for
+the UI path.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from market_sync.clients.polymarket import PolymarketClient
+from market_sync.db import open_db
+from market_sync.embeddings import EmbeddingCache, Embedder, VectorLRU
+from market_sync.fakes import BagOfWordsEmbeddingClient, synthetic_markets
+from market_sync.match import propose_and_link
+from market_sync.metrics import METRICS
+from market_sync.repo import Repo
+from market_sync.sync import sync_source, sync_stream
+from market_sync.vectors import MatrixCache, QuantizedMatrix, load_source_matrix
+from suite import OTHER, paraphrases
+
+SOURCES = ["polymarket", OTHER]
+
+def build(path: str, n: int, dim: int, seed: int):
+    conn = open_db(path)
+    repo = Repo(conn)
+    embedder = Embedder(model="bench", cache=EmbeddingCache(conn), client=BagOfWordsEmbeddingClient(dim=dim))
+    markets = synthetic_markets(n, seed=seed)
+    sync_stream((PolymarketClient.to_batch(markets[i : i + 500]) for i in range(0, n, 500)), repo, embedder, "polymarket")
+    sync_source(paraphrases(markets, max(100, n // 10), seed), repo, embedder)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+def open_copy(base: str, name: str, dim: int):
+    path = os.path.join(os.path.dirname(base), name + ".sqlite")
+    shutil.copyfile(base, path)
+    conn = open_db(path)
+    # No LRU, so exact rescoring reads from SQLite like a cold run
+    embedder = Embedder(model="bench", cache=EmbeddingCache(conn, lru=VectorLRU(0)), client=BagOfWordsEmbeddingClient(dim=dim))
+    return conn, Repo(conn), embedder
+
+def decisions(conn: sqlite3.Connection):
+    linked = set(conn.execute("SELECT source, market_id FROM event_aliases").fetchall())
+    queued = {r[0] for r in conn.execute("SELECT pair_key FROM event_candidates").fetchall()}
+    return linked, queued
+
+def matrix_bytes(repo, embedder, kind):
+    total = 0
+    for s in SOURCES:
+        m = load_source_matrix(repo, embedder, s).matrix
+        total += QuantizedMatrix.quantize(m, kind).nbytes if kind else m.nbytes
+    return total
+
+def _counter(name: str) -> float:
+    return sum(c["value"] for c in METRICS.snapshot()["counters"].get(name, []))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--markets", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--margin", type=float, action="append", help="Rescore margin(s) to try (default 0 and 0.01)")
+    parser.add_argument("--queries", type=int, default=200, help="UI rank queries")
+    parser.add_argument("--k", type=int, default=80)
+    args = parser.parse_args()
+    margins = args.margin or [0.0, 0.01]
+
+    base = os.path.join(tempfile.mkdtemp(prefix="market_sync_quant_"), "base.sqlite")
+    t0 = time.perf_counter()
+    build(base, args.markets, args.dim, args.seed)
+    print(json.dumps({"build_seconds": round(time.perf_counter() - t0, 2), "markets": args.markets, "dim": args.dim}))
+
+    METRICS.enable()
+    modes = [(None, 0.0)] + [(kind, m) for kind in ("int8", "float16") for m in margins]
+    reference = None
+    for kind, margin in modes:
+        conn, repo, embedder = open_copy(base, f"{kind or 'float32'}_{margin}", args.dim)
+        METRICS.reset()
+        t0 = time.perf_counter()
+        auto_links, queued = propose_and_link(repo, embedder, SOURCES, quantize=kind, rescore_margin=margin)
+        seconds = time.perf_counter() - t0
+        linked, pairs = decisions(conn)
+        if reference is None:
+            reference = (linked, pairs)
+        print(json.dumps({
+            "mode": kind or "float32", "margin": margin, "matrix_mb": round(matrix_bytes(repo, embedder, kind) / 2**20, 2),
+            "seconds": round(seconds, 3), "rescored": int(_counter("quant_rescored")), "auto_links": auto_links, "queued": queued,
+            "link_flips": len(linked ^ reference[0]), "queue_flips": len(pairs ^ reference[1]),
+        }))
+        conn.close()
+
+    conn, repo, embedder = open_copy(base, "rank", args.dim)
+    queries = load_source_matrix(repo, embedder, OTHER).matrix[: args.queries]
+    exact = MatrixCache()
+    for kind in ("int8", "float16"):
+        approx = MatrixCache(quantize=kind)
+        overlap = []
+        for q in queries:
+            want = {r[:2] for r in exact.rank(repo, embedder, q, ["polymarket"], args.k)}
+            got = {r[:2] for r in approx.rank(repo, embedder, q, ["polymarket"], args.k)}
+            overlap.append(len(want & got) / max(1, len(want)))
+        print(json.dumps({
+            "rank_mode": kind, "k": args.k, "queries": len(queries),
+            "matrix_mb": round(approx.candidates(repo, embedder, ["polymarket"]).matrix.nbytes / 2**20, 2),
+            "float32_mb": round(exact.candidates(repo, embedder, ["polymarket"]).matrix.nbytes / 2**20, 2),
+            "mean_topk_overlap": round(float(np.mean(overlap)), 4), "min_topk_overlap": round(float(np.min(overlap)), 4),
+        }))
+
+if __name__ == "__main__":
+    main()
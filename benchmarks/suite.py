@@ -0,0 +1,302 @@
+# benchmarks/suite.py
+"""Offline benchmark suite for the hot paths, at several market counts.
+
+Usage:
+    python benchmarks/suite.py run --tiers 1000 10000 100000 --out bench.json
+    python benchmarks/suite.py run --tiers 10000 --stages parse upsert_insert rank
+    python benchmarks/suite.py compare base.json bench.json --threshold 0.15
+
+``run`` generates Gamma-shaped payloads (``market_sync.fakes.synthetic_markets``) and
+embeds with ``BagOfWordsEmbeddingClient``, so nothing touches the network and results
+are deterministic for a seed. Each tier runs in its own process against a fresh
+SQLite file, so peak RSS is per tier and stage rather than cumulative. Stages:
+
+  parse / to_bet       Gamma payload pages -> BetBatch / List[Bet]
+  upsert_insert        Repo.upsert_bets into an empty table, per page
+  upsert_unchanged     the same pages again (the steady-state resync)
+  sync_stream          upsert + embed + lifecycle, per page, fake provider
+  cache_get_many       EmbeddingCache.get_many of 500 random hashes
+  cache_get            EmbeddingCache.get of one random hash
+  match_full           propose_and_link against a second source (tier / 10 markets)
+  match_incremental    match_incremental after 1% of titles changed
+  rank_cold            MatrixCache load of the candidate matrix
+  rank                 MatrixCache.rank for one query (the UI bottom pane)
+
+Every stage reports items, seconds, throughput (items/s), p50/p99 per operation in
+milliseconds and peak RSS in MB. ``compare`` matches rows by (tier, stage) and exits
+with status 1 when throughput drops, or p99 or RSS grow, by more than ``--threshold``.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+from typing import Callable, Iterator, List
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from market_sync.clients.polymarket import PolymarketClient
+from market_sync.db import open_db
+from market_sync.embeddings import EmbeddingCache, Embedder
+from market_sync.fakes import BagOfWordsEmbeddingClient, synthetic_markets
+from market_sync.match import match_incremental, propose_and_link
+from market_sync.models import Bet
+from market_sync.repo import Repo
+from market_sync.sync import sync_source, sync_stream
+from market_sync.vectors import MatrixCache, load_source_matrix
+
+STAGES = [
+    "parse", "to_bet", "upsert_insert", "upsert_unchanged", "sync_stream", "cache_get_many", "cache_get",
+    "match_full", "match_incremental", "rank_cold", "rank",
+]
+PAGE = 500
+OTHER = "othersrc"
+
+class PeakRss:
+    """Peak resident set size while the block runs, sampled from /proc (ru_maxrss elsewhere)."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._page = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def _current(self) -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self._page
+        except OSError:
+            scale = 1 if sys.platform == "darwin" else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._current())
+
+    def __enter__(self):
+        self.peak = self._current()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._current())
+
+def measure(stage: str, tier: int, items: int, ops: Callable[[], Iterator[None]]) -> dict:
+    """Run ``ops`` (a generator yielding after each operation) and summarize its per-op latencies."""
+    samples: List[float] = []
+    with PeakRss() as rss:
+        t0 = last = time.perf_counter()
+        for _ in ops():
+            now = time.perf_counter()
+            samples.append(now - last)
+            last = now
+        elapsed = time.perf_counter() - t0
+    ms = np.array(samples or [elapsed]) * 1000
+    return {
+        "tier": tier, "stage": stage, "items": items, "ops": len(samples), "seconds": round(elapsed, 4),
+        "throughput": round(items / elapsed, 1) if elapsed > 0 else None,
+        "p50_ms": round(float(np.percentile(ms, 50)), 3), "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "peak_rss_mb": round(rss.peak / 2**20, 1),
+    }
+
+def paraphrases(markets: List[dict], n: int, seed: int) -> List[Bet]:
+    """A second source: reworded copies of some markets (matches) mixed with unrelated ones."""
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        src = markets[rng.randrange(len(markets))]
+        title = src["question"]
+        if i % 3 == 0:
+            title = title.replace(" by ", " before ")
+        elif i % 3 == 1:
+            title = "Market " + str(i) + ": " + " ".join(reversed(title.rstrip("?").split())) + "?"
+        out.append(Bet(source=OTHER, market_id=str(i), slug=None, title=title, description=src["description"], url=None, close_time=None))
+    return out
+
+def run_tier(tier: int, stages: List[str], dim: int, seed: int, workdir: str) -> List[dict]:
+    markets = synthetic_markets(tier, seed=seed)
+    pages = [markets[i : i + PAGE] for i in range(0, tier, PAGE)]
+    batches = [PolymarketClient.to_batch(p) for p in pages]
+    conn = open_db(os.path.join(workdir, f"bench_{tier}.sqlite"))
+    repo = Repo(conn)
+    embedder = Embedder(model="bench", cache=EmbeddingCache(conn), client=BagOfWordsEmbeddingClient(dim=dim))
+    rng = np.random.default_rng(seed)
+    results = []
+
+    def want(stage: str) -> bool:
+        return stage in stages
+
+    def each(items, fn):
+        def ops():
+            for item in items:
+                fn(item)
+                yield
+        return ops
+
+    if want("parse"):
+        results.append(measure("parse", tier, tier, each(pages, PolymarketClient.to_batch)))
+    if want("to_bet"):
+        results.append(measure("to_bet", tier, tier, each(pages, lambda p: [PolymarketClient.to_bet(o) for o in p])))
+    if want("upsert_insert") or want("upsert_unchanged"):
+        # The unchanged pass needs the rows in place; unwanted rows are dropped on return
+        results.append(measure("upsert_insert", tier, tier, each(batches, repo.upsert_bets)))
+        if want("upsert_unchanged"):
+            results.append(measure("upsert_unchanged", tier, tier, each(batches, repo.upsert_bets)))
+    if want("sync_stream"):
+        results.append(measure("sync_stream", tier, tier, lambda: _paged_sync(batches, repo, embedder)))
+    else:
+        # Vectors for the later stages
+        sync_stream(iter(batches), repo, embedder, "polymarket")
+
+    hashes = [h for b in batches for h in b.text_hashes]
+    if want("cache_get_many"):
+        picks = [list(rng.choice(hashes, min(PAGE, len(hashes)))) for _ in range(min(200, max(1, tier // PAGE)))]
+        results.append(measure("cache_get_many", tier, sum(len(p) for p in picks), each(picks, lambda p: embedder.cache.get_many(p, embedder.model))))
+    if want("cache_get"):
+        picks = list(rng.choice(hashes, 2000))
+        results.append(measure("cache_get", tier, len(picks), each(picks, lambda h: embedder.cache.get(h, embedder.model))))
+
+    if any(want(s) for s in ("match_full", "match_incremental", "rank_cold", "rank")):
+        other = paraphrases(markets, max(100, tier // 10), seed)
+        sync_source(other, repo, embedder)
+    if want("match_full"):
+        results.append(measure("match_full", tier, tier, each([None], lambda _: propose_and_link(repo, embedder, ["polymarket", OTHER]))))
+    if want("match_incremental"):
+        changed = PolymarketClient.to_batch([dict(m, question=m["question"].replace("Will", "Could")) for m in markets[: max(1, tier // 100)]])
+        new_or_changed = [b for b, (is_new, is_changed) in zip(changed, repo.upsert_bets(changed)) if is_new or is_changed]
+        embedder.embed_hashed([b.text_hash for b in new_or_changed], [b.text_for_embedding for b in new_or_changed])
+        results.append(measure(
+            "match_incremental", tier, len(new_or_changed),
+            each([None], lambda _: match_incremental(repo, embedder, new_or_changed, ["polymarket", OTHER])),
+        ))
+    if want("rank_cold") or want("rank"):
+        cache = MatrixCache()
+        candidates = ["polymarket", OTHER]
+        results.append(measure("rank_cold", tier, tier, each([None], lambda _: cache.candidates(repo, embedder, candidates))))
+        if want("rank"):
+            queries = load_source_matrix(repo, embedder, OTHER).matrix[:200]
+            results.append(measure("rank", tier, len(queries), each(list(queries), lambda q: cache.rank(repo, embedder, q, candidates, 80, 0.5))))
+    conn.close()
+    return [r for r in results if r["stage"] in stages]
+
+def _paged_sync(batches, repo, embedder) -> Iterator[None]:
+    """Run sync_stream in a thread and yield once per page it pulls (plus once for the lifecycle tail).
+
+    With ``queue_size=1`` a page is only pulled once the previous one was taken off
+    the queue, so the gaps approximate per-page processing time.
+    """
+    handed = threading.Semaphore(0)
+    failure: List[BaseException] = []
+
+    def pages():
+        for b in batches:
+            yield b
+            handed.release()
+
+    def run():
+        try:
+            sync_stream(pages(), repo, embedder, "polymarket", queue_size=1)
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            handed.release()
+
+    worker = threading.Thread(target=run, name="bench-sync")
+    worker.start()
+    for _ in range(len(batches) + 1):
+        handed.acquire()
+        if failure:
+            break
+        yield
+    worker.join()
+    if failure:
+        raise failure[0]
+
+def meta(args) -> dict:
+    return {
+        "python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+        "cpus": os.cpu_count(), "dim": args.dim, "seed": args.seed, "created_at": int(time.time()),
+    }
+
+def cmd_run(args) -> int:
+    stages = args.stages or STAGES
+    if args.in_process or len(args.tiers) == 1:
+        workdir = args.workdir or tempfile.mkdtemp(prefix="market_sync_bench_")
+        results = [r for tier in args.tiers for r in run_tier(tier, stages, args.dim, args.seed, workdir)]
+    else:
+        results = []
+        for tier in args.tiers:
+            cmd = [sys.executable, os.path.abspath(__file__), "run", "--tiers", str(tier), "--dim", str(args.dim), "--seed", str(args.seed), "--stages", *stages]
+            if args.workdir:
+                cmd += ["--workdir", args.workdir]
+            out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True).stdout
+            results.extend(json.loads(out)["results"])
+    report = {"meta": meta(args), "results": results}
+    text = json.dumps(report, indent=1)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    print(text)
+    return 0
+
+def cmd_compare(args) -> int:
+    with open(args.base) as f:
+        base = {(r["tier"], r["stage"]): r for r in json.load(f)["results"]}
+    with open(args.new) as f:
+        new = json.load(f)["results"]
+    regressions = 0
+    for r in new:
+        b = base.get((r["tier"], r["stage"]))
+        if b is None:
+            continue
+        flags = []
+        # (metric, higher_is_better, minimum absolute change worth flagging)
+        for metric, higher_better, floor in (("throughput", True, 0.0), ("p99_ms", False, args.min_ms), ("peak_rss_mb", False, args.min_mb)):
+            old, cur = b.get(metric), r.get(metric)
+            if not old or cur is None:
+                continue
+            change = (cur - old) / old
+            worse = -change if higher_better else change
+            if worse > args.threshold and abs(cur - old) > floor:
+                flags.append(f"{metric} {old} -> {cur} ({change:+.0%})")
+        regressions += bool(flags)
+        print(json.dumps({
+            "tier": r["tier"], "stage": r["stage"], "status": "regression" if flags else "ok",
+            "throughput_change": round((r["throughput"] - b["throughput"]) / b["throughput"], 3) if b.get("throughput") and r.get("throughput") else None,
+            "flags": flags,
+        }))
+    print(json.dumps({"compared": sum((r["tier"], r["stage"]) in base for r in new), "regressions": regressions}))
+    return 1 if regressions else 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    run = sub.add_parser("run")
+    run.add_argument("--tiers", type=int, nargs="+", default=[1000, 10000, 100000])
+    run.add_argument("--stages", nargs="+", choices=STAGES)
+    run.add_argument("--dim", type=int, default=256, help="Fake embedding size (1024 matches voyage-3.5)")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--workdir", default="", help="Directory for the benchmark DBs (default: temporary)")
+    run.add_argument("--out", default="", help="Also write the JSON report here")
+    run.add_argument("--in-process", action="store_true", help="Run all tiers in this process")
+    cmp_ = sub.add_parser("compare")
+    cmp_.add_argument("base")
+    cmp_.add_argument("new")
+    cmp_.add_argument("--threshold", type=float, default=0.15, help="Relative change counted as a regression")
+    cmp_.add_argument("--min-ms", type=float, default=0.5, help="Ignore p99 changes smaller than this")
+    cmp_.add_argument("--min-mb", type=float, default=16.0, help="Ignore RSS changes smaller than this")
+    args = parser.parse_args()
+    return cmd_run(args) if args.cmd == "run" else cmd_compare(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
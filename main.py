@@ -2,12 +2,15 @@
 import os
 import argparse
 from dotenv import load_dotenv
-from market_sync.config import DB_PATH, VOYAGE_MODEL
+from market_sync.config import DB_PATH, VOYAGE_MODEL, EMBED_CONCURRENCY, EMBED_RPM, EMBED_TPM
 from market_sync.db import open_db
 from market_sync.embeddings import EmbeddingCache, Embedder
 from market_sync.repo import Repo
 from market_sync.clients.polymarket import PolymarketClient
-from market_sync.sync import sync_source
+from market_sync.sync import sync_source, sync_with_delta
+from market_sync.ann import AnnStore
+from market_sync.neighbors import NeighborTable
+from market_sync.metrics import export_run, start_server
 # from market_sync.match import propose_and_link  # optional
 
 def main():
@@ -17,6 +20,9 @@ def main():
     parser.add_argument("--ui", action="store_true", help="Launch the live UI")
     parser.add_argument("--progress", action="store_true", help="Show tqdm progress during sync")
     parser.add_argument("--no-backfill", action="store_true", help="Do not resume missing embeddings")
+    parser.add_argument("--batch", action="store_true", help="Fetch every page before syncing instead of streaming")
+    parser.add_argument("--full", action="store_true", help="Force a full reconciliation pass instead of a delta sync")
+    parser.add_argument("--migrate-embeddings", action="store_true", help="Convert legacy JSON embeddings to binary float32 and exit")
     args = parser.parse_args()
 
     if args.ui:
@@ -31,11 +37,31 @@ def main():
 
     conn = open_db(DB_PATH)
     cache = EmbeddingCache(conn)
+    if args.migrate_embeddings:
+        print(f"Migrated {cache.migrate_to_binary()} embeddings to binary")
+        return
+    start_server()
     repo = Repo(conn)
-    embedder = Embedder(model=VOYAGE_MODEL, cache=cache, api_key=os.getenv("VOYAGE_API_KEY"))
-    bets = PolymarketClient().fetch_bets(10000)
-    print(f"Fetched {len(bets)} bets from Polymarket")
-    sync_source(bets, repo, embedder, show_progress=args.progress, backfill_missing=not args.no_backfill)
+    embedder = Embedder(
+        model=VOYAGE_MODEL, cache=cache, api_key=os.getenv("VOYAGE_API_KEY"),
+        max_concurrency=EMBED_CONCURRENCY, rpm=EMBED_RPM, tpm=EMBED_TPM,
+    )
+    client = PolymarketClient()
+    if args.batch:
+        bets = client.fetch_bets(10000)
+        print(f"Fetched {len(bets)} bets from Polymarket")
+        sync_source(
+            bets, repo, embedder, show_progress=args.progress, backfill_missing=not args.no_backfill,
+            ann=AnnStore(), neighbors=NeighborTable(),
+        )
+    else:
+        _, seen, _ = sync_with_delta(
+            client, repo, embedder, "polymarket", limit=10000, force_full=args.full, show_progress=args.progress,
+            ann=AnnStore(), neighbors=NeighborTable(), backfill_missing=not args.no_backfill,
+        )
+        print(f"Synced {seen} bets from Polymarket")
+    print(f"Embedding: {embedder.stats}")
+    export_run()
     # auto_links, queued = propose_and_link(repo, embedder, ["polymarket"])
     # print({"linked": auto_links, "queued": queued})
 
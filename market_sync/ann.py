@@ -0,0 +1,315 @@
+# market_sync/ann.py
+import os
+import re
+import time
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from .config import ANN_DIR
+from .metrics import METRICS
+from .models import Bet, has_embedding_text
+from .vectors import load_source_matrix, matrix_for_bets, normalize_rows
+
+logger = logging.getLogger(__name__)
+
+# Training runs on a sample; every vector is still assigned to its nearest list.
+KMEANS_SAMPLE = 20000
+KMEANS_ITERS = 12
+
+def _spherical_kmeans(x: np.ndarray, nlist: int, iters: int = KMEANS_ITERS, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    if x.shape[0] > KMEANS_SAMPLE:
+        x = x[rng.choice(x.shape[0], KMEANS_SAMPLE, replace=False)]
+    centroids = x[rng.choice(x.shape[0], nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = _nearest(x, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = x[rng.choice(x.shape[0], int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+def _nearest(x: np.ndarray, centroids: np.ndarray, block: int = 8192) -> np.ndarray:
+    out = np.empty(x.shape[0], dtype=np.int32)
+    for start in range(0, x.shape[0], block):
+        out[start : start + block] = np.argmax(x[start : start + block] @ centroids.T, axis=1)
+    return out
+
+class IVFIndex:
+    """Inverted-file index over L2-normalized float32 vectors, scored by inner product.
+
+    Rows are never moved on removal, only tombstoned; ``compact`` drops them and
+    the index retrains once it has grown to twice its trained size.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.centroids = np.zeros((0, dim), dtype=np.float32)
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=str)
+        self.hashes = np.zeros(0, dtype=str)
+        self.assign = np.zeros(0, dtype=np.int32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.trained_size = 0
+        self._row_of: Dict[str, int] = {}
+        self._lists: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return int(self.alive.sum())
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    @staticmethod
+    def default_nlist(n: int) -> int:
+        return int(min(4096, max(1, round(np.sqrt(n)))))
+
+    @classmethod
+    def build(cls, ids: Sequence[str], hashes: Sequence[str], vectors: np.ndarray, nlist: Optional[int] = None) -> "IVFIndex":
+        index = cls(vectors.shape[1] if vectors.ndim == 2 else 0)
+        index._reset(np.asarray(ids, dtype=str), np.asarray(hashes, dtype=str), np.ascontiguousarray(vectors, dtype=np.float32), nlist)
+        return index
+
+    def _reset(self, ids: np.ndarray, hashes: np.ndarray, vectors: np.ndarray, nlist: Optional[int] = None):
+        n = vectors.shape[0]
+        self.vectors = vectors
+        self.ids = ids
+        self.hashes = hashes
+        self.alive = np.ones(n, dtype=bool)
+        if n:
+            self.centroids = _spherical_kmeans(vectors, min(n, nlist or self.default_nlist(n)))
+            self.assign = _nearest(vectors, self.centroids)
+        else:
+            self.centroids = np.zeros((0, self.dim), dtype=np.float32)
+            self.assign = np.zeros(0, dtype=np.int32)
+        self.trained_size = n
+        self._row_of = {mid: i for i, mid in enumerate(ids.tolist())}
+        self._lists = None
+        logger.debug("IVF trained: n=%d nlist=%d", n, self.nlist)
+
+    def add(self, ids: Sequence[str], hashes: Sequence[str], vectors: np.ndarray):
+        """Insert or replace vectors by id; ``vectors`` must already be normalized."""
+        if not len(ids):
+            return
+        self.remove(ids)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        start = self.vectors.shape[0]
+        if not start:
+            self.dim = vectors.shape[1]
+        self.vectors = np.concatenate([self.vectors, vectors]) if start else vectors
+        self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=str)])
+        self.hashes = np.concatenate([self.hashes, np.asarray(hashes, dtype=str)])
+        self.alive = np.concatenate([self.alive, np.ones(len(ids), dtype=bool)])
+        for offset, mid in enumerate(ids):
+            self._row_of[mid] = start + offset
+        if self.nlist == 0 or len(self) > 2 * max(self.trained_size, 1):
+            self.compact(retrain=True)
+            return
+        self.assign = np.concatenate([self.assign, _nearest(vectors, self.centroids)])
+        self._lists = None
+
+    def remove(self, ids: Iterable[str]) -> int:
+        removed = 0
+        for mid in ids:
+            row = self._row_of.pop(mid, None)
+            if row is not None:
+                self.alive[row] = False
+                removed += 1
+        if removed and (self.alive.size - len(self)) > 0.3 * self.alive.size:
+            self.compact()
+        return removed
+
+    def compact(self, retrain: bool = False):
+        keep = self.alive
+        if retrain:
+            self._reset(self.ids[keep], self.hashes[keep], np.ascontiguousarray(self.vectors[keep]))
+            return
+        self.vectors = np.ascontiguousarray(self.vectors[keep])
+        self.ids = self.ids[keep]
+        self.hashes = self.hashes[keep]
+        self.assign = self.assign[keep]
+        self.alive = np.ones(self.ids.shape[0], dtype=bool)
+        self._row_of = {mid: i for i, mid in enumerate(self.ids.tolist())}
+        self._lists = None
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._lists is None:
+            order = np.argsort(self.assign, kind="stable")
+            bounds = np.searchsorted(self.assign[order], np.arange(self.nlist + 1))
+            self._lists = (order, bounds)
+        return self._lists
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        nprobe: int = 8,
+        min_score: float = -1.0,
+        allowed: Optional[np.ndarray] = None,
+    ) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+        """Yield ``(query_row, index_rows, scores)`` best first, like ``vectors.topk_blocked``.
+
+        ``allowed`` is an optional boolean mask over index rows, combined with the tombstones.
+        """
+        if self.nlist == 0 or k <= 0 or queries.shape[0] == 0:
+            return
+        mask = self.alive if allowed is None else (self.alive & allowed)
+        order, bounds = self._inverted_lists()
+        nprobe = min(nprobe, self.nlist)
+        coarse = queries @ self.centroids.T
+        if nprobe < self.nlist:
+            probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.broadcast_to(np.arange(self.nlist), coarse.shape)
+        scanned = 0
+        for qi in range(queries.shape[0]):
+            rows = np.concatenate([order[bounds[c] : bounds[c + 1]] for c in probes[qi]])
+            rows = rows[mask[rows]]
+            if rows.size == 0:
+                continue
+            scanned += rows.size
+            scores = self.vectors[rows] @ queries[qi]
+            if rows.size > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                rows, scores = rows[top], scores[top]
+            best = np.argsort(-scores, kind="stable")
+            rows, scores = rows[best], scores[best]
+            keep = scores >= min_score
+            if keep.any():
+                yield qi, rows[keep], scores[keep]
+        METRICS.inc("pairs_scored", scanned)
+
+    def save(self, path: str):
+        tmp = path + ".tmp.npz"
+        np.savez(
+            tmp,
+            centroids=self.centroids, vectors=self.vectors, ids=self.ids, hashes=self.hashes,
+            assign=self.assign, alive=self.alive, trained_size=np.int64(self.trained_size),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(data["vectors"].shape[1])
+            index.centroids = data["centroids"]
+            index.vectors = data["vectors"]
+            index.ids = data["ids"]
+            index.hashes = data["hashes"]
+            index.assign = data["assign"]
+            index.alive = data["alive"]
+            index.trained_size = int(data["trained_size"])
+        index._row_of = {mid: i for i, mid in enumerate(index.ids.tolist()) if index.alive[i]}
+        return index
+
+class AnnStore:
+    """Per ``(model, source)`` IVF indexes persisted as ``.npz`` files next to the SQLite DB."""
+
+    def __init__(self, directory: str = ANN_DIR, nprobe: int = 8):
+        self.directory = directory
+        self.nprobe = nprobe
+        self._indexes: Dict[Tuple[str, str], IVFIndex] = {}
+
+    def path(self, model: str, source: str) -> str:
+        name = re.sub(r"[^A-Za-z0-9._-]", "_", f"{model}__{source}")
+        return os.path.join(self.directory, name + ".npz")
+
+    def get(self, model: str, source: str) -> Optional[IVFIndex]:
+        key = (model, source)
+        if key not in self._indexes:
+            path = self.path(model, source)
+            if not os.path.exists(path):
+                return None
+            self._indexes[key] = IVFIndex.load(path)
+            logger.debug("Loaded ANN index %s (%d vectors)", path, len(self._indexes[key]))
+        return self._indexes[key]
+
+    def save(self, model: str, source: str, index: IVFIndex):
+        os.makedirs(self.directory, exist_ok=True)
+        index.save(self.path(model, source))
+        self._indexes[(model, source)] = index
+
+    def rebuild(self, repo, embedder, source: str) -> IVFIndex:
+        m = load_source_matrix(repo, embedder, source)
+        index = IVFIndex.build(m.market_ids, m.hashes, m.matrix)
+        logger.info("Built ANN index for model=%s source=%s: n=%d nlist=%d", embedder.model, source, len(index), index.nlist)
+        self.save(embedder.model, source, index)
+        return index
+
+    def ensure(self, repo, embedder, source: str) -> IVFIndex:
+        return self.get(embedder.model, source) or self.rebuild(repo, embedder, source)
+
+    def apply_sync(self, repo, embedder, source: str, upserted: List, removed_ids: Iterable[str]):
+        """Fold one ``sync_source`` run into the source's index (building it if absent).
+
+        The index is then reconciled with the source's active ``(market_id, text_hash)``
+        rows, so bets that reached the DB without passing through here (embedded by a
+        backfill after an interrupted run, for example) are added and stale rows dropped.
+        """
+        index = self.get(embedder.model, source)
+        if index is None:
+            self.rebuild(repo, embedder, source)
+            return
+        removed = index.remove(removed_ids)
+        upserted = [b for b in upserted if has_embedding_text(b.title, b.description)]
+        if upserted:
+            m = matrix_for_bets(embedder, source, upserted)
+            index.add(m.market_ids, m.hashes, m.matrix)
+        drifted, stale = self._reconcile(repo, embedder, source, index)
+        logger.info(
+            "ANN index updated for source=%s: added=%d removed=%d reconciled=%d/%d size=%d",
+            source, len(upserted), removed, drifted, stale, len(index),
+        )
+        self.save(embedder.model, source, index)
+
+    @staticmethod
+    def _reconcile(repo, embedder, source: str, index: IVFIndex) -> Tuple[int, int]:
+        # One two-column scan of the active set; only the differences are loaded and embedded
+        active = repo.fetch_active_hashes(source)
+        live = np.flatnonzero(index.alive)
+        indexed = dict(zip(index.ids[live].tolist(), index.hashes[live].tolist()))
+        stale = [mid for mid in indexed if mid not in active]
+        if stale:
+            index.remove(stale)
+        drifted = [mid for mid, h in active.items() if indexed.get(mid) != h]
+        if drifted:
+            bets = [
+                Bet(source=source, market_id=mid, slug=None, title=title or "", description=desc, url=None, close_time=None)
+                for _, mid, _, title, desc, _, _ in repo.fetch_bets_by_ids(source, drifted)
+            ]
+            m = matrix_for_bets(embedder, source, bets)
+            index.add(m.market_ids, m.hashes, m.matrix)
+        return len(drifted), len(stale)
+
+def recall_report(index: IVFIndex, queries: np.ndarray, k: int = 10, nprobes: Sequence[int] = (1, 2, 4, 8, 16, 32)) -> List[dict]:
+    """Recall@k and mean per-query latency of ``index`` against exact brute force, per nprobe."""
+    queries = normalize_rows(np.array(queries, dtype=np.float32))
+    live = np.flatnonzero(index.alive)
+    t0 = time.perf_counter()
+    exact = []
+    for q in queries:
+        scores = index.vectors[live] @ q
+        top = np.argpartition(-scores, min(k, live.size) - 1)[:k]
+        exact.append(set(live[top].tolist()))
+    brute_ms = (time.perf_counter() - t0) * 1000 / max(len(queries), 1)
+    report = []
+    for nprobe in nprobes:
+        if nprobe > index.nlist:
+            break
+        t0 = time.perf_counter()
+        found = {qi: set(rows.tolist()) for qi, rows, _ in index.search(queries, k, nprobe=nprobe)}
+        elapsed_ms = (time.perf_counter() - t0) * 1000 / max(len(queries), 1)
+        hits = sum(len(found.get(qi, set()) & truth) for qi, truth in enumerate(exact))
+        report.append({
+            "nprobe": nprobe,
+            "nlist": index.nlist,
+            "k": k,
+            "recall": hits / max(sum(len(t) for t in exact), 1),
+            "ms_per_query": round(elapsed_ms, 4),
+            "brute_ms_per_query": round(brute_ms, 4),
+        })
+    return report
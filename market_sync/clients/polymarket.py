@@ -1,22 +1,76 @@
 # market_sync/clients/polymarket.py
-from typing import List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+from dataclasses import dataclass, field
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+import json
+import time
+import logging
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from ..config import GAMMA_BASE, USER_AGENT
-from ..models import Bet
+from ..config import EMBED_MAX_TEXT_TOKENS, GAMMA_BASE, GAMMA_CONCURRENCY, HTTP_CACHE_DIR, HTTP_CACHE_MODE, USER_AGENT
+from ..httpcache import CachingAdapter, content_hash
+from ..metrics import METRICS, timed
+from ..models import Bet, BetBatch
 from ..util import iso_parse
 
+logger = logging.getLogger(__name__)
+
+@dataclass
+class _Page:
+    items: list
+    next_cursor: Optional[str]
+    # Parsed page and its row per market id, filled lazily and reused while the page is unchanged
+    batch: Optional[BetBatch] = None
+    rows: Dict[str, int] = field(default_factory=dict)
+    # Request URL and body hash, set with an HTTP cache to find the parsed copy on disk
+    url: Optional[str] = None
+    digest: Optional[str] = None
+
 class PolymarketClient:
-    def __init__(self, base: str = GAMMA_BASE, session: Optional[requests.Session] = None, verify: bool | str = True):
+    """Gamma API client.
+
+    With ``concurrency > 1`` pages are requested by ``offset`` from a bounded worker
+    pool sharing one session whose connection pool has the same size; results are
+    still yielded in offset order.
+
+    With ``cache_dir`` the session goes through ``httpcache.CachingAdapter`` (see
+    ``cache_mode``), and pages whose body hash matches one from the current or
+    previous walk are reused as already-decoded, already-parsed objects. Parsed
+    columns are also kept under ``cache_dir/parsed``, one file per URL, so a new
+    client (every ``main.py`` run) skips parsing a page whose body is unchanged.
+    """
+
+    def __init__(
+        self,
+        base: str = GAMMA_BASE,
+        session: Optional[requests.Session] = None,
+        verify: bool | str = True,
+        concurrency: int = GAMMA_CONCURRENCY,
+        cache_dir: Optional[str] = HTTP_CACHE_DIR,
+        cache_mode: str = HTTP_CACHE_MODE,
+    ):
         self.base = base.rstrip("/")
-        self.sess = session or self._build_session()
+        self.concurrency = max(1, int(concurrency))
+        self.cache_dir = cache_dir
+        self.cache_mode = cache_mode
+        self.sess = session or self._build_session(self.concurrency)
         self.verify = verify
+        self._pages: Dict[str, _Page] = {}
+        self._prev_pages: Dict[str, _Page] = {}
+        # Latest ``updatedAt`` seen by the last walk, for delta sync
+        self.high_water: Optional[str] = None
 
-    def _build_session(self) -> requests.Session:
+    def _build_session(self, pool_size: int = 1) -> requests.Session:
         s = requests.Session()
         retry = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=frozenset(["GET"]))
-        adapter = HTTPAdapter(max_retries=retry)
+        pool = dict(pool_connections=max(pool_size, 10), pool_maxsize=max(pool_size, 10))
+        if self.cache_dir:
+            adapter = CachingAdapter(self.cache_dir, self.cache_mode, max_retries=retry, **pool)
+        else:
+            adapter = HTTPAdapter(max_retries=retry, **pool)
         s.mount("https://", adapter)
         s.mount("http://", adapter)
         s.headers.update({"User-Agent": USER_AGENT})
@@ -45,60 +99,286 @@ class PolymarketClient:
                     break
         return items, next_cursor
 
-    def fetch_open_markets(self, limit: int = 1000, sort_by_volume: bool = True) -> List[dict]:
-        results: List[dict] = []
-        cursor = None
-        while len(results) < limit:
-            params = {
-                "limit": min(1000, max(1, limit - len(results))),
-                # you can keep "state": "open" if it's working for you,
-                # or switch to the explicit flags below:
-                "active": "true"#,
-                #"closed": "false",
-                #"archived": "false",
-            }
-            if sort_by_volume:
-                params.update({"order": "volume", "ascending": "false"})  # highest volume first
+    @staticmethod
+    def _is_open(m: dict) -> bool:
+        # Belt-and-suspenders: the query asks for active markets, re-check client-side
+        return str(m.get("active")).lower() == "true" and str(m.get("closed")).lower() != "true"
 
-            if cursor:
-                params["cursor"] = cursor
+    def _market_params(self, page_size: int, order: Optional[str] = "volume") -> dict:
+        params = {
+            "limit": page_size,
+            # you can keep "state": "open" if it's working for you,
+            # or switch to the explicit flags below:
+            "active": "true"#,
+            #"closed": "false",
+            #"archived": "false",
+        }
+        if order:
+            params.update({"order": order, "ascending": "false"})  # highest volume / most recent first
+        return params
 
+    def _get_page(self, params: dict) -> _Page:
+        with METRICS.timer("page_fetch"):
+            t0 = time.perf_counter()
             r = self.sess.get(f"{self.base}/markets", params=params, timeout=30, verify=self.verify)
+            METRICS.observe("http_latency_seconds", time.perf_counter() - t0)
             r.raise_for_status()
-            payload = r.json()
-            items, next_cursor = self._extract_items_and_cursor(payload)
+        if not self.cache_dir:
+            with METRICS.timer("parse"):
+                return _Page(*self._extract_items_and_cursor(r.json()))
+        digest = getattr(r, "content_hash", None) or content_hash(r.content)
+        page = self._pages.get(digest) or self._prev_pages.get(digest)
+        if page is None:
+            with METRICS.timer("parse"):
+                page = _Page(*self._extract_items_and_cursor(r.json()), url=r.url, digest=digest)
+        self._pages[digest] = page
+        return page
+
+    def _parsed_path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, "parsed", content_hash(url.encode("utf-8")) + ".json")
+
+    def _page_batch(self, page: _Page) -> BetBatch:
+        """``to_batch`` of the page's items, read from ``cache_dir/parsed`` when the body is unchanged."""
+        if page.url is None:
+            return self.to_batch(page.items)
+        path = self._parsed_path(page.url)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        # Text hashes depend on the truncation limit, so a changed limit reparses
+        if entry and entry.get("content_hash") == page.digest and entry.get("max_text_tokens") == EMBED_MAX_TEXT_TOKENS:
+            METRICS.inc("parsed_pages_reused")
+            *columns, text_hashes = entry["columns"]
+            return BetBatch("polymarket", *columns, text_hashes=text_hashes)
+        batch = self.to_batch(page.items)
+        columns = [batch.market_ids, batch.slugs, batch.titles, batch.descriptions, batch.urls, batch.close_times, batch.text_hashes]
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"content_hash": page.digest, "max_text_tokens": EMBED_MAX_TEXT_TOKENS, "columns": columns}, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("Could not store parsed page for %s: %s", page.url, e)
+        return batch
+
+    def iter_open_market_pages(self, limit: int = 1000, sort_by_volume: bool = True, page_size: int = 1000) -> Iterator[List[dict]]:
+        """Yield open markets page by page, stopping once ``limit`` items were yielded.
+
+        Markets are deduplicated by id across pages, since offsets and cursors can
+        shift while the listing changes underneath a multi-page pull.
+        """
+        for _, items in self._iter_filtered_pages(limit, "volume" if sort_by_volume else None, page_size):
+            yield items
 
-            # (Optional) belt-and-suspenders: filter to open client-side too
-            items = [m for m in items if str(m.get("active")).lower() == "true" and str(m.get("closed")).lower() != "true"]
+    def _iter_filtered_pages(self, limit: int, order: Optional[str], page_size: int) -> Iterator[Tuple[_Page, List[dict]]]:
+        # Pages reused from the walk before last are dropped
+        self._prev_pages, self._pages = self._pages, {}
+        self.high_water = None
+        seen_ids: Set[str] = set()
+        yielded = 0
+        pages = self._offset_pages if self.concurrency > 1 else self._cursor_pages
+        for page in pages(lambda: limit - yielded, order, page_size):
+            items = []
+            fresh = 0
+            for m in page.items:
+                mid = str(m.get("id"))
+                if mid in seen_ids:
+                    continue
+                seen_ids.add(mid)
+                fresh += 1
+                updated = self.updated_at(m)
+                if updated and (self.high_water is None or updated > self.high_water):
+                    self.high_water = updated
+                if self._is_open(m):
+                    items.append(m)
+            if not fresh:
+                # A page of nothing but repeats: the endpoint is not honoring offset/cursor
+                logger.warning("Gamma returned a page of already-seen markets; stopping after %d", yielded)
+                return
+            items = items[: limit - yielded]
+            if items:
+                yielded += len(items)
+                yield page, items
+            if yielded >= limit:
+                return
 
-            if not items:
-                break
-            results.extend(items)
-            if not next_cursor:
-                break
-            cursor = next_cursor
+    def _cursor_pages(self, remaining: Callable[[], int], order: Optional[str], page_size: int) -> Iterator[_Page]:
+        # Follows the cursor while the server returns one. Gamma's /markets returns a
+        # plain list, so without a cursor a full page moves on by offset, and only a
+        # short or empty page ends the listing. As in ``_offset_pages``, a short first
+        # page is taken as the server's cap on ``limit`` rather than the end.
+        cursor = None
+        offset = 0
+        first = True
+        while True:
+            size = min(page_size, max(1, remaining()))
+            params = self._market_params(size, order)
+            if cursor:
+                params["cursor"] = cursor
+            elif offset:
+                params["offset"] = offset
+            page = self._get_page(params)
+            if not page.items:
+                return
+            yield page
+            if page.next_cursor:
+                cursor = page.next_cursor
+                continue
+            if cursor:
+                return
+            if len(page.items) < size:
+                if not first:
+                    return
+                logger.debug("Gamma returned %d of %d rows; using that as the page size", len(page.items), size)
+                page_size = len(page.items)
+            first = False
+            offset += len(page.items)
 
-        return results[:limit]
+    def _offset_pages(self, remaining: Callable[[], int], order: Optional[str], page_size: int) -> Iterator[_Page]:
+        # Keep up to ``concurrency`` offsets in flight and yield in order. The
+        # client-side filter may drop rows, so requests continue until ``remaining``
+        # hits zero or a short page marks the end of the listing. The first page is
+        # fetched alone: when the server caps ``limit`` below ``page_size`` it comes
+        # back short, and its length becomes the offset step (an empty page then ends it).
+        page_size = min(page_size, max(1, remaining()))
+        first = self._get_page(dict(self._market_params(page_size, order), offset=0))
+        if not first.items:
+            return
+        if len(first.items) < page_size:
+            logger.debug("Gamma returned %d of %d rows; using that as the page size", len(first.items), page_size)
+            page_size = len(first.items)
+        yield first
+        next_offset = page_size
+        window = deque()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="gamma") as pool:
+            def submit():
+                nonlocal next_offset
+                params = self._market_params(page_size, order)
+                params["offset"] = next_offset
+                window.append(pool.submit(self._get_page, params))
+                next_offset += page_size
+
+            while remaining() > 0 and len(window) < min(self.concurrency, -(-remaining() // page_size)):
+                submit()
+            try:
+                while window:
+                    page = window.popleft().result()
+                    if len(page.items) < page_size:
+                        if page.items:
+                            yield page
+                        return
+                    yield page
+                    # Top up only while the pages in flight cannot already cover what is left
+                    if remaining() > len(window) * page_size:
+                        submit()
+            finally:
+                for fut in window:
+                    fut.cancel()
+                logger.debug("Gamma offset fetch stopped at offset=%d", next_offset)
+
+    def fetch_open_markets(self, limit: int = 1000, sort_by_volume: bool = True) -> List[dict]:
+        results: List[dict] = []
+        for page in self.iter_open_market_pages(limit=limit, sort_by_volume=sort_by_volume):
+            results.extend(page)
+        return results
 
     @staticmethod
-    def to_bet(obj: dict) -> Bet:
+    def updated_at(obj: dict) -> Optional[str]:
+        raw = obj.get("updatedAt") or obj.get("updated_at") or obj.get("lastUpdated")
+        return iso_parse(raw) if raw else None
+
+    @staticmethod
+    def _fields(obj: dict) -> Tuple[str, Optional[str], str, str, Optional[str], Optional[str]]:
         title = obj.get("question") or obj.get("title") or ""
         desc = obj.get("description") or obj.get("criteria") or obj.get("rules") or ""
         slug = obj.get("slug")
         url = f"https://polymarket.com/market/{slug}" if slug else None
         ct_raw = obj.get("closeTime") or obj.get("endDate") or obj.get("end_time")
-        close_time = iso_parse(ct_raw)
+        return str(obj.get("id")), slug, title, desc, url, iso_parse(ct_raw)
+
+    @classmethod
+    def to_bet(cls, obj: dict, keep_raw: bool = True) -> Bet:
+        market_id, slug, title, desc, url, close_time = cls._fields(obj)
         return Bet(
             source="polymarket",
-            market_id=str(obj.get("id")),
+            market_id=market_id,
             slug=slug,
             title=title,
             description=desc,
             url=url,
             close_time=close_time,
-            raw=obj,
+            raw=obj if keep_raw else {},
         )
 
+    @classmethod
+    @timed("parse")
+    def to_batch(cls, objs: List[dict], keep_raw: bool = False) -> BetBatch:
+        columns = list(zip(*(cls._fields(o) for o in objs))) or [[]] * 6
+        return BetBatch("polymarket", *(list(c) for c in columns), raws=list(objs) if keep_raw else None)
+
     def fetch_bets(self, limit: int) -> List[Bet]:
         rows = self.fetch_open_markets(limit=limit)
-        return [self.to_bet(r) for r in rows]
\ No newline at end of file
+        with METRICS.timer("parse"):
+            return [self.to_bet(r) for r in rows]
+
+    def iter_bets(self, limit: int, keep_raw: bool = False, page_size: int = 1000) -> Iterator[BetBatch]:
+        """Stream parsed pages as ``BetBatch``; raw payloads are dropped unless ``keep_raw``."""
+        for page, items in self._iter_filtered_pages(limit, "volume", page_size):
+            if keep_raw or not self.cache_dir:
+                yield self.to_batch(items, keep_raw=keep_raw)
+                continue
+            if page.batch is None:
+                page.batch = self._page_batch(page)
+                page.rows = {mid: i for i, mid in enumerate(page.batch.market_ids)}
+            yield page.batch.take([page.rows[str(m.get("id"))] for m in items])
+
+    def iter_updated_bets(self, since: str, limit: int = 10000, page_size: int = 500) -> Iterator[Tuple[BetBatch, List[str]]]:
+        """Yield ``(open_bets, closed_ids)`` per page for markets updated after ``since``.
+
+        Pages are requested newest ``updatedAt`` first and the walk stops at the first
+        market at or before ``since``. Closed markets are reported rather than
+        filtered out, so the caller can deactivate them without a full pass.
+        ``high_water`` ends at the newest ``updatedAt`` seen once the walk got back
+        to ``since`` or the listing ran out (a short page); a walk cut off by ``limit``
+        leaves it at ``since``, because the updates between ``since`` and the cut-off
+        were not seen.
+        """
+        self.high_water = since
+        newest = since
+        seen_ids: Set[str] = set()
+        taken = 0
+        for page in self._cursor_pages(lambda: limit - taken, "updatedAt", page_size):
+            open_items: List[dict] = []
+            closed_ids: List[str] = []
+            reached = False
+            for m in page.items:
+                updated = self.updated_at(m)
+                if updated is None:
+                    continue
+                if updated <= since:
+                    reached = True
+                    continue
+                mid = str(m.get("id"))
+                if mid in seen_ids:
+                    continue
+                seen_ids.add(mid)
+                if updated > newest:
+                    newest = updated
+                if self._is_open(m):
+                    open_items.append(m)
+                else:
+                    closed_ids.append(mid)
+            taken += len(open_items) + len(closed_ids)
+            if open_items or closed_ids:
+                yield self.to_batch(open_items), closed_ids
+            if reached:
+                self.high_water = newest
+                return
+            if taken >= limit:
+                logger.warning("Delta walk stopped at limit=%d before reaching %s; keeping the high-water mark", limit, since)
+                return
+        # Listing exhausted (short or empty page): everything after ``since`` was seen
+        self.high_water = newest
@@ -7,7 +7,52 @@ GAMMA_BASE = os.getenv("GAMMA_BASE", "https://gamma-api.polymarket.com")
 VOYAGE_MODEL = os.getenv("VOYAGE_MODEL", "voyage-3.5")
 DB_PATH = os.getenv("DB_PATH", "embeddings_cache.sqlite")
 USER_AGENT = os.getenv("USER_AGENT", "market-sync/1.0")
+ANN_DIR = os.getenv("ANN_DIR", DB_PATH + ".ann")
+# Materialized cross-source neighbours per bet (bet_neighbors)
+NEIGHBORS_K = int(os.getenv("NEIGHBORS_K", "100"))
+NEIGHBORS_FLOOR = float(os.getenv("NEIGHBORS_FLOOR", "0.5"))
+# Gamma /markets pages fetched in parallel (1 = follow cursors serially)
+GAMMA_CONCURRENCY = int(os.getenv("GAMMA_CONCURRENCY", "1"))
+# Delta sync: seconds between full reconciliation passes (closures, missed updates)
+SYNC_FULL_EVERY = int(os.getenv("SYNC_FULL_EVERY", "3600"))
+# On-disk HTTP cache for Gamma responses (unset = disabled); mode: revalidate | record | replay
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR") or None
+HTTP_CACHE_MODE = os.getenv("HTTP_CACHE_MODE", "revalidate")
+# Embedding dispatch: batches in flight and provider limits (0 = unlimited)
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "1"))
+EMBED_RPM = float(os.getenv("EMBED_RPM", "0")) or None
+EMBED_TPM = float(os.getenv("EMBED_TPM", "0")) or None
+# Request packing and per-text truncation, in estimated tokens (see tokens.py)
+EMBED_MAX_BATCH_TOKENS = int(os.getenv("EMBED_MAX_BATCH_TOKENS", "100000"))
+EMBED_MAX_TEXT_TOKENS = int(os.getenv("EMBED_MAX_TEXT_TOKENS", "8000"))
+# Cross-process claims on (hash, model) while a batch is embedded; expire if not renewed (0 = off)
+EMBED_LEASE_SECONDS = int(os.getenv("EMBED_LEASE_SECONDS", "300"))
+# In-process LRU of decoded vectors in front of the embeddings table, in MB (0 = off)
+EMBED_LRU_MB = int(os.getenv("EMBED_LRU_MB", "64"))
+# Compact vectors for matching and UI ranking: "" (float32), "int8" or "float16";
+# candidates within QUANT_RESCORE_MARGIN of a threshold are rescored at full precision.
+# Matching only quantizes the exhaustive scan, so run_once matches without the ANN index when set
+VECTOR_QUANT = os.getenv("VECTOR_QUANT", "") or None
+QUANT_RESCORE_MARGIN = float(os.getenv("QUANT_RESCORE_MARGIN", "0.01"))
+# Two-stage search: shortlist COARSE_SHORTLIST candidates per query on a COARSE_DIM projection
+# ("prefix" = leading dimensions, "pca" = basis fit on the cache; "" = off), then rescore them at full dimension.
+# Like VECTOR_QUANT it replaces the ANN recall in run_once's matching
+COARSE_SEARCH = os.getenv("COARSE_SEARCH", "") or None
+COARSE_DIM = int(os.getenv("COARSE_DIM", "128"))
+COARSE_SHORTLIST = int(os.getenv("COARSE_SHORTLIST", "200"))
+# Metrics (metrics.py): file written after each run (.json = JSON, else Prometheus text) and
+# local HTTP port (0 = off); setting either enables collection
+METRICS_PATH = os.getenv("METRICS_PATH") or None
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
 
 # Log resolved configuration (avoid secrets)
-logger.debug("Config resolved: GAMMA_BASE=%s, VOYAGE_MODEL=%s, DB_PATH=%s, USER_AGENT=%s", GAMMA_BASE, VOYAGE_MODEL, DB_PATH, USER_AGENT)
-
+logger.debug(
+    "Config resolved: GAMMA_BASE=%s, VOYAGE_MODEL=%s, DB_PATH=%s, USER_AGENT=%s, ANN_DIR=%s, NEIGHBORS_K=%s, NEIGHBORS_FLOOR=%s, "
+    "GAMMA_CONCURRENCY=%s, SYNC_FULL_EVERY=%s, HTTP_CACHE_DIR=%s, HTTP_CACHE_MODE=%s, "
+    "EMBED_CONCURRENCY=%s, EMBED_RPM=%s, EMBED_TPM=%s, EMBED_MAX_BATCH_TOKENS=%s, EMBED_MAX_TEXT_TOKENS=%s, EMBED_LEASE_SECONDS=%s, "
+    "EMBED_LRU_MB=%s, VECTOR_QUANT=%s, QUANT_RESCORE_MARGIN=%s, COARSE_SEARCH=%s, COARSE_DIM=%s, COARSE_SHORTLIST=%s, METRICS_PATH=%s, METRICS_PORT=%s",
+    GAMMA_BASE, VOYAGE_MODEL, DB_PATH, USER_AGENT, ANN_DIR, NEIGHBORS_K, NEIGHBORS_FLOOR,
+    GAMMA_CONCURRENCY, SYNC_FULL_EVERY, HTTP_CACHE_DIR, HTTP_CACHE_MODE,
+    EMBED_CONCURRENCY, EMBED_RPM, EMBED_TPM, EMBED_MAX_BATCH_TOKENS, EMBED_MAX_TEXT_TOKENS, EMBED_LEASE_SECONDS,
+    EMBED_LRU_MB, VECTOR_QUANT, QUANT_RESCORE_MARGIN, COARSE_SEARCH, COARSE_DIM, COARSE_SHORTLIST, METRICS_PATH, METRICS_PORT,
+)
@@ -17,39 +17,72 @@ def open_db(path: str):
         CREATE TABLE IF NOT EXISTS embeddings (
             hash TEXT NOT NULL,
             model TEXT NOT NULL,
-            embedding TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            dim INTEGER,
+            norm REAL,
             created_at INTEGER NOT NULL,
             PRIMARY KEY (hash, model)
         )
         """
     )
+    # Databases created before binary vectors have a TEXT embedding column and no dim/norm.
+    emb_cols = {r[1] for r in cur.execute("PRAGMA table_info(embeddings)").fetchall()}
+    for col, decl in (("dim", "INTEGER"), ("norm", "REAL")):
+        if col not in emb_cols:
+            logger.info("Adding embeddings.%s column", col)
+            cur.execute(f"ALTER TABLE embeddings ADD COLUMN {col} {decl}")
+    # Single-flight claims across processes; see Embedder.claim
     cur.execute(
         """
-        CREATE TABLE IF NOT EXISTS bets (
-            source TEXT NOT NULL,
-            market_id TEXT NOT NULL,
-            slug TEXT,
-            title TEXT NOT NULL,
-            description TEXT,
-            url TEXT,
-            close_time TEXT,
-            text_hash TEXT NOT NULL,
-            is_active INTEGER NOT NULL,
-            first_seen_at INTEGER NOT NULL,
-            last_seen_at INTEGER NOT NULL,
-            inactive_at INTEGER,
-            PRIMARY KEY (source, market_id)
+        CREATE TABLE IF NOT EXISTS embedding_leases (
+            hash TEXT NOT NULL,
+            model TEXT NOT NULL,
+            owner TEXT NOT NULL,
+            expires_at INTEGER NOT NULL,
+            PRIMARY KEY (hash, model)
         )
         """
     )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_embedding_leases_owner ON embedding_leases(owner)")
+    # Reduced-dimension projection per model for two-stage search; see vectors.ensure_projection
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS embedding_projections (
+            model TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            dim INTEGER NOT NULL,
+            source_dim INTEGER NOT NULL,
+            basis BLOB,
+            fitted_rows INTEGER NOT NULL,
+            fitted_at INTEGER NOT NULL
+        )
+        """
+    )
+    cur.execute(f"CREATE TABLE IF NOT EXISTS bets ({_BETS_COLUMNS})")
+    migrated = _ensure_bets_rowid_alias(cur)
     cur.execute("CREATE INDEX IF NOT EXISTS idx_bets_text_hash ON bets(text_hash)")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_bets_active ON bets(is_active)")
+    # market_id breaks last_seen_at ties (bulk upserts share a timestamp) for keyset paging
+    cur.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_bets_source_active_last_id
+          ON bets(source, is_active, last_seen_at DESC, market_id DESC)
+        """
+    )
+    cur.execute("DROP INDEX IF EXISTS idx_bets_source_active_last")
+    _ensure_bets_fts(cur, rebuild=migrated)
     cur.execute(
         """
-        CREATE INDEX IF NOT EXISTS idx_bets_source_active_last
-          ON bets(source, is_active, last_seen_at DESC)
+        CREATE TABLE IF NOT EXISTS bet_lifecycle (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT NOT NULL,
+            market_id TEXT NOT NULL,
+            transition TEXT NOT NULL,
+            at INTEGER NOT NULL
+        )
         """
     )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_bet_lifecycle_source ON bet_lifecycle(source, id)")
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS events (
@@ -94,7 +127,147 @@ def open_db(path: str):
         )
         """
     )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS match_state (
+            source TEXT NOT NULL,
+            market_id TEXT NOT NULL,
+            model TEXT NOT NULL,
+            text_hash TEXT NOT NULL,
+            scored_at INTEGER NOT NULL,
+            PRIMARY KEY (source, market_id, model)
+        )
+        """
+    )
+    # Materialized cross-source top-k per (model, source, text_hash); see neighbors.py
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS bet_neighbors (
+            model TEXT NOT NULL,
+            source TEXT NOT NULL,
+            text_hash TEXT NOT NULL,
+            neighbor_source TEXT NOT NULL,
+            neighbor_market_id TEXT NOT NULL,
+            similarity REAL NOT NULL,
+            PRIMARY KEY (model, source, text_hash, neighbor_source, neighbor_market_id)
+        )
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_bet_neighbors_target ON bet_neighbors(model, neighbor_source, neighbor_market_id)")
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS bet_neighbor_state (
+            model TEXT NOT NULL,
+            source TEXT NOT NULL,
+            text_hash TEXT NOT NULL,
+            computed_at INTEGER NOT NULL,
+            PRIMARY KEY (model, source, text_hash)
+        )
+        """
+    )
+    # Delta sync: per-source updatedAt high-water mark and time of the last full pass.
+    # ``generation`` is bumped whenever a sync changed the source's active set (see Repo.bump_generation).
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sync_state (
+            source TEXT PRIMARY KEY,
+            high_water TEXT,
+            last_full_at INTEGER,
+            generation INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER NOT NULL
+        )
+        """
+    )
+    if "generation" not in {r[1] for r in cur.execute("PRAGMA table_info(sync_state)").fetchall()}:
+        logger.info("Adding sync_state.generation column")
+        cur.execute("ALTER TABLE sync_state ADD COLUMN generation INTEGER NOT NULL DEFAULT 0")
     conn.commit()
     logger.info("DB ready")
     return conn
 
+# ``id`` aliases the rowid, which bets_fts keys on: VACUUM may renumber implicit
+# rowids, but never an INTEGER PRIMARY KEY.
+_BETS_COLUMNS = """
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    market_id TEXT NOT NULL,
+    slug TEXT,
+    title TEXT NOT NULL,
+    description TEXT,
+    url TEXT,
+    close_time TEXT,
+    text_hash TEXT NOT NULL,
+    is_active INTEGER NOT NULL,
+    first_seen_at INTEGER NOT NULL,
+    last_seen_at INTEGER NOT NULL,  -- last insert or change; bulk upserts skip unchanged rows
+    inactive_at INTEGER,
+    UNIQUE (source, market_id)
+"""
+
+def _ensure_bets_rowid_alias(cur) -> bool:
+    """Rebuild a ``bets`` table keyed on ``(source, market_id)`` with the ``id`` rowid alias.
+
+    Existing rowids are copied into ``id``. Returns True when the table was rebuilt.
+    """
+    if "id" in {r[1] for r in cur.execute("PRAGMA table_info(bets)").fetchall()}:
+        return False
+    logger.info("Adding bets.id rowid alias (rebuilding bets)")
+    cols = "source, market_id, slug, title, description, url, close_time, text_hash, is_active, first_seen_at, last_seen_at, inactive_at"
+    cur.execute("DROP TABLE IF EXISTS bets_rebuild")
+    cur.execute(f"CREATE TABLE bets_rebuild ({_BETS_COLUMNS})")
+    cur.execute(f"INSERT INTO bets_rebuild(id, {cols}) SELECT rowid, {cols} FROM bets")
+    # Takes the bets indexes and FTS triggers with it; open_db recreates both
+    cur.execute("DROP TABLE bets")
+    cur.execute("ALTER TABLE bets_rebuild RENAME TO bets")
+    return True
+
+def has_fts(conn) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name='bets_fts'").fetchone() is not None
+
+def _ensure_bets_fts(cur, rebuild: bool = False):
+    """FTS5 index over bets(title, description), kept in sync by triggers.
+
+    External-content table on the ``bets.id`` rowid alias, so the text is not stored
+    twice. Skipped with a warning when SQLite lacks FTS5; ``Repo.search_active_bets``
+    then falls back to LIKE. ``rebuild`` re-indexes every row (after ``bets`` was rebuilt).
+    """
+    declared = cur.execute("SELECT sql FROM sqlite_master WHERE name='bets_fts'").fetchone()
+    if declared and "content_rowid='id'" not in declared[0]:
+        # Declared on the implicit rowid by older versions; recreated on ``id`` with its triggers
+        logger.info("Recreating bets_fts on bets.id")
+        for trigger in ("bets_fts_ai", "bets_fts_ad", "bets_fts_au"):
+            cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cur.execute("DROP TABLE bets_fts")
+    if not has_fts(cur.connection):
+        try:
+            cur.execute(
+                """
+                CREATE VIRTUAL TABLE bets_fts USING fts5(
+                    title, description, content='bets', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+                )
+                """
+            )
+        except sqlite3.OperationalError as e:
+            logger.warning("FTS5 unavailable (%s); market search will scan with LIKE", e)
+            return
+        # Index rows that predate the table
+        rebuild = True
+    cur.executescript(
+        """
+        CREATE TRIGGER IF NOT EXISTS bets_fts_ai AFTER INSERT ON bets BEGIN
+            INSERT INTO bets_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS bets_fts_ad AFTER DELETE ON bets BEGIN
+            INSERT INTO bets_fts(bets_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS bets_fts_au AFTER UPDATE OF title, description ON bets
+        WHEN old.title IS NOT new.title OR old.description IS NOT new.description BEGIN
+            INSERT INTO bets_fts(bets_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO bets_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+        END;
+        """
+    )
+    if rebuild:
+        cur.execute("INSERT INTO bets_fts(bets_fts) VALUES('rebuild')")
+        logger.info("Built FTS index over bets")
@@ -2,37 +2,339 @@
 import os
 import json
 import time
-import hashlib
-from typing import List, Optional
+import uuid
+import socket
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
 import voyageai as voyageai
+from .config import EMBED_LEASE_SECONDS, EMBED_LRU_MB, EMBED_MAX_BATCH_TOKENS
+from .metrics import METRICS, timed
+from .models import prepare_text, text_digest
+from .ratelimit import RateLimiter
+from .tokens import estimate_tokens, pack_batches
 from .util import now_ts
 
+logger = logging.getLogger(__name__)
+
+# Vectors are stored as little-endian float32 blobs; rows written before the
+# binary format hold a JSON text array and stay readable until migrated.
+VECTOR_DTYPE = np.dtype("<f4")
+# Keeps IN (...) lists below SQLite's default 999 bound parameters.
+LOOKUP_CHUNK = 500
+
+# Single flight inside the process: (model, hash) -> event set when its leader is done.
+_FLIGHTS: Dict[Tuple[str, str], threading.Event] = {}
+_FLIGHTS_LOCK = threading.Lock()
+# Owner id written to embedding_leases by this process
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def encode_vector(vec) -> Tuple[bytes, int, float]:
+    arr = np.asarray(vec, dtype=VECTOR_DTYPE)
+    return arr.tobytes(), int(arr.shape[0]), float(np.linalg.norm(arr))
+
+def decode_vector(value) -> np.ndarray:
+    if isinstance(value, (bytes, memoryview)):
+        return np.frombuffer(value, dtype=VECTOR_DTYPE)
+    return np.asarray(json.loads(value), dtype=VECTOR_DTYPE)
+
+class VectorLRU:
+    """Decoded vectors by ``(hash, model)``, least recently used evicted first, bounded by bytes.
+
+    Sized by the vectors' ``nbytes`` plus a fixed per-entry overhead, so the bound
+    holds whatever the dimension. It only ever holds one model: touching a different
+    model drops everything first. Thread-safe; one instance may back several
+    ``EmbeddingCache`` objects (e.g. every UI session plus the prefetcher).
+    """
+
+    # Key tuple, dict slot and ndarray header, roughly
+    ENTRY_OVERHEAD = 200
+
+    def __init__(self, max_bytes: int = EMBED_LRU_MB * 2**20):
+        self.max_bytes = max(0, int(max_bytes))
+        self.bytes = 0
+        self.model: Optional[str] = None
+        self._items: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _use_model(self, model: str):
+        # Caller holds the lock
+        if model != self.model:
+            if self._items:
+                self.stats["invalidations"] += 1
+                logger.info("Vector LRU: model changed %s -> %s; dropping %d vectors", self.model, model, len(self._items))
+            self._items.clear()
+            self.bytes = 0
+            self.model = model
+
+    def get_many(self, hashes: Iterable[str], model: str) -> Dict[str, np.ndarray]:
+        out: Dict[str, np.ndarray] = {}
+        if not self.max_bytes:
+            return out
+        with self._lock:
+            self._use_model(model)
+            asked = 0
+            for h in hashes:
+                asked += 1
+                vec = self._items.get(h)
+                if vec is not None:
+                    self._items.move_to_end(h)
+                    out[h] = vec
+            self.stats["hits"] += len(out)
+            self.stats["misses"] += asked - len(out)
+        METRICS.inc("vector_lru_hits", len(out))
+        return out
+
+    def put_many(self, model: str, items: Dict[str, np.ndarray]):
+        if not self.max_bytes or not items:
+            return
+        with self._lock:
+            self._use_model(model)
+            for h, vec in items.items():
+                size = vec.nbytes + self.ENTRY_OVERHEAD
+                if size > self.max_bytes:
+                    continue
+                old = self._items.pop(h, None)
+                if old is not None:
+                    self.bytes -= old.nbytes + self.ENTRY_OVERHEAD
+                # Shared with every later reader; blob-backed vectors are read-only already
+                vec.setflags(write=False)
+                self._items[h] = vec
+                self.bytes += size
+            evicted = 0
+            while self.bytes > self.max_bytes:
+                _, old = self._items.popitem(last=False)
+                self.bytes -= old.nbytes + self.ENTRY_OVERHEAD
+                evicted += 1
+            self.stats["evictions"] += evicted
+        METRICS.inc("vector_lru_evictions", evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
 class EmbeddingCache:
-    def __init__(self, conn):
+    """SQLite-backed vectors keyed by ``(hash, model)``, with a ``VectorLRU`` in front.
+
+    Reads try the LRU first and fill it from SQLite; writes go through to both. A
+    ``get_many`` whose result would take more than a quarter of the LRU budget
+    (e.g. loading a whole source matrix) is served without being admitted, so one
+    bulk scan does not flush the working set. Pass a shared ``lru`` to bound
+    several caches together, or ``VectorLRU(0)`` to turn it off.
+    """
+
+    def __init__(self, conn, lru: Optional[VectorLRU] = None):
         self.conn = conn
+        self.lru = lru if lru is not None else VectorLRU()
 
-    def get(self, hash_: str, model: str) -> Optional[List[float]]:
-        cur = self.conn.cursor()
-        cur.execute("SELECT embedding FROM embeddings WHERE hash = ? AND model = ?", (hash_, model))
-        row = cur.fetchone()
-        if row:
-            return json.loads(row[0])
-        return None
+    def get(self, hash_: str, model: str) -> Optional[np.ndarray]:
+        return self.get_many([hash_], model).get(hash_)
+
+    @timed("cache_lookup")
+    def get_many(self, hashes: Iterable[str], model: str) -> Dict[str, np.ndarray]:
+        """Look up many vectors at once; hashes without a cached vector are absent from the result."""
+        unique = list(dict.fromkeys(hashes))
+        out = self.lru.get_many(unique, model)
+        rest = [h for h in unique if h not in out] if out else unique
+        loaded: Dict[str, np.ndarray] = {}
+        for i in range(0, len(rest), LOOKUP_CHUNK):
+            chunk = rest[i : i + LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT hash, embedding FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                [model] + chunk,
+            ).fetchall()
+            for h, value in rows:
+                loaded[h] = decode_vector(value)
+        if loaded:
+            out.update(loaded)
+            if sum(v.nbytes for v in loaded.values()) <= self.lru.max_bytes // 4:
+                self.lru.put_many(model, loaded)
+        METRICS.inc("cache_hits", len(out))
+        METRICS.inc("cache_misses", len(unique) - len(out))
+        return out
 
-    def set(self, hash_: str, model: str, embedding: List[float]):
-        cur = self.conn.cursor()
-        cur.execute(
+    def set(self, hash_: str, model: str, embedding) -> np.ndarray:
+        return self.set_many(model, [(hash_, embedding)])[hash_]
+
+    def set_many(self, model: str, items: Iterable[Tuple[str, object]]) -> Dict[str, np.ndarray]:
+        """Write many vectors in a single transaction and return them decoded by hash."""
+        now = now_ts()
+        rows = []
+        out: Dict[str, np.ndarray] = {}
+        for h, embedding in items:
+            blob, dim, norm = encode_vector(embedding)
+            rows.append((h, model, blob, dim, norm, now))
+            out[h] = decode_vector(blob)
+        if not rows:
+            return out
+        self.conn.executemany(
             """
-            INSERT INTO embeddings (hash, model, embedding, created_at)
-            VALUES (?, ?, ?, ?)
+            INSERT INTO embeddings (hash, model, embedding, dim, norm, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
             ON CONFLICT(hash, model) DO UPDATE SET
               embedding=excluded.embedding,
+              dim=excluded.dim,
+              norm=excluded.norm,
               created_at=excluded.created_at
             """,
-            (hash_, model, json.dumps(embedding), now_ts()),
+            rows,
+        )
+        with METRICS.timer("db_commit"):
+            self.conn.commit()
+        self.lru.put_many(model, out)
+        return out
+
+    def claim_leases(self, model: str, hashes: List[str], owner: str, ttl: int) -> List[str]:
+        """Take the lease on every hash that is free or expired; return the hashes ``owner`` now holds."""
+        now = now_ts()
+        won: List[str] = []
+        for i in range(0, len(hashes), LOOKUP_CHUNK):
+            chunk = hashes[i : i + LOOKUP_CHUNK]
+            self.conn.executemany(
+                """
+                INSERT INTO embedding_leases (hash, model, owner, expires_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(hash, model) DO UPDATE SET owner=excluded.owner, expires_at=excluded.expires_at
+                WHERE embedding_leases.expires_at < ?
+                """,
+                [(h, model, owner, now + ttl, now) for h in chunk],
+            )
+            won.extend(r[0] for r in self.conn.execute(
+                f"SELECT hash FROM embedding_leases WHERE model=? AND owner=? AND hash IN ({','.join('?' * len(chunk))})",
+                [model, owner] + chunk,
+            ))
+            self.conn.commit()
+        return won
+
+    def release_leases(self, model: str, hashes: List[str], owner: str):
+        for i in range(0, len(hashes), LOOKUP_CHUNK):
+            chunk = hashes[i : i + LOOKUP_CHUNK]
+            self.conn.execute(
+                f"DELETE FROM embedding_leases WHERE model=? AND owner=? AND hash IN ({','.join('?' * len(chunk))})",
+                [model, owner] + chunk,
+            )
+        self.conn.commit()
+
+    def renew_leases(self, owner: str, ttl: int):
+        self.conn.execute("UPDATE embedding_leases SET expires_at=? WHERE owner=?", (now_ts() + ttl, owner))
+        self.conn.commit()
+
+    def live_leases(self, model: str, hashes: List[str]) -> set:
+        """Hashes among ``hashes`` whose lease has not expired (held by anyone)."""
+        now = now_ts()
+        live = set()
+        for i in range(0, len(hashes), LOOKUP_CHUNK):
+            chunk = hashes[i : i + LOOKUP_CHUNK]
+            live.update(r[0] for r in self.conn.execute(
+                f"SELECT hash FROM embedding_leases WHERE model=? AND expires_at >= ? AND hash IN ({','.join('?' * len(chunk))})",
+                [model, now] + chunk,
+            ))
+        return live
+
+    def count_vectors(self, model: str) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM embeddings WHERE model=?", (model,)).fetchone()[0]
+
+    def sample_vectors(self, model: str, n: int) -> List[np.ndarray]:
+        """Up to ``n`` vectors of ``model`` picked at random (not admitted to the LRU)."""
+        rows = self.conn.execute("SELECT embedding FROM embeddings WHERE model=? ORDER BY random() LIMIT ?", (model, n)).fetchall()
+        return [decode_vector(r[0]) for r in rows]
+
+    def get_projection(self, model: str) -> Optional[Tuple[str, int, int, Optional[bytes], int, int]]:
+        """Stored ``(kind, dim, source_dim, basis, fitted_rows, fitted_at)`` for ``model``, if any."""
+        return self.conn.execute(
+            "SELECT kind, dim, source_dim, basis, fitted_rows, fitted_at FROM embedding_projections WHERE model=?", (model,)
+        ).fetchone()
+
+    def set_projection(self, model: str, kind: str, dim: int, source_dim: int, basis: Optional[bytes], fitted_rows: int, fitted_at: int):
+        self.conn.execute(
+            """
+            INSERT INTO embedding_projections (model, kind, dim, source_dim, basis, fitted_rows, fitted_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(model) DO UPDATE SET
+              kind=excluded.kind, dim=excluded.dim, source_dim=excluded.source_dim,
+              basis=excluded.basis, fitted_rows=excluded.fitted_rows, fitted_at=excluded.fitted_at
+            """,
+            (model, kind, dim, source_dim, basis, fitted_rows, fitted_at),
         )
         self.conn.commit()
 
+    def count_json_rows(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM embeddings WHERE typeof(embedding)='text'").fetchone()[0]
+
+    def migrate_to_binary(self, batch_size: int = 1000, max_batches: Optional[int] = None) -> int:
+        """Convert legacy JSON rows to float32 blobs, one short transaction per batch.
+
+        Safe to run while readers are active; unconverted rows keep decoding from JSON.
+        """
+        converted = 0
+        batches = 0
+        last_rowid = 0
+        while max_batches is None or batches < max_batches:
+            rows = self.conn.execute(
+                """
+                SELECT rowid, embedding FROM embeddings
+                WHERE rowid > ? AND typeof(embedding)='text'
+                ORDER BY rowid LIMIT ?
+                """,
+                (last_rowid, batch_size),
+            ).fetchall()
+            if not rows:
+                break
+            updates = []
+            for rowid, text in rows:
+                blob, dim, norm = encode_vector(json.loads(text))
+                updates.append((blob, dim, norm, rowid))
+            last_rowid = rows[-1][0]
+            self.conn.executemany("UPDATE embeddings SET embedding=?, dim=?, norm=? WHERE rowid=?", updates)
+            self.conn.commit()
+            converted += len(updates)
+            batches += 1
+            logger.info("Migrated %d embeddings to binary (total=%d)", len(updates), converted)
+        return converted
+
+@dataclass
+class Claim:
+    """Result of ``Embedder.claim``.
+
+    ``mine`` must be embedded (then released) by the caller. ``local`` hashes are
+    being embedded by another thread of this process, ``remote`` ones by another
+    process; ``Embedder.wait_for`` collects both. ``cached`` holds vectors that
+    another claimant wrote between the caller's cache check and the claim.
+    """
+    mine: List[str]
+    local: Dict[str, threading.Event]
+    remote: List[str]
+    cached: Dict[str, np.ndarray] = field(default_factory=dict)
+
+    @property
+    def waiting(self) -> List[str]:
+        return list(self.local) + self.remote
+
+def retry_after_seconds(exc: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header on a provider error, if it carried one."""
+    headers = getattr(exc, "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
 class Embedder:
     def __init__(
         self,
@@ -42,56 +344,250 @@ class Embedder:
         max_retries: int = 5,
         backoff_base: float = 0.5,
         max_batch_size: int = 256,
+        max_concurrency: int = 1,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        client=None,
+        max_batch_tokens: int = EMBED_MAX_BATCH_TOKENS,
+        tokenizer: Callable[[str], int] = estimate_tokens,
+        lease_seconds: int = EMBED_LEASE_SECONDS,
+        poll_interval: float = 0.5,
     ):
-        key = api_key or os.getenv("VOYAGE_API_KEY")
-        if not key:
-            raise RuntimeError("VOYAGE_API_KEY not set in environment")
-        self.client = voyageai.Client(api_key=key)
+        if client is None:
+            key = api_key or os.getenv("VOYAGE_API_KEY")
+            if not key:
+                raise RuntimeError("VOYAGE_API_KEY not set in environment")
+            client = voyageai.Client(api_key=key)
+        self.client = client
         self.model = model
         self.cache = cache
         self.max_retries = max_retries
         self.backoff_base = backoff_base
         self.max_batch_size = max_batch_size
+        self.max_concurrency = max(1, max_concurrency)
+        self.limiter = RateLimiter(rpm=rpm, tpm=tpm)
+        self.max_batch_tokens = max_batch_tokens
+        self.tokenizer = tokenizer
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._renewed_at = 0.0
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
 
     @staticmethod
     def text_hash(text: str) -> str:
-        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return text_digest(text)
+
+    @staticmethod
+    def prepare_text(text: str) -> str:
+        # Same cut as Bet.text_hash, so a text embedded here and a synced bet share a cache key;
+        # ``tokenizer`` only sizes batches
+        return prepare_text(text)
+
+    def estimate_tokens(self, texts: List[str]) -> int:
+        return sum(self.tokenizer(t) for t in texts)
 
-    def _embed_batch_api(self, texts: List[str]) -> List[List[float]]:
+    def reset_stats(self):
+        with self._stats_lock:
+            self.stats = {"requests": 0, "texts": 0, "tokens_estimated": 0, "tokens_billed": 0, "truncated": 0}
+
+    def _record(self, **counts):
+        with self._stats_lock:
+            for key, value in counts.items():
+                self.stats[key] += value
+
+    @timed("embed_batch")
+    def embed_batch(self, texts: List[str], tokens: Optional[int] = None) -> List[List[float]]:
+        """One provider request for prepared ``texts``, with rate limiting and retries.
+
+        Nothing is cached or claimed here; callers dispatching batches themselves
+        (``plan_batches`` then ``embed_batch``, as ``sync_stream`` does) hold the
+        claim and write the vectors back.
+        """
         delay = self.backoff_base
+        if tokens is None:
+            tokens = self.estimate_tokens(texts)
         for attempt in range(self.max_retries):
+            self.limiter.acquire(tokens)
             try:
                 resp = self.client.embed(texts, model=self.model, input_type="document")
+                self._record(requests=1, texts=len(texts), tokens_estimated=tokens, tokens_billed=getattr(resp, "total_tokens", 0) or 0)
+                METRICS.inc("tokens_sent", tokens)
+                METRICS.inc("embed_requests")
                 return resp.embeddings
-            except Exception:
+            except Exception as e:
                 if attempt == self.max_retries - 1:
                     raise
-                time.sleep(delay)
-                delay *= 2
+                METRICS.inc("embed_retries")
+                wait = retry_after_seconds(e)
+                if wait is not None:
+                    # The provider told us when to come back; hold the other workers too.
+                    logger.info("Embedding batch rate limited; retrying in %.2fs", wait)
+                    self.limiter.pause(wait)
+                else:
+                    logger.warning("Embedding batch failed (%s); retrying in %.2fs", e, delay)
+                    time.sleep(delay)
+                    delay *= 2
         raise RuntimeError("Embedding batch failed")
 
-    def embed_texts(self, texts: List[str]) -> List[List[float]]:
-        hashes = [self.text_hash(t) for t in texts]
-        cached_vectors = {}
-        missing_idx = []
-        missing_texts = []
-        for i, (h, t) in enumerate(zip(hashes, texts)):
-            v = self.cache.get(h, self.model)
-            if v is None:
-                missing_idx.append(i)
-                missing_texts.append(t)
-            else:
-                cached_vectors[i] = v
-        if missing_texts:
-            # Respect provider batch limits by chunking
-            for start in range(0, len(missing_texts), self.max_batch_size):
-                chunk_texts = missing_texts[start : start + self.max_batch_size]
-                chunk_vecs = self._embed_batch_api(chunk_texts)
-                for offset, vec in enumerate(chunk_vecs):
-                    original_idx = missing_idx[start + offset]
-                    self.cache.set(hashes[original_idx], self.model, vec)
-                    cached_vectors[original_idx] = vec
-        return [cached_vectors[i] for i in range(len(texts))]
-
-    def embed_text(self, text: str) -> List[float]:
-        return self.embed_texts([text])[0]
\ No newline at end of file
+    def plan_batches(self, missing: Dict[str, str]) -> List[Tuple[List[str], int]]:
+        """Pack ``{hash: prepared_text}`` into ``(hashes, estimated_tokens)`` requests.
+
+        Respects provider limits on both item count and token volume.
+        """
+        missing_hashes = list(missing)
+        counts = [self.tokenizer(missing[h]) for h in missing_hashes]
+        return [
+            (missing_hashes[a:b], sum(counts[a:b]))
+            for a, b in pack_batches(counts, self.max_batch_size, self.max_batch_tokens)
+        ]
+
+    def embed_texts(self, texts: List[str]) -> List[np.ndarray]:
+        prepared = [self.prepare_text(t) for t in texts]
+        truncated = sum(p is not t for p, t in zip(prepared, texts))
+        if truncated:
+            self._record(truncated=truncated)
+        return self.embed_hashed([self.text_hash(t) for t in prepared], prepared)
+
+    def embed_hashed(self, hashes: List[str], texts) -> List[np.ndarray]:
+        """``embed_texts`` for callers that already hold prepared texts and their hashes.
+
+        ``texts`` may also be a callable ``i -> text``, so texts are only built for
+        cache misses (``BetBatch`` does not keep them).
+        """
+        text_of = texts if callable(texts) else texts.__getitem__
+        vectors = self.cache.get_many(hashes, self.model)
+        missing: Dict[str, str] = {}
+        for i, h in enumerate(hashes):
+            if h not in vectors and h not in missing:
+                missing[h] = text_of(i)
+        if missing:
+            claim = self.claim(list(missing))
+            vectors.update(claim.cached)
+            try:
+                mine = {h: missing[h] for h in claim.mine}
+                chunks = self.plan_batches(mine) if mine else []
+                if self.max_concurrency > 1 and len(chunks) > 1:
+                    self._embed_chunks_concurrent(chunks, mine, vectors)
+                else:
+                    for chunk_hashes, tokens in chunks:
+                        chunk_vecs = self.embed_batch([mine[h] for h in chunk_hashes], tokens)
+                        vectors.update(self.cache.set_many(self.model, zip(chunk_hashes, chunk_vecs)))
+                        self.release(chunk_hashes)
+                        self.renew()
+            finally:
+                # No-op for chunks released above; frees the rest if a batch failed
+                self.release(claim.mine)
+            if claim.waiting:
+                vectors.update(self.wait_for(claim, missing))
+        return [vectors[h] for h in hashes]
+
+    def claim(self, hashes: List[str]) -> Claim:
+        """Single-flight claim on missing ``hashes`` for this model.
+
+        A hash already claimed by another thread of this process is returned in
+        ``local``. The rest are leased in ``embedding_leases`` (when
+        ``lease_seconds`` > 0); hashes whose unexpired lease belongs to another
+        process go to ``remote``, and this thread stays their local leader until
+        ``wait_for`` resolves them. Won hashes are looked up once more and the ones
+        cached in the meantime are released straight away into ``cached``.
+        """
+        mine: List[str] = []
+        local: Dict[str, threading.Event] = {}
+        with _FLIGHTS_LOCK:
+            for h in dict.fromkeys(hashes):
+                event = _FLIGHTS.get((self.model, h))
+                if event is not None:
+                    local[h] = event
+                else:
+                    _FLIGHTS[(self.model, h)] = threading.Event()
+                    mine.append(h)
+        remote: List[str] = []
+        if mine and self.lease_seconds > 0:
+            try:
+                won = set(self.cache.claim_leases(self.model, mine, LEASE_OWNER, self.lease_seconds))
+            except BaseException:
+                self.release(mine, leased=False)
+                raise
+            self._renewed_at = time.monotonic()
+            remote = [h for h in mine if h not in won]
+            mine = [h for h in mine if h in won]
+        cached: Dict[str, np.ndarray] = {}
+        if mine:
+            try:
+                cached = self.cache.get_many(mine, self.model)
+            except BaseException:
+                self.release(mine)
+                raise
+            if cached:
+                self.release(list(cached))
+                mine = [h for h in mine if h not in cached]
+        return Claim(mine, local, remote, cached)
+
+    def release(self, hashes: List[str], leased: bool = True):
+        """End the claim on ``hashes`` (after their vectors are cached, or on failure) and wake waiters."""
+        if not hashes:
+            return
+        if leased and self.lease_seconds > 0:
+            self.cache.release_leases(self.model, list(hashes), LEASE_OWNER)
+        with _FLIGHTS_LOCK:
+            for h in hashes:
+                event = _FLIGHTS.pop((self.model, h), None)
+                if event is not None:
+                    event.set()
+
+    def renew(self):
+        """Push out this process's lease expiries; cheap to call often, writes at most every third of a lease."""
+        if self.lease_seconds > 0 and time.monotonic() - self._renewed_at > self.lease_seconds / 3:
+            self.cache.renew_leases(LEASE_OWNER, self.lease_seconds)
+            self._renewed_at = time.monotonic()
+
+    def wait_for(self, claim: Claim, texts: Dict[str, str]) -> Dict[str, np.ndarray]:
+        """Vectors for ``claim.waiting`` once their leaders finish.
+
+        Remote leases are polled every ``poll_interval`` seconds. Hashes whose
+        leader failed or whose lease expired without a vector are embedded here
+        (``texts`` maps hash to prepared text).
+        """
+        vectors: Dict[str, np.ndarray] = {}
+        try:
+            for event in claim.local.values():
+                event.wait(self.lease_seconds or None)
+            remaining = list(claim.remote)
+            while remaining:
+                vectors.update(self.cache.get_many(remaining, self.model))
+                remaining = [h for h in remaining if h not in vectors]
+                if remaining:
+                    live = self.cache.live_leases(self.model, remaining)
+                    remaining = [h for h in remaining if h in live]
+                if remaining:
+                    time.sleep(self.poll_interval)
+        finally:
+            self.release(claim.remote, leased=False)
+        waiting = claim.waiting
+        vectors.update(self.cache.get_many([h for h in waiting if h not in vectors], self.model))
+        leftover = [h for h in waiting if h not in vectors]
+        if leftover:
+            logger.info("Embedding %d texts whose claim holder gave up", len(leftover))
+            vectors.update(zip(leftover, self.embed_hashed(leftover, [texts[h] for h in leftover])))
+        return vectors
+
+    def _embed_chunks_concurrent(self, chunks: List[Tuple[List[str], int]], missing: Dict[str, str], vectors: Dict[str, np.ndarray]):
+        # Workers only talk to the provider; cache writes stay on this thread, one
+        # transaction per finished batch, so an interruption keeps what completed.
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="embed") as pool:
+            futures = {pool.submit(self.embed_batch, [missing[h] for h in c], tokens): c for c, tokens in chunks}
+            try:
+                for fut in as_completed(futures):
+                    chunk_hashes = futures[fut]
+                    vectors.update(self.cache.set_many(self.model, zip(chunk_hashes, fut.result())))
+                    self.release(chunk_hashes)
+                    self.renew()
+                    logger.debug("Embedded batch of %d (%d in flight)", len(chunk_hashes), sum(not f.done() for f in futures))
+            except BaseException:
+                for f in futures:
+                    f.cancel()
+                raise
+
+    def embed_text(self, text: str) -> np.ndarray:
+        return self.embed_texts([text])[0]
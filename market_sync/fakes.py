@@ -0,0 +1,129 @@
+# market_sync/fakes.py
+import time
+import hashlib
+import threading
+from types import SimpleNamespace
+from typing import List, Optional
+import numpy as np
+from voyageai.error import RateLimitError
+
+class FakeEmbeddingClient:
+    """Offline stand-in for ``voyageai.Client`` with deterministic vectors.
+
+    ``latency`` is slept per call; every ``rate_limit_every``-th call raises a 429
+    ``RateLimitError`` carrying ``Retry-After: retry_after``. Pass it to
+    ``Embedder(client=...)`` to exercise batching, concurrency and retries locally.
+    """
+
+    def __init__(
+        self,
+        dim: int = 1024,
+        latency: float = 0.0,
+        rate_limit_every: int = 0,
+        retry_after: Optional[float] = 0.05,
+    ):
+        self.dim = dim
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.calls = 0
+        self.rate_limited = 0
+        self.texts_embedded = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32).tolist()
+
+    def embed(self, texts: List[str], model: Optional[str] = None, input_type: Optional[str] = None):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if self.rate_limit_every and call % self.rate_limit_every == 0:
+                with self._lock:
+                    self.rate_limited += 1
+                headers = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+                raise RateLimitError("fake rate limit", http_status=429, headers=headers)
+            with self._lock:
+                self.texts_embedded += len(texts)
+            return SimpleNamespace(
+                embeddings=[self.vector(t) for t in texts],
+                total_tokens=sum(len(t) // 4 + 1 for t in texts),
+            )
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+class BagOfWordsEmbeddingClient(FakeEmbeddingClient):
+    """``FakeEmbeddingClient`` whose vectors are the normalized sum of per-word vectors of the first line.
+
+    Titles sharing words come out similar, so matching and ranking see a realistic
+    spread of scores instead of the near-orthogonal noise of random vectors.
+    """
+
+    def __init__(self, dim: int = 1024, **kwargs):
+        super().__init__(dim=dim, **kwargs)
+        self._words = {}
+
+    def _word(self, word: str) -> np.ndarray:
+        vec = self._words.get(word)
+        if vec is None:
+            vec = self._words[word] = np.asarray(super().vector(word), dtype=np.float32)
+        return vec
+
+    def vector(self, text: str) -> List[float]:
+        words = text.split("\n", 1)[0].lower().split() or [text]
+        vec = np.sum([self._word(w) for w in words], axis=0)
+        return (vec / (np.linalg.norm(vec) or 1.0)).tolist()
+
+_SYLLABLES = ["ka", "lo", "mi", "ra", "te", "vo", "su", "ne", "da", "ri", "po", "ze", "ul", "an", "or", "is"]
+_EVENTS = [
+    "win the election", "be elected president", "sign the bill", "resign", "reach $100k",
+    "announce a merger", "ship the product", "win the championship", "be indicted", "hold a summit",
+    "raise interest rates", "cut interest rates", "default on its debt", "launch the rocket", "file for bankruptcy",
+    "top the box office", "join the league", "leave the coalition", "pass the referendum", "visit the country",
+]
+_MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
+
+def synthetic_markets(n: int, seed: int = 0, entities: int = 2000, closed_every: int = 0, start_id: int = 0) -> List[dict]:
+    """``n`` Gamma ``/markets``-shaped payloads (``PolymarketClient.to_bet`` input), deterministic for ``seed``.
+
+    Questions combine a made-up entity, an event and a deadline, so many markets share
+    words; descriptions are ~60 Zipf-distributed words. Every ``closed_every``-th
+    market is closed.
+    """
+    rng = np.random.default_rng(seed)
+    syll = np.array(_SYLLABLES)
+    names = ["".join(rng.choice(syll, rng.integers(2, 4))).capitalize() for _ in range(entities)]
+    vocab = ["".join(rng.choice(syll, rng.integers(1, 4))) for _ in range(5000)]
+    probs = 1.0 / np.arange(1, len(vocab) + 1)
+    probs /= probs.sum()
+    desc_words = rng.choice(len(vocab), (n, 60), p=probs)
+    who = rng.integers(0, entities, n)
+    what = rng.integers(0, len(_EVENTS), n)
+    when = rng.integers(0, 36, n)
+    out = []
+    for i in range(n):
+        mid = start_id + i
+        month, year = _MONTHS[when[i] % 12], 2026 + when[i] // 12
+        question = f"Will {names[who[i]]} {_EVENTS[what[i]]} by {month} {year}?"
+        out.append({
+            "id": str(mid),
+            "question": question,
+            "description": " ".join(vocab[w] for w in desc_words[i]),
+            "slug": f"synthetic-{mid}",
+            "active": True,
+            "closed": bool(closed_every and mid % closed_every == 0),
+            "archived": False,
+            "endDate": f"{year}-{when[i] % 12 + 1:02d}-28T00:00:00Z",
+            "updatedAt": f"2026-01-01T00:00:{i % 60:02d}Z",
+            "volume": str(int(rng.integers(0, 10_000_000))),
+        })
+    return out
@@ -0,0 +1,126 @@
+# market_sync/httpcache.py
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+MODES = ("revalidate", "record", "replay")
+
+class ReplayMiss(requests.ConnectionError):
+    """Raised in replay mode for a request that was never recorded."""
+
+def content_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+class CachingAdapter(HTTPAdapter):
+    """Transport adapter keeping one JSON file per ``GET`` URL under ``directory``.
+
+    Modes:
+      - ``revalidate``: send ``If-None-Match`` / ``If-Modified-Since`` from the stored
+        entry; a 304 is answered from disk. Without validators the body hash is
+        compared instead, so an identical page is still reported as unchanged.
+      - ``record``: always fetch and overwrite the stored entry.
+      - ``replay``: serve stored entries only and never touch the network.
+
+    Every response carries ``from_cache`` (body served from disk or identical to it)
+    and ``content_hash`` (sha256 of the body) attributes.
+    """
+
+    def __init__(self, directory: str, mode: str = "revalidate", **kwargs):
+        if mode not in MODES:
+            raise ValueError(f"unknown HTTP cache mode {mode!r}; expected one of {MODES}")
+        super().__init__(**kwargs)
+        self.directory = directory
+        self.mode = mode
+        self.stats = {"hits": 0, "not_modified": 0, "unchanged": 0, "misses": 0}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _path(self, request: requests.PreparedRequest) -> str:
+        key = hashlib.sha256(f"{request.method} {request.url}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + ".json")
+
+    def _load(self, path: str) -> Optional[dict]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, path: str, request: requests.PreparedRequest, response: requests.Response, digest: str):
+        entry = {
+            "url": request.url,
+            "status": response.status_code,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() in ("content-type", "etag", "last-modified")},
+            "content_hash": digest,
+            "body": response.content.decode("utf-8"),
+        }
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+
+    def _from_entry(self, entry: dict, request: requests.PreparedRequest) -> requests.Response:
+        r = requests.Response()
+        r.status_code = entry["status"]
+        r.headers = CaseInsensitiveDict(entry.get("headers") or {})
+        r._content = entry["body"].encode("utf-8")
+        r.encoding = "utf-8"
+        r.url = request.url
+        r.request = request
+        r.reason = "OK"
+        r.from_cache = True
+        r.content_hash = entry["content_hash"]
+        return r
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+        path = self._path(request)
+        entry = self._load(path) if self.mode != "record" else None
+
+        if self.mode == "replay":
+            if entry is None:
+                raise ReplayMiss(f"no recorded response for {request.url}", request=request)
+            self._count("hits")
+            return self._from_entry(entry, request)
+
+        if entry is not None:
+            validators = CaseInsensitiveDict(entry.get("headers") or {})
+            if validators.get("ETag"):
+                request.headers["If-None-Match"] = validators["ETag"]
+            if validators.get("Last-Modified"):
+                request.headers["If-Modified-Since"] = validators["Last-Modified"]
+
+        response = super().send(request, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            self._count("not_modified")
+            return self._from_entry(entry, request)
+
+        response.from_cache = False
+        response.content_hash = None
+        if response.status_code != 200:
+            return response
+        digest = content_hash(response.content)
+        response.content_hash = digest
+        if entry is not None and entry.get("content_hash") == digest:
+            self._count("unchanged")
+            response.from_cache = True
+            if not (response.headers.get("ETag") or response.headers.get("Last-Modified")):
+                return response
+        else:
+            self._count("misses")
+        # Also rewritten for an unchanged body so fresh validators are kept
+        self._store(path, request, response, digest)
+        return response
@@ -1,88 +1,270 @@
 # market_sync/match.py
-import hashlib
-import math
+import uuid
 import logging
-from typing import List, Dict, Tuple
-from .embeddings import EmbeddingCache, Embedder
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+from .ann import AnnStore, IVFIndex
+from .embeddings import Embedder
+from .metrics import METRICS, timed
+from .models import Bet, has_embedding_text
 from .repo import Repo
+from .config import COARSE_DIM, COARSE_SHORTLIST, QUANT_RESCORE_MARGIN
+from .vectors import (
+    DEFAULT_BLOCK_BYTES, QuantizedMatrix, SourceMatrix, ensure_projection, exact_scores, load_source_matrix,
+    matrix_for_bets, near_thresholds, project_source, quantize_source, topk_blocked, topk_quantized, topk_two_stage,
+)
 
 logger = logging.getLogger(__name__)
 
-def cosine(a: List[float], b: List[float]) -> float:
-    da = 0.0
-    db = 0.0
-    dot = 0.0
-    for x, y in zip(a, b):
-        dot += x * y
-        da += x * x
-        db += y * y
-    if da == 0.0 or db == 0.0:
-        return 0.0
-    return dot / math.sqrt(da * db)
+class _PendingWrites:
+    """Links, queued pairs and scored markers collected during one run and written in one transaction."""
 
-def propose_and_link(repo: Repo, embedder: Embedder, sources: List[str], high: float = 0.9, low: float = 0.83, max_pairs_per_new: int = 2000) -> Tuple[int, int]:
-    auto_links = 0
-    queued = 0
-    source_rows: Dict[str, List[tuple]] = {}
-    for s in sources:
-        logger.info("Gathering active bets for source=%s", s)
-        source_rows[s] = repo.fetch_active_bets_by_source(s)
+    def __init__(self, aliases: Dict[Tuple[str, str], str], high: float):
+        self.aliases = aliases
+        self.high = high
+        self.events: List[Tuple[str, Optional[str]]] = []
+        self.links: List[tuple] = []
+        self.pairs: List[tuple] = []
+        self.scored: List[Tuple[str, str, str]] = []
+        self.auto_links = 0
+        self.queued = 0
+
+    def consider(self, s: str, mid: str, title: str, thash: str, osrc: str, omid: str, ot: Optional[str], oth: str, sim: float):
+        if (osrc, omid) in self.aliases:
+            logger.debug("Skipping already-linked candidate %s:%s", osrc, omid)
+            return
+        logger.debug("sim(%s:%s, %s:%s)=%.4f", s, mid, osrc, omid, sim)
+        if sim >= self.high:
+            eid = self.aliases.get((s, mid))
+            if not eid:
+                eid = str(uuid.uuid4())
+                self.events.append((eid, title or ot))
+                self.links.append((eid, s, mid, thash, sim, None, "auto-sim"))
+                self.aliases[(s, mid)] = eid
+            self.links.append((eid, osrc, omid, oth, sim, None, "auto-sim"))
+            self.aliases[(osrc, omid)] = eid
+            self.auto_links += 1
+        else:
+            self.pairs.append((s, mid, osrc, omid, sim, "sim-threshold"))
+            self.queued += 1
+
+    def flush(self, repo: Repo, model: str) -> Tuple[int, int]:
+        repo.apply_match_results(self.events, self.links, self.pairs, self.scored, model)
+        METRICS.inc("auto_links", self.auto_links)
+        METRICS.inc("queued_pairs", self.queued)
+        return self.auto_links, self.queued
+
+def _unlinked_rows(m: SourceMatrix, aliases: Dict[Tuple[str, str], str], exclude: Optional[Set[str]] = None) -> List[int]:
+    return [
+        i for i, mid in enumerate(m.market_ids)
+        if (m.source, mid) not in aliases and not (exclude and mid in exclude)
+    ]
+
+def _topk(a: SourceMatrix, a_idx: np.ndarray, b: SourceMatrix, b_idx: np.ndarray, k: int, min_score: float, block_bytes: int, shortlist: int):
+    # Exhaustive, quantized or (when both sides carry coarse rows) two-stage top-k of a's rows against b's
+    whole = len(b_idx) == len(b)
+    queries = a.matrix.take(a_idx) if isinstance(a.matrix, QuantizedMatrix) else a.matrix[a_idx]
+    if isinstance(b.matrix, QuantizedMatrix):
+        corpus = b.matrix if whole else b.matrix.take(b_idx)
+    else:
+        corpus = b.matrix if whole else b.matrix[b_idx]
+    if a.coarse is not None and b.coarse is not None:
+        corpus_coarse = b.coarse if whole else b.coarse[b_idx]
+        return topk_two_stage(queries, corpus, a.coarse[a_idx], corpus_coarse, k, shortlist, min_score, block_bytes)
+    if isinstance(corpus, QuantizedMatrix):
+        return topk_quantized(queries, corpus, k, min_score=min_score, block_bytes=block_bytes)
+    return topk_blocked(queries, corpus, k, min_score=min_score, block_bytes=block_bytes)
+
+@timed("match_scoring")
+def _score(
+    a: SourceMatrix, a_rows: List[int], b: SourceMatrix, b_rows: List[int], pending: _PendingWrites,
+    low: float, k: int, block_bytes: int, shortlist: int = COARSE_SHORTLIST,
+):
+    if not a_rows or not b_rows:
+        return
+    METRICS.inc("pairs_scored", len(a_rows) * len(b_rows))
+    a_idx = np.asarray(a_rows, dtype=np.int64)
+    b_idx = np.asarray(b_rows, dtype=np.int64)
+    for qi, cols, sims in _topk(a, a_idx, b, b_idx, k, low, block_bytes, shortlist):
+        _consider_row(a, int(a_idx[qi]), b, b_idx, cols, sims, pending)
+
+def _consider_row(a: SourceMatrix, ai: int, b: SourceMatrix, b_idx: np.ndarray, cols: np.ndarray, sims: np.ndarray, pending: _PendingWrites):
+    mid, title, thash = a.market_ids[ai], a.titles[ai], a.hashes[ai]
+    METRICS.observe_many("similarity", sims)
+    for ci, sim in zip(cols.tolist(), sims.tolist()):
+        bi = int(b_idx[ci])
+        pending.consider(a.source, mid, title, thash, b.source, b.market_ids[bi], b.titles[bi], b.hashes[bi], sim)
+
+@timed("match_scoring")
+def _score_quantized(
+    a: SourceMatrix, a_rows: List[int], b: SourceMatrix, b_rows: List[int], pending: _PendingWrites,
+    low: float, k: int, block_bytes: int, embedder: Embedder, margin: float, shortlist: int = COARSE_SHORTLIST,
+):
+    """``_score`` against a quantized ``b``; candidates within ``margin`` of ``low``/``high`` are rescored exactly."""
+    if not a_rows or not b_rows:
+        return
+    METRICS.inc("pairs_scored", len(a_rows) * len(b_rows))
+    a_idx = np.asarray(a_rows, dtype=np.int64)
+    b_idx = np.asarray(b_rows, dtype=np.int64)
+    hits = list(_topk(a, a_idx, b, b_idx, k, low - margin, block_bytes, shortlist))
+    if not hits:
+        return
+    sims = np.concatenate([s for _, _, s in hits])
+    near = np.nonzero(near_thresholds(sims, (low, pending.high), margin))[0]
+    if len(near):
+        rows = np.concatenate([np.full(len(c), qi) for qi, c, _ in hits])[near]
+        cols = np.concatenate([c for _, c, _ in hits])[near]
+        exact = exact_scores(embedder, [a.hashes[a_idx[q]] for q in rows.tolist()], [b.hashes[b_idx[c]] for c in cols.tolist()])
+        found = ~np.isnan(exact)
+        sims[near[found]] = exact[found]
+    offset = 0
+    for qi, cols, _ in hits:
+        row = sims[offset : offset + len(cols)]
+        offset += len(cols)
+        keep = np.nonzero(row >= low)[0]
+        if not len(keep):
+            continue
+        keep = keep[np.argsort(-row[keep], kind="stable")]
+        _consider_row(a, int(a_idx[qi]), b, b_idx, cols[keep], row[keep], pending)
+
+@timed("match_scoring")
+def _score_ann(a: SourceMatrix, a_rows: List[int], osrc: str, index: IVFIndex, pending: _PendingWrites, low: float, k: int, nprobe: int, exclude: Optional[Set[str]] = None):
+    if not a_rows or not len(index):
+        return
+    ids = index.ids.tolist()
+    allowed = np.fromiter(
+        ((osrc, mid) not in pending.aliases and not (exclude and mid in exclude) for mid in ids),
+        dtype=bool,
+        count=len(ids),
+    )
+    a_idx = np.asarray(a_rows, dtype=np.int64)
+    for qi, rows, sims in index.search(a.matrix[a_idx], k, nprobe=nprobe, min_score=low, allowed=allowed):
+        ai = int(a_idx[qi])
+        mid, title, thash = a.market_ids[ai], a.titles[ai], a.hashes[ai]
+        METRICS.observe_many("similarity", sims)
+        for r, sim in zip(rows.tolist(), sims.tolist()):
+            pending.consider(a.source, mid, title, thash, osrc, ids[r], None, str(index.hashes[r]), sim)
+
+def propose_and_link(
+    repo: Repo,
+    embedder: Embedder,
+    sources: List[str],
+    high: float = 0.9,
+    low: float = 0.83,
+    max_pairs_per_new: int = 2000,
+    block_bytes: int = DEFAULT_BLOCK_BYTES,
+    ann: Optional[AnnStore] = None,
+    quantize: Optional[str] = None,
+    rescore_margin: float = QUANT_RESCORE_MARGIN,
+    coarse: Optional[str] = None,
+    coarse_dim: int = COARSE_DIM,
+    shortlist: int = COARSE_SHORTLIST,
+) -> Tuple[int, int]:
+    """Score every active bet against the other sources and auto-link / queue by threshold.
+
+    Each source is loaded once per pass as a normalized float32 matrix; only the
+    current pair of sources is held in memory. ``max_pairs_per_new`` caps the
+    candidates considered per bet and other source, taking the best scores first.
+    With ``ann`` the other sources are recalled from their IVF indexes instead of
+    being loaded and scored exhaustively. With ``quantize`` (``"int8"`` /
+    ``"float16"``) the matrices are held and scored in compact form, and scores
+    within ``rescore_margin`` of ``low`` or ``high`` are recomputed from the
+    full-precision vectors before deciding. With ``coarse`` (``"prefix"`` /
+    ``"pca"``) each bet first shortlists ``shortlist`` candidates on
+    ``coarse_dim``-dimensional projections (``ensure_projection``) and only those
+    are scored at full dimension, which also caps ``max_pairs_per_new`` at
+    ``shortlist``. ``quantize`` and ``coarse`` only apply without ``ann``.
+    """
+    if ann is not None and (quantize or coarse):
+        logger.warning("quantize=%s / coarse=%s ignored: the ANN index does the recall", quantize, coarse)
+    pending = _PendingWrites(repo.fetch_event_aliases(), high)
+    projection = ensure_projection(embedder, coarse, coarse_dim) if coarse and ann is None else None
     for s in sources:
         others = [x for x in sources if x != s]
-        logger.info("Matching for source=%s vs %s", s, ",".join(others))
-        for mid, title, description, url, thash in source_rows[s]:
-            if repo.get_event_for_bet(s, mid):
-                logger.debug("Skipping already-linked bet %s:%s", s, mid)
-                continue
-            a_text = "\n\n".join([title or "", description or ""]).strip()
-            if not a_text:
-                logger.debug("Skipping empty text for %s:%s", s, mid)
+        if not others:
+            continue
+        logger.info("Gathering active bets for source=%s", s)
+        a = quantize_source(project_source(load_source_matrix(repo, embedder, s), projection), None if ann is not None else quantize)
+        a_rows = _unlinked_rows(a, pending.aliases)
+        logger.info("Matching for source=%s (%d unlinked) vs %s", s, len(a_rows), ",".join(others))
+        if not a_rows:
+            continue
+        for osrc in others:
+            if ann is not None:
+                index = ann.ensure(repo, embedder, osrc)
+                _score_ann(a, a_rows, osrc, index, pending, low, max_pairs_per_new, ann.nprobe)
                 continue
-            a_hash = hashlib.sha256(a_text.encode("utf-8")).hexdigest()
-            a_vec = embedder.cache.get(a_hash, embedder.model)
-            if a_vec is None:
-                logger.debug("Embedding A %s:%s", s, mid)
-                a_vec = embedder.embed_text(a_text)
-            for osrc in others:
-                checked = 0
-                for omid, ot, od, ou, oth in source_rows[osrc]:
-                    if repo.get_event_for_bet(osrc, omid):
-                        logger.debug("Skipping already-linked candidate %s:%s", osrc, omid)
-                        continue
-                    b_text = "\n\n".join([ot or "", od or ""]).strip()
-                    if not b_text:
-                        logger.debug("Skipping empty candidate text %s:%s", osrc, omid)
-                        continue
-                    b_hash = hashlib.sha256(b_text.encode("utf-8")).hexdigest()
-                    b_vec = embedder.cache.get(b_hash, embedder.model)
-                    if b_vec is None:
-                        logger.debug("Embedding B %s:%s", osrc, omid)
-                        b_vec = embedder.embed_text(b_text)
-                    sim = cosine(a_vec, b_vec)
-                    logger.debug("sim(%s:%s, %s:%s)=%.4f", s, mid, osrc, omid, sim)
-                    if sim >= high:
-                        eida = repo.get_event_for_bet(s, mid)
-                        eidb = repo.get_event_for_bet(osrc, omid)
-                        if eida and eidb and eida == eidb:
-                            logger.debug("Already in same event: %s", eida)
-                        elif eida and not eidb:
-                            repo.link_bet_to_event(eida, osrc, omid, oth, sim, None, "auto-sim")
-                            auto_links += 1
-                        elif eidb and not eida:
-                            repo.link_bet_to_event(eidb, s, mid, thash, sim, None, "auto-sim")
-                            auto_links += 1
-                        else:
-                            eid = repo.create_event(title=title or ot)
-                            repo.link_bet_to_event(eid, s, mid, thash, sim, None, "auto-sim")
-                            repo.link_bet_to_event(eid, osrc, omid, oth, sim, None, "auto-sim")
-                            auto_links += 1
-                    elif sim >= low:
-                        repo.queue_pair(s, mid, osrc, omid, sim, "sim-threshold")
-                        queued += 1
-                    checked += 1
-                    if checked >= max_pairs_per_new:
-                        logger.info("Max pairs per new reached for %s:%s (limit=%d)", s, mid, max_pairs_per_new)
-                        break
+            b = quantize_source(project_source(load_source_matrix(repo, embedder, osrc), projection), quantize)
+            b_rows = _unlinked_rows(b, pending.aliases)
+            if quantize:
+                _score_quantized(a, a_rows, b, b_rows, pending, low, max_pairs_per_new, block_bytes, embedder, rescore_margin, shortlist)
+            else:
+                _score(a, a_rows, b, b_rows, pending, low, max_pairs_per_new, block_bytes, shortlist)
+        pending.scored.extend((s, a.market_ids[i], a.hashes[i]) for i in a_rows)
+    auto_links, queued = pending.flush(repo, embedder.model)
     logger.info("propose_and_link done: auto_links=%d queued=%d", auto_links, queued)
     return auto_links, queued
 
+def match_incremental(
+    repo: Repo,
+    embedder: Embedder,
+    new_or_changed: List[Bet],
+    sources: List[str],
+    high: float = 0.9,
+    low: float = 0.83,
+    max_pairs_per_new: int = 2000,
+    block_bytes: int = DEFAULT_BLOCK_BYTES,
+    ann: Optional[AnnStore] = None,
+    quantize: Optional[str] = None,
+    rescore_margin: float = QUANT_RESCORE_MARGIN,
+    coarse: Optional[str] = None,
+    coarse_dim: int = COARSE_DIM,
+    shortlist: int = COARSE_SHORTLIST,
+) -> Tuple[int, int]:
+    """Score only new or changed bets against the active candidates of the other sources.
+
+    Bets already scored with the same text hash (``match_state``) are skipped, so
+    pairs of unchanged bets are never re-scored. When both sides of a pair are new
+    in this run the pair is scored once, from the lexically smaller source.
+    ``quantize`` and ``coarse`` apply to the candidate matrices as in ``propose_and_link``.
+    """
+    if ann is not None and (quantize or coarse):
+        logger.warning("quantize=%s / coarse=%s ignored: the ANN index does the recall", quantize, coarse)
+    pending = _PendingWrites(repo.fetch_event_aliases(), high)
+    state = repo.fetch_match_state(embedder.model)
+    fresh: Dict[str, Dict[str, Bet]] = {}
+    for b in new_or_changed:
+        key = (b.source, b.market_id)
+        if key in pending.aliases or state.get(key) == b.text_hash or not has_embedding_text(b.title, b.description):
+            continue
+        fresh.setdefault(b.source, {})[b.market_id] = b
+    if not fresh:
+        logger.info("match_incremental: nothing new to score")
+        return 0, 0
+    projection = ensure_projection(embedder, coarse, coarse_dim) if coarse and ann is None else None
+    queries = {s: project_source(matrix_for_bets(embedder, s, list(items.values())), projection) for s, items in fresh.items()}
+    for osrc in sources:
+        targets = [s for s in queries if s != osrc]
+        if not targets:
+            continue
+        if ann is not None:
+            index = ann.ensure(repo, embedder, osrc)
+            for s in targets:
+                exclude = set(fresh.get(osrc, {})) if osrc < s else None
+                _score_ann(queries[s], list(range(len(queries[s]))), osrc, index, pending, low, max_pairs_per_new, ann.nprobe, exclude)
+            continue
+        b = quantize_source(project_source(load_source_matrix(repo, embedder, osrc), projection), quantize)
+        for s in targets:
+            a = queries[s]
+            exclude = set(fresh.get(osrc, {})) if osrc < s else None
+            b_rows = _unlinked_rows(b, pending.aliases, exclude)
+            logger.info("Incremental match source=%s (%d new) vs %s (%d candidates)", s, len(a), osrc, len(b_rows))
+            if quantize:
+                _score_quantized(a, list(range(len(a))), b, b_rows, pending, low, max_pairs_per_new, block_bytes, embedder, rescore_margin, shortlist)
+            else:
+                _score(a, list(range(len(a))), b, b_rows, pending, low, max_pairs_per_new, block_bytes, shortlist)
+    for s, a in queries.items():
+        pending.scored.extend(zip([s] * len(a), a.market_ids, a.hashes))
+    auto_links, queued = pending.flush(repo, embedder.model)
+    logger.info("match_incremental done: auto_links=%d queued=%d", auto_links, queued)
+    return auto_links, queued
@@ -0,0 +1,264 @@
+# market_sync/metrics.py
+import json
+import time
+import functools
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from .config import METRICS_PATH, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "market_sync_"
+# Upper bounds (Prometheus ``le``) per histogram; anything larger lands in +Inf
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+HTTP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+# Dense around the matcher's low/high thresholds (0.83 / 0.90)
+SIMILARITY_BUCKETS = (0.5, 0.6, 0.7, 0.75, 0.8, 0.83, 0.85, 0.87, 0.9, 0.92, 0.95, 0.97, 0.99, 1.0)
+BUCKETS = {
+    "stage_seconds": STAGE_BUCKETS,
+    "http_latency_seconds": HTTP_BUCKETS,
+    "similarity": SIMILARITY_BUCKETS,
+}
+
+_NULL = nullcontext()
+Labels = Tuple[Tuple[str, str], ...]
+
+class _Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def observe_many(self, values: np.ndarray):
+        idx = np.searchsorted(self.bounds, values, side="left")
+        for i, n in enumerate(np.bincount(idx, minlength=len(self.counts)).tolist()):
+            self.counts[i] += n
+        self.sum += float(values.sum())
+        self.count += int(values.size)
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        out, total = [], 0
+        for bound, n in zip(self.bounds + (float("inf"),), self.counts):
+            total += n
+            out.append((bound, total))
+        return out
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Linear interpolation within the bucket holding rank ``q`` (as ``histogram_quantile`` does)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower, below = 0.0, 0
+        for bound, total in self.cumulative():
+            if total >= rank:
+                if bound == float("inf"):
+                    return self.bounds[-1] if self.bounds else None
+                inside = total - below
+                return lower + (bound - lower) * ((rank - below) / inside if inside else 1.0)
+            lower, below = bound, total
+        return None
+
+class _Timer:
+    __slots__ = ("metrics", "labels", "start")
+
+    def __init__(self, metrics: "Metrics", labels: Labels):
+        self.metrics = metrics
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics._observe("stage_seconds", self.labels, time.perf_counter() - self.start)
+
+class Metrics:
+    """Process-wide counters and histograms, cheap no-ops while disabled.
+
+    Call sites use the shared ``METRICS`` instance:
+
+      - ``timer(stage)``: context manager adding the elapsed seconds to
+        ``stage_seconds{stage=...}``. Stages nest (``upsert`` includes its ``db_commit``).
+      - ``inc(name, n)``: monotonically increasing counters (``cache_hits``, ``tokens_sent``, ...).
+      - ``observe(name, value)`` / ``observe_many(name, values)``: fixed-bucket
+        histograms, bounds from ``BUCKETS``.
+
+    ``to_prometheus`` and ``snapshot`` export everything; ``write`` saves either to a
+    file and ``serve`` exposes both on a local HTTP port. Disabled, every call is a
+    flag check, and ``timer`` returns a shared null context.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], _Histogram] = {}
+        self.started_at = time.time()
+
+    def enable(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started_at = time.time()
+
+    def timer(self, stage: str):
+        if not self.enabled:
+            return _NULL
+        return _Timer(self, (("stage", stage),))
+
+    def inc(self, name: str, n: float = 1, **labels):
+        if not self.enabled or not n:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def observe(self, name: str, value: float, **labels):
+        if self.enabled:
+            self._observe(name, tuple(sorted(labels.items())), value)
+
+    def observe_many(self, name: str, values, **labels):
+        if not self.enabled:
+            return
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not values.size:
+            return
+        with self._lock:
+            self._histogram(name, tuple(sorted(labels.items()))).observe_many(values)
+
+    def _observe(self, name: str, labels: Labels, value: float):
+        with self._lock:
+            self._histogram(name, labels).observe(value)
+
+    def _histogram(self, name: str, labels: Labels) -> _Histogram:
+        # Caller holds the lock
+        h = self._histograms.get((name, labels))
+        if h is None:
+            h = self._histograms[(name, labels)] = _Histogram(BUCKETS.get(name, STAGE_BUCKETS))
+        return h
+
+    def snapshot(self) -> dict:
+        """JSON-ready view: counters by name, histograms with count/sum/p50/p99 and cumulative buckets."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (h.cumulative(), h.sum, h.count, h.quantile(0.5), h.quantile(0.99))) for key, h in self._histograms.items())
+        out = {"started_at": int(self.started_at), "counters": {}, "histograms": {}}
+        for (name, labels), value in counters:
+            out["counters"].setdefault(name, []).append({"labels": dict(labels), "value": value})
+        for (name, labels), (cumulative, total, count, p50, p99) in histograms:
+            out["histograms"].setdefault(name, []).append({
+                "labels": dict(labels), "count": count, "sum": round(total, 6),
+                "p50": None if p50 is None else round(p50, 6), "p99": None if p99 is None else round(p99, 6),
+                "buckets": [["+Inf" if b == float("inf") else b, n] for b, n in cumulative],
+            })
+        return out
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (0.0.4); counters get the ``_total`` suffix."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (h.cumulative(), h.sum, h.count)) for key, h in self._histograms.items())
+        lines: List[str] = []
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}{name}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_labels(labels)} {_number(value)}")
+        for (name, labels), (cumulative, total, count) in histograms:
+            metric = f"{PREFIX}{name}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            for bound, n in cumulative:
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{metric}_bucket{_labels(labels + (('le', le),))} {n}")
+            lines.append(f"{metric}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{metric}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """Save to ``path``: JSON when it ends in ``.json``, Prometheus text otherwise."""
+        text = json.dumps(self.snapshot(), indent=1) if path.endswith(".json") else self.to_prometheus()
+        with open(path, "w") as f:
+            f.write(text)
+        logger.info("Metrics written to %s", path)
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serve ``/metrics`` (Prometheus) and ``/metrics.json`` from a daemon thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/metrics.json":
+                    body, ctype = json.dumps(metrics.snapshot()).encode(), "application/json"
+                elif path in ("/", "/metrics"):
+                    body, ctype = metrics.to_prometheus().encode(), "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                logger.debug("metrics http: " + fmt, *args)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info("Serving metrics on http://%s:%d/metrics", host, server.server_port)
+        return server
+
+def _labels(labels: Iterable[Tuple[str, str]]) -> str:
+    parts = []
+    for k, v in labels:
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+METRICS = Metrics(enabled=bool(METRICS_PATH or METRICS_PORT))
+
+def export_run():
+    """Write ``METRICS_PATH`` if configured; called by the entry points once a run finished."""
+    if METRICS.enabled and METRICS_PATH:
+        METRICS.write(METRICS_PATH)
+
+def timed(stage: str):
+    """Decorator form of ``METRICS.timer(stage)``; a disabled registry adds one flag check per call."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not METRICS.enabled:
+                return fn(*args, **kwargs)
+            with METRICS.timer(stage):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+def start_server() -> Optional[ThreadingHTTPServer]:
+    """Start the ``METRICS_PORT`` endpoint if configured."""
+    return METRICS.serve(METRICS_PORT) if METRICS.enabled and METRICS_PORT else None
@@ -1,11 +1,32 @@
 # market_sync/models.py
 from dataclasses import dataclass, field
-from typing import Optional, List
+from typing import Iterable, Iterator, List, Optional, Sequence
 import hashlib
 import logging
+from .config import EMBED_MAX_TEXT_TOKENS
+from .tokens import truncate_to_tokens
 
 logger = logging.getLogger(__name__)
 
+def prepare_text(text: str) -> str:
+    """Cut ``text`` to ``EMBED_MAX_TEXT_TOKENS``; the one truncation both bet hashes and ``Embedder`` use."""
+    return truncate_to_tokens(text, EMBED_MAX_TEXT_TOKENS)
+
+def embedding_text(title: Optional[str], description: Optional[str]) -> str:
+    desc = (description or "").strip()
+    pieces = [(title or "").strip()]
+    if desc:
+        pieces.append(desc)
+    # Truncated before hashing so text_hash always keys the text actually embedded
+    return prepare_text("\n\n".join(pieces))
+
+def has_embedding_text(title: Optional[str], description: Optional[str]) -> bool:
+    """Whether ``embedding_text`` would be non-empty, without building it."""
+    return bool((title or "").strip() or (description or "").strip())
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
 @dataclass(slots=True)
 class Bet:
     source: str
@@ -21,19 +42,129 @@ class Bet:
     embedding: Optional[List[float]] = None
 
     def __post_init__(self):
-        desc = (self.description or "").strip()
-        pieces = [self.title.strip()]
-        if desc:
-            pieces.append(desc)
-        self.text_for_embedding = "\n\n".join(pieces)
-        self.text_hash = hashlib.sha256(self.text_for_embedding.encode("utf-8")).hexdigest()
-        logger.debug(
-            "Bet init: source=%s market_id=%s slug=%s title_len=%d desc_len=%d text_hash=%s",
-            self.source,
-            self.market_id,
-            self.slug,
-            len(self.title or ""),
-            len(self.description or ""),
-            self.text_hash,
+        self.text_for_embedding = embedding_text(self.title, self.description)
+        self.text_hash = text_digest(self.text_for_embedding)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Bet init: source=%s market_id=%s slug=%s title_len=%d desc_len=%d text_hash=%s",
+                self.source,
+                self.market_id,
+                self.slug,
+                len(self.title or ""),
+                len(self.description or ""),
+                self.text_hash,
+            )
+
+class BetBatch:
+    """Columnar bets of one source for the bulk fetch -> sync -> match path.
+
+    Columns are parallel lists. Each text hash is computed once, at construction;
+    the embedding text itself is not stored and is rebuilt on demand (only cache
+    misses need it). Raw payloads are kept only when ``raws`` is given. Indexing
+    and iteration yield ``BetRow`` views that read like ``Bet``.
+    """
+
+    __slots__ = ("source", "market_ids", "slugs", "titles", "descriptions", "urls", "close_times", "text_hashes", "raws")
+
+    def __init__(
+        self,
+        source: str,
+        market_ids: List[str],
+        slugs: List[Optional[str]],
+        titles: List[str],
+        descriptions: List[Optional[str]],
+        urls: List[Optional[str]],
+        close_times: List[Optional[str]],
+        raws: Optional[List[dict]] = None,
+        text_hashes: Optional[List[str]] = None,
+    ):
+        self.source = source
+        self.market_ids = market_ids
+        self.slugs = slugs
+        self.titles = titles
+        self.descriptions = descriptions
+        self.urls = urls
+        self.close_times = close_times
+        self.raws = raws
+        if text_hashes is None:
+            text_hashes = [text_digest(embedding_text(t, d)) for t, d in zip(titles, descriptions)]
+        self.text_hashes = text_hashes
+
+    @classmethod
+    def from_bets(cls, bets: Iterable[Bet], keep_raw: bool = False) -> "BetBatch":
+        bets = list(bets)
+        return cls(
+            bets[0].source if bets else "",
+            [b.market_id for b in bets], [b.slug for b in bets], [b.title for b in bets],
+            [b.description for b in bets], [b.url for b in bets], [b.close_time for b in bets],
+            raws=[b.raw for b in bets] if keep_raw else None,
+            text_hashes=[b.text_hash for b in bets],
         )
 
+    def __len__(self) -> int:
+        return len(self.market_ids)
+
+    def __getitem__(self, i: int) -> "BetRow":
+        if i < 0:
+            i += len(self.market_ids)
+        if not 0 <= i < len(self.market_ids):
+            raise IndexError(i)
+        return BetRow(self, i)
+
+    def __iter__(self) -> Iterator["BetRow"]:
+        return (BetRow(self, i) for i in range(len(self.market_ids)))
+
+    def text(self, i: int) -> str:
+        return embedding_text(self.titles[i], self.descriptions[i])
+
+    def take(self, rows: Sequence[int]) -> "BetBatch":
+        """Subset by row positions, reusing the computed hashes."""
+        pick = lambda col: [col[i] for i in rows]
+        return BetBatch(
+            self.source, pick(self.market_ids), pick(self.slugs), pick(self.titles), pick(self.descriptions),
+            pick(self.urls), pick(self.close_times),
+            raws=pick(self.raws) if self.raws is not None else None,
+            text_hashes=pick(self.text_hashes),
+        )
+
+    def to_bets(self) -> List[Bet]:
+        return [row.to_bet() for row in self]
+
+def _column(name: str) -> property:
+    return property(lambda self: getattr(self._batch, name)[self._i])
+
+class BetRow:
+    """Read-only ``Bet``-compatible view of one ``BetBatch`` row."""
+
+    __slots__ = ("_batch", "_i")
+    embedding = None
+
+    def __init__(self, batch: BetBatch, i: int):
+        self._batch = batch
+        self._i = i
+
+    market_id = _column("market_ids")
+    slug = _column("slugs")
+    title = _column("titles")
+    description = _column("descriptions")
+    url = _column("urls")
+    close_time = _column("close_times")
+    text_hash = _column("text_hashes")
+
+    @property
+    def source(self) -> str:
+        return self._batch.source
+
+    @property
+    def raw(self) -> dict:
+        return self._batch.raws[self._i] if self._batch.raws is not None else {}
+
+    @property
+    def text_for_embedding(self) -> str:
+        return self._batch.text(self._i)
+
+    def to_bet(self) -> Bet:
+        return Bet(self.source, self.market_id, self.slug, self.title, self.description, self.url, self.close_time, raw=self.raw)
+
+    def __repr__(self) -> str:
+        return f"BetRow(source={self.source!r}, market_id={self.market_id!r}, title={self.title!r})"
@@ -0,0 +1,130 @@
+# market_sync/neighbors.py
+import logging
+from typing import Dict, Iterable, List, Set, Tuple
+import numpy as np
+from .config import NEIGHBORS_FLOOR, NEIGHBORS_K
+from .vectors import DEFAULT_BLOCK_BYTES, SourceMatrix, load_source_matrix, matrix_from_rows, topk_blocked
+
+logger = logging.getLogger(__name__)
+
+class NeighborTable:
+    """Materialized top-k cross-source neighbours in ``bet_neighbors``.
+
+    Lists are keyed by ``(model, source, text_hash)`` of the owning bet and hold
+    up to ``k`` active bets from other sources with similarity >= ``floor``.
+    ``apply_sync`` has the same shape as ``AnnStore.apply_sync`` and keeps the
+    table current after each sync:
+
+      - entries pointing at changed or closed bets are dropped, and their owners
+        are recomputed;
+      - new, changed and reopened bets (and any active bet without a list) get a
+        fresh list and are merged into the lists of the bets they now outrank.
+    """
+
+    def __init__(self, k: int = NEIGHBORS_K, floor: float = NEIGHBORS_FLOOR, block_bytes: int = DEFAULT_BLOCK_BYTES):
+        self.k = k
+        self.floor = floor
+        self.block_bytes = block_bytes
+
+    def apply_sync(self, repo, embedder, source: str, upserted: List, removed_ids: Iterable[str]):
+        model = embedder.model
+        upserted = list(upserted)
+        dropped = repo.drop_neighbors_to(model, [(source, b.market_id) for b in upserted] + [(source, mid) for mid in removed_ids])
+        self.refresh(repo, embedder, fresh={(source, b.text_hash) for b in upserted}, dirty=set(dropped))
+
+    def rebuild(self, repo, embedder):
+        repo.conn.execute("DELETE FROM bet_neighbors WHERE model=?", (embedder.model,))
+        repo.conn.execute("DELETE FROM bet_neighbor_state WHERE model=?", (embedder.model,))
+        repo.conn.commit()
+        self.refresh(repo, embedder)
+
+    def refresh(self, repo, embedder, fresh: Set[Tuple[str, str]] = frozenset(), dirty: Set[Tuple[str, str]] = frozenset()):
+        """Recompute lists for ``fresh`` and ``dirty`` owners; merge ``fresh`` ones into other lists.
+
+        Active bets that have no list yet are treated as fresh, so the first call
+        after a model or schema change builds the whole table. Vectors are only
+        loaded when something needs recomputing: in full for sources that serve
+        as another source's corpus, and only the affected rows otherwise.
+        """
+        model = embedder.model
+        sources = repo.list_active_sources()
+        if len(sources) < 2:
+            # Nothing cross-source to list; lists get built once a second source syncs
+            repo.prune_neighbors(model)
+            return
+        owners = repo.fetch_neighbor_owners(model)
+        active = {(s, h) for s in sources for h in repo.fetch_active_hashes(s).values()}
+        fresh = (set(fresh) | (active - owners.keys())) & active
+        dirty = (set(dirty) - fresh) & active
+        if not fresh and not dirty:
+            repo.prune_neighbors(model)
+            return
+
+        changed = {s for s, _ in fresh | dirty}
+        mats = {
+            s: load_source_matrix(repo, embedder, s) if changed - {s} else self._owner_rows(repo, embedder, s, fresh | dirty)
+            for s in sources
+        }
+        lists: Dict[Tuple[str, str], List[Tuple[str, str, float]]] = {}
+        additions: List[Tuple[str, str, str, str, float]] = []
+        for src, m in mats.items():
+            others = [o for s, o in mats.items() if s != src and len(o)]
+            rows = _rows_for(m, {h for s, h in fresh | dirty if s == src})
+            for h in {m.hashes[r] for r in rows}:
+                lists[(src, h)] = []
+            if not rows or not others:
+                continue
+            corpus = np.concatenate([o.matrix for o in others]) if len(others) > 1 else others[0].matrix
+            ids = [(o.source, mid) for o in others for mid in o.market_ids]
+            for qi, cols, scores in topk_blocked(m.matrix[rows], corpus, self.k, self.floor, self.block_bytes):
+                lists[(src, m.hashes[rows[qi]])] = [ids[c] + (float(sc),) for c, sc in zip(cols.tolist(), scores.tolist())]
+        for src, m in mats.items():
+            additions.extend(self._outranked(m, _rows_for(m, {h for s, h in fresh if s == src}), mats, owners, lists))
+
+        repo.write_neighbors(model, lists, additions, self.k)
+        pruned = repo.prune_neighbors(model)
+        logger.info(
+            "Neighbours refreshed for model=%s: lists=%d merged=%d pruned=%d",
+            model, len(lists), len(additions), pruned,
+        )
+
+    @staticmethod
+    def _owner_rows(repo, embedder, source: str, owners: Set[Tuple[str, str]]) -> SourceMatrix:
+        # Only queried, never scanned: the rows of this source's affected owners
+        wanted = {h for s, h in owners if s == source}
+        hashes = {mid: h for mid, h in repo.fetch_active_hashes(source).items() if h in wanted}
+        rows = repo.fetch_bets_by_ids(source, list(hashes))
+        return matrix_from_rows(embedder, source, [(mid, title, desc, hashes[mid]) for _, mid, _, title, desc, _, _ in rows])
+
+    def _outranked(self, m: SourceMatrix, rows: List[int], mats: Dict[str, SourceMatrix], owners, lists) -> List[tuple]:
+        """Entries for fresh bets of ``m`` that beat an existing list's current cut-off."""
+        out = []
+        if not rows:
+            return out
+        queries = m.matrix[rows]
+        for t, o in mats.items():
+            if t == m.source or not len(o):
+                continue
+            thresholds = np.empty(len(o), dtype=np.float32)
+            for j, h in enumerate(o.hashes):
+                if (t, h) in lists:
+                    thresholds[j] = np.inf  # recomputed from scratch above
+                    continue
+                count, low = owners.get((t, h), (0, -1.0))
+                thresholds[j] = self.floor if count < self.k else max(self.floor, low)
+            block_rows = max(1, self.block_bytes // (len(o) * 4))
+            for start in range(0, len(rows), block_rows):
+                scores = queries[start : start + block_rows] @ o.matrix.T
+                for qi, j in zip(*np.nonzero(scores >= thresholds[None, :])):
+                    out.append((t, o.hashes[j], m.source, m.market_ids[rows[start + qi]], float(scores[qi, j])))
+        return out
+
+def _rows_for(m: SourceMatrix, hashes: Set[str]) -> List[int]:
+    # One row per distinct hash; bets sharing a text share a list
+    seen: Set[str] = set()
+    rows = []
+    for r, h in enumerate(m.hashes):
+        if h in hashes and h not in seen:
+            seen.add(h)
+            rows.append(r)
+    return rows
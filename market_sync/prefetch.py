@@ -0,0 +1,145 @@
+# market_sync/prefetch.py
+import time
+import heapq
+import logging
+import itertools
+import threading
+from typing import Callable, Dict, Hashable, Iterable, List, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first
+VISIBLE = 0
+CANDIDATE = 1
+
+class EmbeddingPrefetcher:
+    """Background embedding of texts a UI is about to need, in priority order.
+
+    ``submit`` queues ``(hash, text)`` pairs; a daemon thread embeds them in batches
+    through ``embedder.embed_hashed``, skipping whatever is cached by then. A hash
+    is queued at most once: resubmitting only raises its priority, and hashes in
+    flight are skipped. ``get`` serves one text from the cache, waits for an
+    in-flight batch that holds it, or embeds it on the spot with the caller's embedder.
+
+    Give it its own ``Embedder`` (and connection): only the worker uses it, writing
+    the cache from its own thread.
+    """
+
+    def __init__(self, embedder, batch_size: int = 64, wait_timeout: float = 30.0, retry_delay: float = 2.0):
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.wait_timeout = wait_timeout
+        self.retry_delay = retry_delay
+        self._heap: List[Tuple[int, int, str]] = []
+        self._queued: Dict[str, Tuple[int, str]] = {}  # hash -> (best priority, text)
+        self._in_flight: Dict[str, threading.Event] = {}
+        self._submitted: Dict[int, Hashable] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.stats = {"submitted": 0, "embedded": 0, "hits": 0, "misses": 0, "waited": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, name="embed-prefetch", daemon=True)
+        self._thread.start()
+
+    def submit(self, items: Iterable[Tuple[str, str]], priority: int = CANDIDATE) -> int:
+        """Queue ``(hash, text)`` pairs; returns how many were added or promoted."""
+        added = 0
+        with self._cond:
+            for h, text in items:
+                if not text or h in self._in_flight:
+                    continue
+                queued = self._queued.get(h)
+                if queued is not None and queued[0] <= priority:
+                    continue
+                # The old heap entry (if any) goes stale and is skipped when popped
+                self._queued[h] = (priority, text)
+                heapq.heappush(self._heap, (priority, next(self._seq), h))
+                added += 1
+            if added:
+                self.stats["submitted"] += added
+                self._cond.notify()
+        return added
+
+    def submit_once(self, version: Hashable, items: Callable[[], Iterable[Tuple[str, str]]], priority: int = CANDIDATE) -> int:
+        """``submit(items(), priority)`` unless ``version`` was the last one submitted at this priority.
+
+        For expensive item sets (e.g. every unembedded candidate) that only change
+        with the data, such as when a sync generation moves.
+        """
+        with self._cond:
+            if self._submitted.get(priority) == version:
+                return 0
+            self._submitted[priority] = version
+        return self.submit(items(), priority)
+
+    def depth(self) -> Tuple[int, int]:
+        """``(queued, in_flight)`` hash counts."""
+        with self._cond:
+            return len(self._queued), len(self._in_flight)
+
+    def get(self, hash_: str, text: str, embedder) -> np.ndarray:
+        """Vector for ``text``: cached, from an in-flight prefetch, or embedded now (counted as a miss).
+
+        Runs on the caller's thread, so lookups and the fallback embed go through the
+        caller's ``embedder``; the prefetcher's own connection stays with its worker.
+        """
+        model = embedder.model
+        vec = embedder.cache.get(hash_, model)
+        if vec is not None:
+            self._count("hits")
+            return vec
+        with self._cond:
+            event = self._in_flight.get(hash_)
+            # Taken out of the queue so the worker doesn't embed it a second time
+            self._queued.pop(hash_, None)
+        if event is not None and event.wait(self.wait_timeout):
+            vec = embedder.cache.get(hash_, model)
+            if vec is not None:
+                self._count("waited")
+                return vec
+        self._count("misses")
+        return embedder.embed_hashed([hash_], [text])[0]
+
+    def _count(self, key: str, n: int = 1):
+        with self._cond:
+            self.stats[key] += n
+
+    def _next_batch(self) -> List[Tuple[str, str]]:
+        with self._cond:
+            while not self._queued:
+                self._cond.wait()
+            batch = []
+            while self._heap and len(batch) < self.batch_size:
+                priority, _, h = heapq.heappop(self._heap)
+                queued = self._queued.get(h)
+                if queued is None or queued[0] != priority:
+                    continue
+                del self._queued[h]
+                self._in_flight[h] = threading.Event()
+                batch.append((h, queued[1]))
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            hashes = [h for h, _ in batch]
+            failed = False
+            try:
+                cached = self.embedder.cache.get_many(hashes, self.embedder.model)
+                todo = [(h, t) for h, t in batch if h not in cached]
+                if todo:
+                    self.embedder.embed_hashed([h for h, _ in todo], [t for _, t in todo])
+                    self._count("embedded", len(todo))
+            except Exception as e:
+                # Dropped, not retried: a click on one of them embeds it synchronously
+                logger.warning("Prefetch batch of %d failed: %s", len(batch), e)
+                self._count("errors")
+                failed = True
+            finally:
+                with self._cond:
+                    for h in hashes:
+                        self._in_flight.pop(h).set()
+            if failed:
+                time.sleep(self.retry_delay)
@@ -0,0 +1,58 @@
+# market_sync/ratelimit.py
+import time
+import threading
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class _Bucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        # Requests larger than the whole bucket are let through once it is full.
+        need = min(amount, self.capacity) - self.level
+        return max(0.0, need / self.rate)
+
+class RateLimiter:
+    """Token-bucket limiter for requests-per-minute and tokens-per-minute, shared across threads.
+
+    Either limit may be None to leave that dimension unbounded.
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self._requests = _Bucket(rpm) if rpm else None
+        self._tokens = _Bucket(tpm) if tpm else None
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def acquire(self, tokens: int = 0):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._paused_until - now
+                for bucket, amount in ((self._requests, 1), (self._tokens, tokens)):
+                    if bucket is not None:
+                        bucket.refill(now)
+                        wait = max(wait, bucket.wait_for(amount))
+                if wait <= 0:
+                    if self._requests is not None:
+                        self._requests.level -= 1
+                    if self._tokens is not None:
+                        self._tokens.level -= min(tokens, self._tokens.capacity)
+                    return
+            logger.debug("Rate limiter waiting %.2fs (tokens=%d)", wait, tokens)
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hold every caller for ``seconds``, e.g. after the provider answered 429 with Retry-After."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
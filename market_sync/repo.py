@@ -1,14 +1,27 @@
 # market_sync/repo.py
+import re
 import hashlib
-from typing import Optional, Tuple, Iterable, List
+from typing import Dict, Optional, Set, Tuple, Iterable, List
 import uuid
 import logging
+from .db import has_fts
+from .metrics import METRICS, timed
+from .models import BetBatch
 from .util import now_ts
 
 logger = logging.getLogger(__name__)
+
+# Keeps IN lists under SQLite's default host-parameter limit
+LOOKUP_CHUNK = 500
+_FTS_WORD = re.compile(r"\w+", re.UNICODE)
 class Repo:
     def __init__(self, conn):
         self.conn = conn
+        self._fts: Optional[bool] = None
+
+    def _commit(self):
+        with METRICS.timer("db_commit"):
+            self.conn.commit()
 
     def get_existing_bet(self, source: str, market_id: str) -> Optional[Tuple]:
         logger.debug("Fetching existing bet: %s:%s", source, market_id)
@@ -18,6 +31,7 @@ class Repo:
         ).fetchone()
         return row
 
+    @timed("upsert")
     def upsert_bet(self, b) -> Tuple[bool, bool]:
         existing = self.get_existing_bet(b.source, b.market_id)
         now = now_ts()
@@ -30,7 +44,7 @@ class Repo:
                 """,
                 (b.source, b.market_id, b.slug, b.title, b.description, b.url, b.close_time, b.text_hash, 1, now, now, None),
             )
-            self.conn.commit()
+            self._commit()
             return True, True
         changed = existing[2] != b.text_hash
         logger.info("Updating bet: %s:%s changed=%s", b.source, b.market_id, changed)
@@ -41,62 +55,220 @@ class Repo:
             """,
             (b.slug, b.title, b.description, b.url, b.close_time, b.text_hash, now, b.source, b.market_id),
         )
-        self.conn.commit()
+        self._commit()
         return False, changed
 
+    @timed("upsert")
+    def upsert_bets(self, bets: Iterable) -> List[Tuple[bool, bool]]:
+        """Bulk variant of ``upsert_bet``: one read per source, one write transaction.
+
+        Returns ``(is_new, is_changed)`` per input bet, in order. Rows whose stored
+        fields already match are not rewritten, so ``last_seen_at`` is when a row was
+        inserted or last changed rather than last fetched. Unlike ``upsert_bet`` this
+        leaves ``is_active`` of existing rows alone; ``apply_lifecycle`` reopens them.
+        """
+        rows = self._bet_fields(bets)
+        now = now_ts()
+        existing = {}
+        by_source: Dict[str, List[str]] = {}
+        for source, mid, _ in rows:
+            by_source.setdefault(source, []).append(mid)
+        # Only the incoming IDs are read, so per-page calls from sync_stream stay cheap
+        for source, mids in by_source.items():
+            for start in range(0, len(mids), LOOKUP_CHUNK):
+                part = mids[start : start + LOOKUP_CHUNK]
+                for row in self.conn.execute(
+                    f"""
+                    SELECT market_id, slug, title, description, url, close_time, text_hash FROM bets
+                    WHERE source=? AND market_id IN ({",".join("?" * len(part))})
+                    """,
+                    [source, *part],
+                ):
+                    existing[(source, row[0])] = row[1:]
+        inserts = []
+        updates = []
+        results: List[Tuple[bool, bool]] = []
+        for source, mid, fields in rows:
+            prev = existing.get((source, mid))
+            existing[(source, mid)] = fields
+            if prev is None:
+                logger.debug("Inserting new bet: %s:%s title=%r", source, mid, fields[1])
+                inserts.append((source, mid) + fields + (1, now, now, None))
+                results.append((True, True))
+                continue
+            changed = prev[5] != fields[5]
+            if prev != fields:
+                logger.debug("Updating bet: %s:%s changed=%s", source, mid, changed)
+                updates.append(fields + (now, source, mid))
+            results.append((False, changed))
+        if inserts:
+            self.conn.executemany(
+                """
+                INSERT INTO bets(source, market_id, slug, title, description, url, close_time, text_hash, is_active, first_seen_at, last_seen_at, inactive_at)
+                VALUES(?,?,?,?,?,?,?,?,?,?,?,?)
+                """,
+                inserts,
+            )
+            self.conn.executemany(
+                "INSERT INTO bet_lifecycle(source, market_id, transition, at) VALUES(?,?,?,?)",
+                [(r[0], r[1], "opened", now) for r in inserts],
+            )
+        if updates:
+            self.conn.executemany(
+                """
+                UPDATE bets SET slug=?, title=?, description=?, url=?, close_time=?, text_hash=?, last_seen_at=?
+                WHERE source=? AND market_id=?
+                """,
+                updates,
+            )
+        self._commit()
+        METRICS.inc("bets_inserted", len(inserts))
+        METRICS.inc("bets_updated", len(updates))
+        logger.info("upsert_bets: inserted=%d updated=%d skipped=%d", len(inserts), len(updates), len(rows) - len(inserts) - len(updates))
+        return results
+
+    @staticmethod
+    def _bet_fields(bets) -> List[Tuple[str, str, tuple]]:
+        """``(source, market_id, (slug, title, description, url, close_time, text_hash))`` per bet."""
+        if isinstance(bets, BetBatch):
+            columns = zip(bets.slugs, bets.titles, bets.descriptions, bets.urls, bets.close_times, bets.text_hashes)
+            return [(bets.source, mid, fields) for mid, fields in zip(bets.market_ids, columns)]
+        return [(b.source, b.market_id, (b.slug, b.title, b.description, b.url, b.close_time, b.text_hash)) for b in bets]
+
     def mark_inactive_except(self, source: str, active_ids: Iterable[str]) -> int:
-        """Mark all rows for a source inactive, except the provided active IDs.
+        """Mark rows for a source inactive, except the provided active IDs. Returns the number closed."""
+        closed, _ = self.apply_lifecycle(source, active_ids)
+        return len(closed)
+
+    @timed("lifecycle")
+    def apply_lifecycle(self, source: str, seen_ids: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """Close active rows that were not seen and reopen inactive rows that were.
 
-        Avoids SQLite's ~999 parameter limit by:
-        - Computing the number to be inactivated without huge NOT IN lists
-        - Blanket deactivating, then reactivating in chunks
+        The seen IDs go into a temp table so the set difference runs in SQL without
+        parameter limits. Only rows whose state flips are written, and each flip is
+        appended to ``bet_lifecycle``. Returns ``(closed_ids, reopened_ids)``.
         """
         now = now_ts()
-        ids = list(active_ids)
-
-        # Compute count of rows that will be inactivated (for return value)
-        if ids:
-            total_active = self.conn.execute(
-                "SELECT COUNT(*) FROM bets WHERE source=? AND is_active=1",
-                (source,),
-            ).fetchone()[0]
-
-            count_active_seen = 0
-            for i in range(0, len(ids), 500):
-                chunk = ids[i : i + 500]
-                placeholders = ",".join("?" * len(chunk))
-                sql = (
-                    f"SELECT COUNT(*) FROM bets WHERE source=? AND is_active=1 "
-                    f"AND market_id IN ({placeholders})"
-                )
-                count_active_seen += self.conn.execute(sql, [source] + chunk).fetchone()[0]
-            to_inactivate_count = max(total_active - count_active_seen, 0)
-        else:
-            to_inactivate_count = self.conn.execute(
-                "SELECT COUNT(*) FROM bets WHERE source=? AND is_active=1",
-                (source,),
-            ).fetchone()[0]
-
-        # 1) Mark all active as inactive for this source
-        logger.info("Blanket deactivating active bets for source=%s", source)
+        cur = self.conn.cursor()
+        cur.execute("CREATE TEMP TABLE IF NOT EXISTS seen_market_ids (market_id TEXT PRIMARY KEY)")
+        cur.execute("DELETE FROM temp.seen_market_ids")
+        cur.executemany("INSERT OR IGNORE INTO temp.seen_market_ids(market_id) VALUES(?)", ((mid,) for mid in seen_ids))
+        closed = [r[0] for r in cur.execute(
+            """
+            SELECT market_id FROM bets
+            WHERE source=? AND is_active=1 AND market_id NOT IN (SELECT market_id FROM temp.seen_market_ids)
+            """,
+            (source,),
+        ).fetchall()]
+        reopened = [r[0] for r in cur.execute(
+            """
+            SELECT market_id FROM bets
+            WHERE source=? AND is_active=0 AND market_id IN (SELECT market_id FROM temp.seen_market_ids)
+            """,
+            (source,),
+        ).fetchall()]
+        self._write_transitions(cur, source, closed, reopened, now)
+        cur.execute("DELETE FROM temp.seen_market_ids")
+        self._commit()
+        logger.info("Lifecycle for source=%s: closed=%d reopened=%d", source, len(closed), len(reopened))
+        return closed, reopened
+
+    @timed("lifecycle")
+    def apply_lifecycle_delta(self, source: str, open_ids: Iterable[str], closed_ids: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """Delta-sync counterpart of ``apply_lifecycle``: only the given IDs are considered.
+
+        Rows reported closed are closed and rows reported open are reopened; markets
+        that silently disappear are left to the next full pass.
+        """
+        now = now_ts()
+        cur = self.conn.cursor()
+        cur.execute("CREATE TEMP TABLE IF NOT EXISTS delta_market_ids (market_id TEXT PRIMARY KEY, is_open INTEGER NOT NULL)")
+        cur.execute("DELETE FROM temp.delta_market_ids")
+        cur.executemany("INSERT OR REPLACE INTO temp.delta_market_ids(market_id, is_open) VALUES(?, 0)", ((mid,) for mid in closed_ids))
+        cur.executemany("INSERT OR REPLACE INTO temp.delta_market_ids(market_id, is_open) VALUES(?, 1)", ((mid,) for mid in open_ids))
+        rows = cur.execute(
+            """
+            SELECT b.market_id, d.is_open FROM bets b JOIN temp.delta_market_ids d ON d.market_id = b.market_id
+            WHERE b.source=? AND b.is_active != d.is_open
+            """,
+            (source,),
+        ).fetchall()
+        closed = [mid for mid, is_open in rows if not is_open]
+        reopened = [mid for mid, is_open in rows if is_open]
+        self._write_transitions(cur, source, closed, reopened, now)
+        cur.execute("DELETE FROM temp.delta_market_ids")
+        self._commit()
+        logger.info("Delta lifecycle for source=%s: closed=%d reopened=%d", source, len(closed), len(reopened))
+        return closed, reopened
+
+    @staticmethod
+    def _write_transitions(cur, source: str, closed: List[str], reopened: List[str], now: int):
+        METRICS.inc("bets_closed", len(closed), source=source)
+        METRICS.inc("bets_reopened", len(reopened), source=source)
+        if closed:
+            cur.executemany(
+                "UPDATE bets SET is_active=0, inactive_at=? WHERE source=? AND market_id=?",
+                ((now, source, mid) for mid in closed),
+            )
+        if reopened:
+            cur.executemany(
+                "UPDATE bets SET is_active=1, inactive_at=NULL WHERE source=? AND market_id=?",
+                ((source, mid) for mid in reopened),
+            )
+        cur.executemany(
+            "INSERT INTO bet_lifecycle(source, market_id, transition, at) VALUES(?,?,?,?)",
+            [(source, mid, "closed", now) for mid in closed] + [(source, mid, "reopened", now) for mid in reopened],
+        )
+
+    def get_sync_state(self, source: str) -> Tuple[Optional[str], Optional[int]]:
+        """Return ``(high_water, last_full_at)`` for delta sync, or ``(None, None)``."""
+        row = self.conn.execute("SELECT high_water, last_full_at FROM sync_state WHERE source=?", (source,)).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    def set_sync_state(self, source: str, high_water: Optional[str], full: bool = False):
+        """Advance the high-water mark (never backwards); ``full`` also stamps ``last_full_at``."""
+        now = now_ts()
         self.conn.execute(
-            "UPDATE bets SET is_active=0, inactive_at=? WHERE source=? AND is_active=1",
-            (now, source),
+            """
+            INSERT INTO sync_state(source, high_water, last_full_at, updated_at) VALUES(?,?,?,?)
+            ON CONFLICT(source) DO UPDATE SET
+                high_water=CASE
+                    WHEN excluded.high_water IS NULL THEN sync_state.high_water
+                    WHEN sync_state.high_water IS NULL OR excluded.high_water > sync_state.high_water THEN excluded.high_water
+                    ELSE sync_state.high_water END,
+                last_full_at=COALESCE(excluded.last_full_at, sync_state.last_full_at),
+                updated_at=excluded.updated_at
+            """,
+            (source, high_water, now if full else None, now),
         )
+        self._commit()
 
-        # 2) Reactivate provided IDs in chunks
-        if ids:
-            logger.info("Reactivating %d bets for source=%s in chunks", len(ids), source)
-            for i in range(0, len(ids), 500):
-                chunk = ids[i : i + 500]
-                placeholders = ",".join("?" * len(chunk))
-                self.conn.execute(
-                    f"UPDATE bets SET is_active=1, inactive_at=NULL WHERE source=? AND market_id IN ({placeholders})",
-                    [source] + chunk,
-                )
+    def bump_generation(self, source: str) -> int:
+        """Mark ``source``'s active set as changed; readers compare generations to drop derived caches."""
+        self.conn.execute(
+            """
+            INSERT INTO sync_state(source, generation, updated_at) VALUES(?, 1, ?)
+            ON CONFLICT(source) DO UPDATE SET generation=sync_state.generation + 1, updated_at=excluded.updated_at
+            """,
+            (source, now_ts()),
+        )
+        self._commit()
+        return self.get_generations().get(source, 0)
 
-        self.conn.commit()
-        return to_inactivate_count
+    def get_generations(self) -> Dict[str, int]:
+        """``source -> generation`` for every source that has synced; absent sources count as 0."""
+        return dict(self.conn.execute("SELECT source, generation FROM sync_state").fetchall())
+
+    def fetch_lifecycle_since(self, after_id: int = 0, source: Optional[str] = None, limit: int = 10000) -> List[tuple]:
+        """Return ``(id, source, market_id, transition, at)`` rows appended after ``after_id``."""
+        q = "SELECT id, source, market_id, transition, at FROM bet_lifecycle WHERE id > ?"
+        args: list = [after_id]
+        if source is not None:
+            q += " AND source=?"
+            args.append(source)
+        q += " ORDER BY id LIMIT ?"
+        args.append(limit)
+        return self.conn.execute(q, args).fetchall()
 
     def get_event_for_bet(self, source: str, market_id: str) -> Optional[str]:
         row = self.conn.execute(
@@ -113,7 +285,7 @@ class Repo:
             "INSERT INTO events(id, title, created_at, updated_at) VALUES(?,?,?,?)",
             (eid, title, now, now),
         )
-        self.conn.commit()
+        self._commit()
         return eid
 
     def link_bet_to_event(self, event_id: str, source: str, market_id: str, text_hash: str, similarity: Optional[float], llm_confidence: Optional[float], method: str):
@@ -129,11 +301,15 @@ class Repo:
             """,
             (event_id, source, market_id, text_hash, similarity, llm_confidence, method, now, now),
         )
-        self.conn.commit()
+        self._commit()
 
-    def queue_pair(self, a_source: str, a_market_id: str, b_source: str, b_market_id: str, similarity: float, reason: str):
+    @staticmethod
+    def pair_key(a_source: str, a_market_id: str, b_source: str, b_market_id: str) -> str:
         pair = sorted([(a_source, a_market_id), (b_source, b_market_id)])
-        key = hashlib.sha256((":".join(pair[0]) + "|" + ":".join(pair[1])).encode("utf-8")).hexdigest()
+        return hashlib.sha256((":".join(pair[0]) + "|" + ":".join(pair[1])).encode("utf-8")).hexdigest()
+
+    def queue_pair(self, a_source: str, a_market_id: str, b_source: str, b_market_id: str, similarity: float, reason: str):
+        key = self.pair_key(a_source, a_market_id, b_source, b_market_id)
         logger.info("Queue pair: %s:%s <-> %s:%s sim=%.4f reason=%s", a_source, a_market_id, b_source, b_market_id, similarity, reason)
         self.conn.execute(
             """
@@ -142,7 +318,7 @@ class Repo:
             """,
             (key, a_source, a_market_id, b_source, b_market_id, float(similarity), reason, "pending", now_ts()),
         )
-        self.conn.commit()
+        self._commit()
 
     def fetch_active_bets_by_source(self, source: str) -> List[tuple]:
         rows = self.conn.execute(
@@ -152,3 +328,284 @@ class Repo:
         logger.debug("Fetched %d active bets for source=%s", len(rows), source)
         return rows
 
+    def fetch_active_ids(self, source: str) -> Set[str]:
+        """Market IDs of the source's active bets."""
+        return {mid for (mid,) in self.conn.execute("SELECT market_id FROM bets WHERE source=? AND is_active=1", (source,))}
+
+    def fetch_active_hashes(self, source: str) -> Dict[str, str]:
+        """``market_id -> text_hash`` of the source's active bets that have embedding text."""
+        return dict(self.conn.execute(
+            """
+            SELECT market_id, text_hash FROM bets
+            WHERE source=? AND is_active=1 AND (TRIM(COALESCE(title, '')) <> '' OR TRIM(COALESCE(description, '')) <> '')
+            """,
+            (source,),
+        ))
+
+    def fetch_bets_by_ids(self, source: str, market_ids: List[str]) -> List[tuple]:
+        """Return ``(source, market_id, slug, title, description, url, close_time)`` rows for the IDs, in the given order."""
+        found = {}
+        for i in range(0, len(market_ids), 500):
+            chunk = market_ids[i : i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for row in self.conn.execute(
+                f"""
+                SELECT source, market_id, slug, title, COALESCE(description, ''), url, COALESCE(close_time, '')
+                FROM bets WHERE source=? AND market_id IN ({placeholders})
+                """,
+                [source] + chunk,
+            ):
+                found[row[1]] = row
+        return [found[mid] for mid in market_ids if mid in found]
+
+    def fetch_active_page(
+        self, source: str, limit: int, after: Optional[Tuple[int, str]] = None,
+    ) -> Tuple[List[tuple], Optional[Tuple[int, str]]]:
+        """One page of active bets, most recently added or changed first, by keyset on ``(last_seen_at, market_id)``.
+
+        Returns ``fetch_bets_by_ids``-shaped rows and the cursor to pass as ``after``
+        for the next page, or None on the last page. Cost depends on ``limit`` only.
+        """
+        q = """
+            SELECT source, market_id, slug, title, COALESCE(description, ''), url, COALESCE(close_time, ''), last_seen_at
+            FROM bets WHERE source=? AND is_active=1
+        """
+        args: list = [source]
+        if after is not None:
+            q += " AND (last_seen_at, market_id) < (?, ?)"
+            args += list(after)
+        q += " ORDER BY last_seen_at DESC, market_id DESC LIMIT ?"
+        rows = self.conn.execute(q, args + [limit + 1]).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        cursor = (rows[-1][7], rows[-1][1]) if more else None
+        return [r[:7] for r in rows], cursor
+
+    @staticmethod
+    def fts_query(text: str) -> str:
+        """Turn free text into an FTS5 query: every word must match, as a prefix.
+
+        Words are quoted, so FTS5 operators typed by the user are taken literally.
+        """
+        return " ".join(f'"{w}"*' for w in _FTS_WORD.findall(text))
+
+    def search_active_bets(self, source: str, query: str, limit: int = 50) -> List[tuple]:
+        """Active bets of ``source`` matching ``query``, best bm25 first (title weighted over description).
+
+        Returns ``(source, market_id, slug, title, description, url, close_time)`` rows
+        like ``fetch_bets_by_ids``. Without FTS5 it falls back to a LIKE scan ordered
+        by recency.
+        """
+        if self._fts is None:
+            self._fts = has_fts(self.conn)
+        if not self._fts:
+            like = f"%{query}%"
+            return self.conn.execute(
+                """
+                SELECT source, market_id, slug, title, COALESCE(description, ''), url, COALESCE(close_time, '')
+                FROM bets WHERE source=? AND is_active=1 AND (title LIKE ? OR description LIKE ?)
+                ORDER BY last_seen_at DESC LIMIT ?
+                """,
+                (source, like, like, limit),
+            ).fetchall()
+        match = self.fts_query(query)
+        if not match:
+            return []
+        return self.conn.execute(
+            """
+            SELECT b.source, b.market_id, b.slug, b.title, COALESCE(b.description, ''), b.url, COALESCE(b.close_time, '')
+            FROM bets_fts JOIN bets b ON b.id = bets_fts.rowid
+            WHERE bets_fts MATCH ? AND b.source=? AND b.is_active=1
+            ORDER BY bm25(bets_fts, 10.0, 1.0) LIMIT ?
+            """,
+            (match, source, limit),
+        ).fetchall()
+
+    def fetch_unembedded(self, model: str, sources: Iterable[str], limit: int = 5000) -> List[Tuple[str, str, Optional[str]]]:
+        """``(text_hash, title, description)`` of active bets in ``sources`` with no ``model`` vector yet, one per hash."""
+        sources = list(sources)
+        if not sources:
+            return []
+        return self.conn.execute(
+            f"""
+            SELECT b.text_hash, MIN(b.title), MIN(b.description) FROM bets b
+            WHERE b.is_active=1 AND b.source IN ({",".join("?" * len(sources))})
+              AND NOT EXISTS (SELECT 1 FROM embeddings e WHERE e.hash = b.text_hash AND e.model = ?)
+            GROUP BY b.text_hash LIMIT ?
+            """,
+            [*sources, model, limit],
+        ).fetchall()
+
+    def list_active_sources(self) -> List[str]:
+        return [r[0] for r in self.conn.execute("SELECT DISTINCT source FROM bets WHERE is_active=1 ORDER BY source")]
+
+    def fetch_neighbors(
+        self, model: str, source: str, text_hash: str, sources: Iterable[str], limit: int, floor: float = -1.0,
+    ) -> Optional[List[tuple]]:
+        """Materialized neighbours of one bet, best first, as ``fetch_bets_by_ids`` rows plus similarity.
+
+        Returns None when no list was computed for ``(model, source, text_hash)`` yet.
+        """
+        if self.conn.execute(
+            "SELECT 1 FROM bet_neighbor_state WHERE model=? AND source=? AND text_hash=?", (model, source, text_hash),
+        ).fetchone() is None:
+            return None
+        sources = list(sources)
+        return self.conn.execute(
+            f"""
+            SELECT b.source, b.market_id, b.slug, b.title, COALESCE(b.description, ''), b.url, COALESCE(b.close_time, ''), n.similarity
+            FROM bet_neighbors n JOIN bets b ON b.source = n.neighbor_source AND b.market_id = n.neighbor_market_id
+            WHERE n.model=? AND n.source=? AND n.text_hash=? AND n.similarity >= ? AND b.is_active=1
+              AND n.neighbor_source IN ({",".join("?" * len(sources))})
+            ORDER BY n.similarity DESC LIMIT ?
+            """,
+            [model, source, text_hash, floor, *sources, limit],
+        ).fetchall()
+
+    def fetch_neighbor_owners(self, model: str) -> Dict[Tuple[str, str], Tuple[int, float]]:
+        """``(source, text_hash) -> (neighbour count, lowest similarity)`` for every computed list."""
+        rows = self.conn.execute(
+            """
+            SELECT s.source, s.text_hash, COUNT(n.similarity), COALESCE(MIN(n.similarity), -1.0)
+            FROM bet_neighbor_state s
+            LEFT JOIN bet_neighbors n ON n.model = s.model AND n.source = s.source AND n.text_hash = s.text_hash
+            WHERE s.model=? GROUP BY s.source, s.text_hash
+            """,
+            (model,),
+        ).fetchall()
+        return {(src, h): (count, low) for src, h, count, low in rows}
+
+    def drop_neighbors_to(self, model: str, targets: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """Delete list entries pointing at ``(source, market_id)`` targets; return the owners that lost one."""
+        by_source: Dict[str, List[str]] = {}
+        for src, mid in targets:
+            by_source.setdefault(src, []).append(mid)
+        owners = set()
+        cur = self.conn.cursor()
+        for src, mids in by_source.items():
+            for i in range(0, len(mids), 500):
+                chunk = mids[i : i + 500]
+                where = f"model=? AND neighbor_source=? AND neighbor_market_id IN ({','.join('?' * len(chunk))})"
+                params = [model, src] + chunk
+                owners.update(cur.execute(f"SELECT DISTINCT source, text_hash FROM bet_neighbors WHERE {where}", params).fetchall())
+                cur.execute(f"DELETE FROM bet_neighbors WHERE {where}", params)
+        self._commit()
+        return sorted(owners)
+
+    def write_neighbors(
+        self,
+        model: str,
+        lists: Dict[Tuple[str, str], List[Tuple[str, str, float]]],
+        additions: List[Tuple[str, str, str, str, float]],
+        k: int,
+    ):
+        """Replace whole lists and merge single entries, in one transaction.
+
+        ``lists`` maps ``(source, text_hash)`` to its full neighbour list; ``additions``
+        are ``(source, text_hash, neighbor_source, neighbor_market_id, similarity)``
+        merged into existing lists, which are then trimmed back to ``k``.
+        """
+        now = now_ts()
+        cur = self.conn.cursor()
+        for (src, h), entries in lists.items():
+            cur.execute("DELETE FROM bet_neighbors WHERE model=? AND source=? AND text_hash=?", (model, src, h))
+            cur.executemany(
+                "INSERT INTO bet_neighbors(model, source, text_hash, neighbor_source, neighbor_market_id, similarity) VALUES(?,?,?,?,?,?)",
+                [(model, src, h, ns, nm, sim) for ns, nm, sim in entries],
+            )
+        cur.executemany(
+            "INSERT OR REPLACE INTO bet_neighbor_state(model, source, text_hash, computed_at) VALUES(?,?,?,?)",
+            [(model, src, h, now) for src, h in lists],
+        )
+        cur.executemany(
+            "INSERT OR REPLACE INTO bet_neighbors(model, source, text_hash, neighbor_source, neighbor_market_id, similarity) VALUES(?,?,?,?,?,?)",
+            [(model,) + row for row in additions],
+        )
+        for src, h in {(a[0], a[1]) for a in additions}:
+            cur.execute(
+                """
+                DELETE FROM bet_neighbors WHERE model=? AND source=? AND text_hash=? AND rowid NOT IN (
+                    SELECT rowid FROM bet_neighbors WHERE model=? AND source=? AND text_hash=? ORDER BY similarity DESC LIMIT ?
+                )
+                """,
+                (model, src, h, model, src, h, k),
+            )
+        self._commit()
+
+    def prune_neighbors(self, model: str) -> int:
+        """Drop lists whose ``(source, text_hash)`` no longer belongs to an active bet."""
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            DELETE FROM bet_neighbor_state WHERE model=? AND NOT EXISTS (
+                SELECT 1 FROM bets b WHERE b.source = bet_neighbor_state.source AND b.text_hash = bet_neighbor_state.text_hash AND b.is_active=1
+            )
+            """,
+            (model,),
+        )
+        removed = cur.rowcount
+        cur.execute(
+            """
+            DELETE FROM bet_neighbors WHERE model=? AND NOT EXISTS (
+                SELECT 1 FROM bet_neighbor_state s
+                WHERE s.model = bet_neighbors.model AND s.source = bet_neighbors.source AND s.text_hash = bet_neighbors.text_hash
+            )
+            """,
+            (model,),
+        )
+        self._commit()
+        return removed
+
+    def fetch_event_aliases(self) -> Dict[Tuple[str, str], str]:
+        rows = self.conn.execute("SELECT source, market_id, event_id FROM event_aliases").fetchall()
+        return {(src, mid): eid for src, mid, eid in rows}
+
+    def fetch_match_state(self, model: str) -> Dict[Tuple[str, str], str]:
+        """Map ``(source, market_id)`` to the text hash it was last scored with under ``model``."""
+        rows = self.conn.execute("SELECT source, market_id, text_hash FROM match_state WHERE model=?", (model,)).fetchall()
+        return {(src, mid): h for src, mid, h in rows}
+
+    def apply_match_results(
+        self,
+        events: List[Tuple[str, Optional[str]]],
+        links: List[Tuple[str, str, str, str, Optional[float], Optional[float], str]],
+        pairs: List[Tuple[str, str, str, str, float, str]],
+        scored: List[Tuple[str, str, str]],
+        model: str,
+    ):
+        """Write one matching run in a single transaction.
+
+        ``events`` are ``(id, title)``, ``links`` follow ``link_bet_to_event`` argument
+        order, ``pairs`` follow ``queue_pair`` and ``scored`` are ``(source, market_id, text_hash)``.
+        """
+        now = now_ts()
+        logger.info("Applying match results: events=%d links=%d pairs=%d scored=%d", len(events), len(links), len(pairs), len(scored))
+        self.conn.executemany(
+            "INSERT INTO events(id, title, created_at, updated_at) VALUES(?,?,?,?)",
+            [(eid, title, now, now) for eid, title in events],
+        )
+        self.conn.executemany(
+            """
+            INSERT INTO event_aliases(event_id, source, market_id, text_hash, similarity, llm_confidence, method, created_at, updated_at)
+            VALUES(?,?,?,?,?,?,?, ?, ?)
+            ON CONFLICT(source, market_id) DO UPDATE SET
+              event_id=excluded.event_id, text_hash=excluded.text_hash, similarity=excluded.similarity,
+              llm_confidence=excluded.llm_confidence, method=excluded.method, updated_at=excluded.updated_at
+            """,
+            [link + (now, now) for link in links],
+        )
+        self.conn.executemany(
+            """
+            INSERT OR IGNORE INTO event_candidates(pair_key, a_source, a_market_id, b_source, b_market_id, similarity, reason, status, created_at)
+            VALUES(?,?,?,?,?,?,?,?,?)
+            """,
+            [(self.pair_key(a, am, b, bm), a, am, b, bm, float(sim), reason, "pending", now) for a, am, b, bm, sim, reason in pairs],
+        )
+        self.conn.executemany(
+            """
+            INSERT INTO match_state(source, market_id, model, text_hash, scored_at) VALUES(?,?,?,?,?)
+            ON CONFLICT(source, market_id, model) DO UPDATE SET text_hash=excluded.text_hash, scored_at=excluded.scored_at
+            """,
+            [(src, mid, model, h, now) for src, mid, h in scored],
+        )
+        self._commit()
@@ -3,15 +3,18 @@ import os
 import json
 import logging
 from dotenv import load_dotenv
-from .config import DB_PATH, VOYAGE_MODEL
+from .config import DB_PATH, VOYAGE_MODEL, EMBED_CONCURRENCY, EMBED_RPM, EMBED_TPM, VECTOR_QUANT, COARSE_SEARCH
 from .db import open_db
 from .embeddings import EmbeddingCache, Embedder
 from .repo import Repo
 from .clients.polymarket import PolymarketClient
-from .sync import sync_source
-from .match import propose_and_link
+from .sync import sync_with_delta
+from .match import match_incremental, propose_and_link
+from .ann import AnnStore
+from .metrics import export_run, start_server
+from .neighbors import NeighborTable
 
-def run_once(limit_per_source: int = 500):
+def run_once(limit_per_source: int = 500, full_match: bool = False, full_sync: bool = False):
     # Basic logging config; respect LOG_LEVEL env var
     log_level = os.getenv("LOG_LEVEL", "INFO").upper()
     logging.basicConfig(
@@ -22,19 +25,36 @@ def run_once(limit_per_source: int = 500):
 
     load_dotenv()
     logger.info("run_once start limit_per_source=%d", limit_per_source)
+    start_server()
     conn = open_db(DB_PATH)
     cache = EmbeddingCache(conn)
     repo = Repo(conn)
-    embedder = Embedder(model=VOYAGE_MODEL, cache=cache, api_key=os.getenv("VOYAGE_API_KEY"))
-    sources = {}
-    pm = PolymarketClient()
-    sources["polymarket"] = pm.fetch_bets(limit_per_source)
-    for src, bets in sources.items():
-        logger.info("Syncing source %s with %d bets", src, len(bets))
-        sync_source(bets, repo, embedder)
-    auto_links, queued = propose_and_link(repo, embedder, list(sources.keys()))
-    result = {"linked": auto_links, "queued": queued}
+    embedder = Embedder(
+        model=VOYAGE_MODEL, cache=cache, api_key=os.getenv("VOYAGE_API_KEY"),
+        max_concurrency=EMBED_CONCURRENCY, rpm=EMBED_RPM, tpm=EMBED_TPM,
+    )
+    ann = AnnStore()
+    neighbors = NeighborTable()
+    sources = {"polymarket": PolymarketClient()}
+    new_or_changed = []
+    for src, client in sources.items():
+        # Delta from the stored high-water mark; a full pass every SYNC_FULL_EVERY seconds
+        changed, seen, _ = sync_with_delta(
+            client, repo, embedder, src, limit=limit_per_source, force_full=full_sync, ann=ann, neighbors=neighbors,
+        )
+        logger.info("Synced source %s: seen=%d changed=%d", src, seen, len(changed))
+        new_or_changed.extend(changed)
+    # Quantized and two-stage matching run on the exhaustive path; the syncs above still keep the IVF index current
+    match_ann = None if VECTOR_QUANT or COARSE_SEARCH else ann
+    if match_ann is None:
+        logger.info("VECTOR_QUANT=%s COARSE_SEARCH=%s: matching scans the matrices instead of the ANN index", VECTOR_QUANT, COARSE_SEARCH)
+    if full_match:
+        auto_links, queued = propose_and_link(repo, embedder, list(sources.keys()), ann=match_ann, quantize=VECTOR_QUANT, coarse=COARSE_SEARCH)
+    else:
+        auto_links, queued = match_incremental(repo, embedder, new_or_changed, list(sources.keys()), ann=match_ann, quantize=VECTOR_QUANT, coarse=COARSE_SEARCH)
+    result = {"linked": auto_links, "queued": queued, "embed": dict(embedder.stats)}
     logger.info("run_once result: %s", result)
+    export_run()
     print(json.dumps(result))
 
 if __name__ == "__main__":
@@ -1,9 +1,17 @@
 # market_sync/sync.py
-from typing import List, Tuple
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+import queue
 import logging
-from .models import Bet
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from .models import Bet, BetBatch
 from .repo import Repo
-from .embeddings import Embedder
+from .embeddings import Claim, Embedder
+from .ann import AnnStore
+from .neighbors import NeighborTable
+from .config import SYNC_FULL_EVERY
+from .util import now_ts
 
 logger = logging.getLogger(__name__)
 
@@ -13,23 +21,26 @@ def sync_source(
     embedder: Embedder,
     show_progress: bool = False,
     backfill_missing: bool = True,     # ← NEW
+    ann: Optional[AnnStore] = None,
+    neighbors: Optional[NeighborTable] = None,
 ) -> Tuple[list, list, int]:
     logger.info("sync_source start: source=%s count=%d", bets[0].source if bets else "", len(bets))
+    stats_before = dict(embedder.stats)
     new_or_changed = []
     active_ids = []
 
-    iterator = bets
+    results = repo.upsert_bets(bets)
+    iterator = zip(bets, results)
     pbar = None
     if show_progress and bets:
         try:
             from tqdm.auto import tqdm
-            pbar = tqdm(bets, desc=f"sync[{bets[0].source}]", unit="bet")
+            pbar = tqdm(iterator, total=len(bets), desc=f"sync[{bets[0].source}]", unit="bet")
             iterator = pbar
         except Exception:
             logger.debug("tqdm not available; continuing without progress")
 
-    for b in iterator:
-        is_new, is_changed = repo.upsert_bet(b)
+    for b, (is_new, is_changed) in iterator:
         status = "insert" if is_new else ("update" if is_changed else "skip")
         if pbar:
             pbar.set_postfix_str(f"{status} id={b.market_id}")
@@ -40,45 +51,315 @@ def sync_source(
     if pbar:
         pbar.close()
 
-    inactivated = repo.mark_inactive_except(bets[0].source if bets else "", set(active_ids))
-    logger.info("sync_source: new_or_changed=%d inactivated=%d", len(new_or_changed), inactivated)
+    closed_ids, reopened_ids = repo.apply_lifecycle(bets[0].source if bets else "", active_ids)
+    inactivated = len(closed_ids)
+    logger.info("sync_source: new_or_changed=%d inactivated=%d reopened=%d", len(new_or_changed), inactivated, len(reopened_ids))
 
     # --------- Decide what to embed (resume-aware) ----------
     # If we want to resume after an interrupt, scan ALL current bets.
     embed_scope = bets if backfill_missing else new_or_changed
 
-    need_embed_texts = []
-    need_embed_bets = []
-    for b in embed_scope:
-        h = embedder.text_hash(b.text_for_embedding)
-        if embedder.cache.get(h, embedder.model) is None:
-            need_embed_texts.append(b.text_for_embedding)
-            need_embed_bets.append(b)
+    cached = embedder.cache.get_many((b.text_hash for b in embed_scope), embedder.model)
+    need_embed_bets = [b for b in embed_scope if b.text_hash not in cached]
 
-    if not need_embed_texts:
+    if not need_embed_bets:
         logger.info("sync_source: nothing to embed (backfill_missing=%s)", backfill_missing)
-        logger.info("sync_source done: source=%s", bets[0].source if bets else "")
-        return new_or_changed, bets, inactivated
-
-    # --------- Embedding phase (progress-aware) ----------
-    if show_progress:
+    elif show_progress:
+        # --------- Embedding phase (progress-aware) ----------
         try:
             from tqdm.auto import tqdm
             phase = "embedding-resume" if backfill_missing else "embedding"
-            p2 = tqdm(need_embed_bets, desc=phase, unit="bet")
-            for b in p2:
-                # double-check still missing (in case of concurrent runs)
-                h = embedder.text_hash(b.text_for_embedding)
-                if embedder.cache.get(h, embedder.model) is None:
-                    embedder.embed_text(b.text_for_embedding)  # per-item for rich progress
-                p2.set_postfix_str(f"embedded id={b.market_id}")
+            p2 = tqdm(total=len(need_embed_bets), desc=phase, unit="bet")
+            step = embedder.max_batch_size * embedder.max_concurrency
+            for start in range(0, len(need_embed_bets), step):
+                chunk = need_embed_bets[start : start + step]
+                # embed_hashed claims each hash first, so concurrent runs don't pay twice
+                _embed_bets(embedder, chunk)
+                p2.update(len(chunk))
+                p2.set_postfix_str(f"embedded id={chunk[-1].market_id}")
             p2.close()
         except Exception:
             logger.debug("tqdm not available during embedding; falling back to batched")
-            embedder.embed_texts(need_embed_texts)
+            _embed_bets(embedder, need_embed_bets)
     else:
         # Fast batched path
-        embedder.embed_texts(need_embed_texts)
+        _embed_bets(embedder, need_embed_bets)
+
+    if bets:
+        reopened = set(reopened_ids)
+        _apply_indexes(repo, embedder, bets[0].source, new_or_changed + [b for b in bets if b.market_id in reopened], closed_ids, ann, neighbors)
+        _bump_generation(repo, bets[0].source, new_or_changed, closed_ids, reopened_ids)
+
+    sent = {k: embedder.stats[k] - stats_before.get(k, 0) for k in embedder.stats}
+    logger.info(
+        "sync_source done: source=%s requests=%d texts=%d tokens_estimated=%d tokens_billed=%d",
+        bets[0].source if bets else "", sent["requests"], sent["texts"], sent["tokens_estimated"], sent["tokens_billed"],
+    )
+    return new_or_changed, bets, inactivated
+
+def _apply_indexes(repo, embedder, source: str, upserted: List, closed_ids: List[str], ann: Optional[AnnStore], neighbors: Optional[NeighborTable]):
+    # Both derived structures are fed from the same upserted/closed delta
+    for index in (ann, neighbors):
+        if index is not None:
+            index.apply_sync(repo, embedder, source, upserted, closed_ids)
+
+def _bump_generation(repo: Repo, source: str, new_or_changed: List, closed_ids: List[str], reopened_ids: List[str]):
+    # Only when the active set changed, so an idle sync keeps UI matrix caches warm
+    if new_or_changed or closed_ids or reopened_ids:
+        repo.bump_generation(source)
+
+def _embed_bets(embedder: Embedder, bets: List[Bet]):
+    # Hashes were computed when the bets were built; texts are only rebuilt for misses
+    embedder.embed_hashed([b.text_hash for b in bets], lambda i: bets[i].text_for_embedding)
+
+_END = object()
+
+def _produce(pages: Iterable[BetBatch], q: "queue.Queue", stop: threading.Event):
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for page in pages:
+            if not put(page):
+                return
+    except BaseException as e:  # forwarded to the consumer
+        put(e)
+    finally:
+        put(_END)
+
+def sync_stream(
+    pages: Iterable[BetBatch],
+    repo: Repo,
+    embedder: Embedder,
+    source: str,
+    queue_size: int = 4,
+    show_progress: bool = False,
+    ann: Optional[AnnStore] = None,
+    neighbors: Optional[NeighborTable] = None,
+    backfill_missing: bool = True,
+) -> Tuple[list, int, int]:
+    """Pipelined ``sync_source`` over a stream of pages (e.g. ``PolymarketClient.iter_bets``).
+
+    Fetching and parsing run on a producer thread feeding a bounded queue, each page
+    is upserted and cache-checked on this thread as it arrives, and embedding requests
+    run on a pool with at most ``max_concurrency`` batches in flight. Memory is bounded
+    by the queue and in-flight batches rather than the total market count. The
+    lifecycle step only runs once the stream completed, so a failed fetch never
+    closes markets that were simply not reached, and is skipped when the stream
+    yielded no markets at all.
+
+    With ``backfill_missing=False`` only new or changed bets are embedded, as in
+    ``sync_source``; unchanged bets missing a vector are left alone.
+
+    Returns ``(new_or_changed, seen_count, inactivated)``.
+    """
+    logger.info("sync_stream start: source=%s", source)
+    stats_before = dict(embedder.stats)
+    q: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+    stop = threading.Event()
+    producer = threading.Thread(target=_produce, args=(pages, q, stop), name=f"fetch[{source}]", daemon=True)
+    producer.start()
 
-    logger.info("sync_source done: source=%s", bets[0].source if bets else "")
-    return new_or_changed, bets, inactivated
\ No newline at end of file
+    new_or_changed: List[Bet] = []
+    active_ids: Set[str] = set()
+    seen = 0
+    pending: Set[str] = set()
+    in_flight: Deque[Tuple[Future, List[str]]] = deque()
+    # Hashes another thread or process claimed first; collected once the stream is done
+    claims: List[Claim] = []
+    claimed_texts: Dict[str, str] = {}
+    pool = ThreadPoolExecutor(max_workers=embedder.max_concurrency, thread_name_prefix="embed")
+
+    def write_done(block_above: int):
+        # Oldest first; blocks only while more than ``block_above`` batches are outstanding.
+        while in_flight and (len(in_flight) > block_above or in_flight[0][0].done()):
+            fut, hashes = in_flight.popleft()
+            try:
+                embedder.cache.set_many(embedder.model, zip(hashes, fut.result()))
+            finally:
+                # Also on failure: waiters then embed these themselves instead of polling a dead claim
+                embedder.release(hashes)
+                pending.difference_update(hashes)
+        embedder.renew()
+
+    pbar = None
+    if show_progress:
+        try:
+            from tqdm.auto import tqdm
+            pbar = tqdm(desc=f"sync[{source}]", unit="bet")
+        except Exception:
+            logger.debug("tqdm not available; continuing without progress")
+
+    try:
+        while True:
+            item = q.get()
+            if item is _END:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            chunk: BetBatch = item
+            if not chunk:
+                continue
+            results = repo.upsert_bets(chunk)
+            changed_rows = [i for i, (is_new, is_changed) in enumerate(results) if is_new or is_changed]
+            # Copied out so the kept rows do not pin the whole page
+            changed = chunk.take(changed_rows) if isinstance(chunk, BetBatch) else [chunk[i] for i in changed_rows]
+            new_or_changed.extend(changed)
+            scope = chunk if backfill_missing else changed
+            active_ids.update(b.market_id for b in chunk)
+            seen += len(chunk)
+
+            fresh = {b.text_hash: b for b in scope if b.text_hash not in pending and b.text_hash not in claimed_texts}
+            cached = embedder.cache.get_many(fresh.keys(), embedder.model)
+            missing = {h: b.text_for_embedding for h, b in fresh.items() if h not in cached}
+            missing = {h: t for h, t in missing.items() if t}
+            claim = embedder.claim(list(missing))
+            if claim.waiting:
+                claims.append(claim)
+                claimed_texts.update((h, missing[h]) for h in claim.waiting)
+            mine = {h: missing[h] for h in claim.mine}
+            for hashes, tokens in embedder.plan_batches(mine):
+                fut = pool.submit(embedder.embed_batch, [mine[h] for h in hashes], tokens)
+                in_flight.append((fut, hashes))
+                pending.update(hashes)
+            write_done(embedder.max_concurrency)
+            if pbar:
+                pbar.update(len(chunk))
+                pbar.set_postfix_str(f"changed={len(new_or_changed)} embedding={len(pending)}")
+        write_done(0)
+        for claim in claims:
+            embedder.wait_for(claim, claimed_texts)
+    finally:
+        stop.set()
+        for fut, _ in in_flight:
+            fut.cancel()
+        pool.shutdown(wait=True)
+        # Keep whatever finished before an interruption
+        for fut, hashes in in_flight:
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                embedder.cache.set_many(embedder.model, zip(hashes, fut.result()))
+            embedder.release(hashes)
+        for claim in claims:
+            # Already released when wait_for ran; frees local waiters after an interruption
+            embedder.release(claim.remote, leased=False)
+        if pbar:
+            pbar.close()
+
+    if seen:
+        closed_ids, reopened_ids = repo.apply_lifecycle(source, active_ids)
+    else:
+        # An empty listing is far more likely an upstream failure than every market closing
+        logger.warning("sync_stream: no markets received for source=%s; not closing any", source)
+        closed_ids, reopened_ids = [], []
+    if ann is not None or neighbors is not None:
+        changed_ids = {b.market_id for b in new_or_changed}
+        upserted = new_or_changed + [
+            Bet(source=source, market_id=mid, slug=None, title=title or "", description=desc, url=None, close_time=None)
+            for _, mid, _, title, desc, _, _ in repo.fetch_bets_by_ids(source, [mid for mid in reopened_ids if mid not in changed_ids])
+        ]
+        _apply_indexes(repo, embedder, source, upserted, closed_ids, ann, neighbors)
+    _bump_generation(repo, source, new_or_changed, closed_ids, reopened_ids)
+
+    sent = {k: embedder.stats[k] - stats_before.get(k, 0) for k in embedder.stats}
+    logger.info(
+        "sync_stream done: source=%s seen=%d new_or_changed=%d inactivated=%d reopened=%d requests=%d tokens_estimated=%d",
+        source, seen, len(new_or_changed), len(closed_ids), len(reopened_ids), sent["requests"], sent["tokens_estimated"],
+    )
+    return new_or_changed, seen, len(closed_ids)
+
+def sync_delta(
+    changes: Iterable[Tuple[BetBatch, List[str]]],
+    repo: Repo,
+    embedder: Embedder,
+    source: str,
+    ann: Optional[AnnStore] = None,
+    neighbors: Optional[NeighborTable] = None,
+    backfill_missing: bool = True,
+) -> Tuple[list, int, int]:
+    """Apply only markets updated since the last high-water mark.
+
+    ``changes`` yields ``(open_bets, closed_ids)`` pages (``PolymarketClient.iter_updated_bets``).
+    Only markets the source already tracks as active are applied: the full pass
+    owns the universe (the top ``limit`` by volume), so new or reopened markets
+    wait for it instead of flipping in and out between the two paths. Tracked
+    open bets are upserted and embedded, reported closures are deactivated, and
+    nothing else is touched; silent disappearances wait for the next full pass.
+    ``backfill_missing=False`` embeds only the new or changed ones.
+    Returns ``(new_or_changed, seen_count, inactivated)``.
+    """
+    stats_before = dict(embedder.stats)
+    tracked = repo.fetch_active_ids(source)
+    new_or_changed: List[Bet] = []
+    opened: List[Bet] = []
+    closed_seen: List[str] = []
+    untracked = 0
+    for open_bets, closed_ids in changes:
+        batch = isinstance(open_bets, BetBatch)
+        ids = open_bets.market_ids if batch else [b.market_id for b in open_bets]
+        keep = [i for i, mid in enumerate(ids) if mid in tracked]
+        untracked += len(ids) - len(keep)
+        if len(keep) < len(ids):
+            open_bets = open_bets.take(keep) if batch else [open_bets[i] for i in keep]
+        if open_bets:
+            for b, (is_new, is_changed) in zip(open_bets, repo.upsert_bets(open_bets)):
+                if is_new or is_changed:
+                    new_or_changed.append(b)
+            opened.extend(open_bets)
+        closed_seen.extend(closed_ids)
+
+    closed, reopened_ids = repo.apply_lifecycle_delta(source, (b.market_id for b in opened), closed_seen)
+    to_embed = opened if backfill_missing else new_or_changed
+    if to_embed:
+        _embed_bets(embedder, to_embed)
+    reopened = set(reopened_ids) - {b.market_id for b in new_or_changed}
+    _apply_indexes(repo, embedder, source, new_or_changed + [b for b in opened if b.market_id in reopened], closed, ann, neighbors)
+    _bump_generation(repo, source, new_or_changed, closed, reopened_ids)
+
+    sent = {k: embedder.stats[k] - stats_before.get(k, 0) for k in embedder.stats}
+    logger.info(
+        "sync_delta done: source=%s seen=%d new_or_changed=%d closed=%d reopened=%d untracked=%d requests=%d",
+        source, len(opened) + len(closed_seen), len(new_or_changed), len(closed), len(reopened_ids), untracked, sent["requests"],
+    )
+    return new_or_changed, len(opened) + len(closed_seen), len(closed)
+
+def sync_with_delta(
+    client,
+    repo: Repo,
+    embedder: Embedder,
+    source: str,
+    limit: int = 10000,
+    full_every: int = SYNC_FULL_EVERY,
+    force_full: bool = False,
+    show_progress: bool = False,
+    ann: Optional[AnnStore] = None,
+    neighbors: Optional[NeighborTable] = None,
+    backfill_missing: bool = True,
+) -> Tuple[list, int, int]:
+    """Delta sync from the stored high-water mark, with a full pass every ``full_every`` seconds.
+
+    The full pass (``sync_stream`` over ``client.iter_bets``) is what closes markets
+    that vanished from the listing without an update, and it also runs when no
+    mark is stored yet. The mark only advances after a pass completed, and a delta
+    walk truncated by ``limit`` keeps the old one, so the next run walks it again.
+    """
+    high_water, last_full_at = repo.get_sync_state(source)
+    full = force_full or high_water is None or last_full_at is None or now_ts() - last_full_at >= full_every
+    if full:
+        result = sync_stream(
+            client.iter_bets(limit), repo, embedder, source, show_progress=show_progress, ann=ann, neighbors=neighbors,
+            backfill_missing=backfill_missing,
+        )
+    else:
+        result = sync_delta(
+            client.iter_updated_bets(high_water, limit=limit), repo, embedder, source, ann=ann, neighbors=neighbors,
+            backfill_missing=backfill_missing,
+        )
+    repo.set_sync_state(source, client.high_water, full=full)
+    logger.info("sync_with_delta: source=%s mode=%s high_water=%s", source, "full" if full else "delta", client.high_water)
+    return result
@@ -0,0 +1,50 @@
+# market_sync/tokens.py
+import re
+from typing import Callable, List, Sequence, Tuple
+
+_WORD = re.compile(r"\S+")
+
+def estimate_tokens(text: str) -> int:
+    """Conservative local token estimate: the larger of ~4 chars/token and ~0.75 words/token."""
+    if not text:
+        return 0
+    chars = (len(text) + 3) // 4
+    words = (len(_WORD.findall(text)) * 4 + 2) // 3
+    return max(1, chars, words)
+
+def truncate_to_tokens(text: str, max_tokens: int, count: Callable[[str], int] = estimate_tokens) -> str:
+    """Cut ``text`` to at most ``max_tokens`` at a whitespace boundary.
+
+    Deterministic and idempotent, so the truncated text can be hashed as the cache key.
+    """
+    if max_tokens <= 0 or count(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    space = cut.rfind(" ", 0, lo)
+    if space > lo // 2:
+        cut = cut[:space]
+    return cut.rstrip()
+
+def pack_batches(token_counts: Sequence[int], max_items: int, max_tokens: int) -> List[Tuple[int, int]]:
+    """Greedy, order-preserving packing into ``[start, end)`` ranges bounded by items and tokens.
+
+    A single item above ``max_tokens`` still gets a batch of its own.
+    """
+    batches: List[Tuple[int, int]] = []
+    start = 0
+    used = 0
+    for i, n in enumerate(token_counts):
+        if i > start and (i - start >= max_items or used + n > max_tokens):
+            batches.append((start, i))
+            start, used = i, 0
+        used += n
+    if start < len(token_counts):
+        batches.append((start, len(token_counts)))
+    return batches
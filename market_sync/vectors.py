@@ -0,0 +1,520 @@
+# market_sync/vectors.py
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from .config import COARSE_DIM, COARSE_SHORTLIST
+from .metrics import METRICS
+from .models import embedding_text, has_embedding_text
+from .util import now_ts
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for one block of the (rows x candidates) score matrix.
+DEFAULT_BLOCK_BYTES = 64 * 1024 * 1024
+# Peak bytes per score cell during top-k selection: the float32 scores, their
+# negation and argpartition's int64 indices
+TOPK_CELL_BYTES = 16
+# Compact representations accepted by QuantizedMatrix
+QUANT_KINDS = ("int8", "float16")
+# Reduced-dimension projections for two-stage search (see Projection)
+COARSE_KINDS = ("prefix", "pca")
+# Vectors sampled from the cache to fit a PCA basis
+PROJECTION_SAMPLE = 20000
+# Rough cost of one gathered multiply-add in the rescoring stage relative to one in a BLAS matmul
+GATHER_COST = 30
+
+@dataclass
+class SourceMatrix:
+    """Active bets of one source with their embeddings as a row-normalized float32 matrix."""
+    source: str
+    market_ids: List[str]
+    titles: List[str]
+    hashes: List[str]
+    matrix: np.ndarray
+    coarse: Optional[np.ndarray] = None  # reduced rows, see project_source
+
+    def __len__(self) -> int:
+        return len(self.market_ids)
+
+def normalize_rows(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    m /= norms
+    return m
+
+def load_source_matrix(repo, embedder, source: str) -> SourceMatrix:
+    rows = repo.fetch_active_bets_by_source(source)
+    return matrix_from_rows(embedder, source, [(mid, title, desc, thash) for mid, title, desc, url, thash in rows])
+
+def matrix_for_bets(embedder, source: str, bets) -> SourceMatrix:
+    bets = [b for b in bets if has_embedding_text(b.title, b.description)]
+    keep = [(b.market_id, b.title, b.text_hash) for b in bets]
+    return _assemble(embedder, source, keep, lambda i: bets[i].text_for_embedding)
+
+def matrix_from_rows(embedder, source: str, rows: List[Tuple[str, str, str, str]]) -> SourceMatrix:
+    """Build a SourceMatrix from ``(market_id, title, description, text_hash)`` rows, embedding misses."""
+    rows = [r for r in rows if has_embedding_text(r[1], r[2])]
+    keep = [(mid, title, thash) for mid, title, _, thash in rows]
+    return _assemble(embedder, source, keep, lambda i: embedding_text(rows[i][1], rows[i][2]))
+
+def _assemble(embedder, source: str, keep: List[Tuple[str, str, str]], text_of: Callable[[int], str]) -> SourceMatrix:
+    # Texts are only rebuilt for cache misses; the stored hashes key the lookup.
+    wanted = [thash for _, _, thash in keep]
+    vecs = embedder.cache.get_many(wanted, embedder.model)
+    missing = [i for i, h in enumerate(wanted) if h not in vecs]
+    if missing:
+        logger.info("Embedding %d missing vectors for source=%s", len(missing), source)
+        embedded = embedder.embed_hashed([wanted[i] for i in missing], lambda j: text_of(missing[j]))
+        for i, vec in zip(missing, embedded):
+            vecs[wanted[i]] = vec
+
+    dim = next((len(v) for v in vecs.values() if v is not None), 0)
+    matrix = np.empty((len(keep), dim), dtype=np.float32)
+    market_ids: List[str] = []
+    titles: List[str] = []
+    hashes: List[str] = []
+    for mid, title, thash in keep:
+        vec = vecs.get(thash)
+        if vec is None or len(vec) != dim:
+            logger.warning("Skipping %s:%s with missing or mismatched vector", source, mid)
+            continue
+        matrix[len(market_ids)] = vec
+        market_ids.append(mid)
+        titles.append(title)
+        hashes.append(thash)
+    matrix = normalize_rows(matrix[: len(market_ids)])
+    logger.debug("Loaded matrix for source=%s shape=%s", source, matrix.shape)
+    return SourceMatrix(source, market_ids, titles, hashes, matrix)
+
+@dataclass
+class CandidateMatrix:
+    """Several sources' SourceMatrix rows stacked into one matrix, with a ``(source, market_id)`` per row."""
+    version: Tuple[int, ...]
+    ids: List[Tuple[str, str]]
+    matrix: "np.ndarray | QuantizedMatrix"
+    hashes: List[str]
+    coarse: Optional[np.ndarray] = None
+    projection: Optional["Projection"] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+class MatrixCache:
+    """Process-wide cache of normalized candidate matrices, versioned by sync generation.
+
+    Entries are keyed by ``(model, sources)`` and stay valid until one of the
+    sources' ``Repo.get_generations`` values moves, i.e. until a sync changed its
+    active set in this or another process. Nothing expires on a timer. Safe to
+    share between threads; loads are serialized so concurrent callers wait for one.
+
+    With ``quantize`` (``"int8"`` or ``"float16"``) matrices are held as
+    ``QuantizedMatrix``; ``rank`` scores the compact form, then rescores its top
+    ``k + rescore_extra`` exactly from the embedding cache before cutting to ``k``.
+
+    With ``coarse`` (``"prefix"`` or ``"pca"``) each entry also holds its rows
+    reduced to ``coarse_dim`` (``ensure_projection``, checked whenever an entry is
+    reloaded). ``rank`` then scores the reduced rows, keeps the best
+    ``max(shortlist, k + rescore_extra)`` and scores only those at full dimension.
+    """
+
+    def __init__(
+        self,
+        quantize: Optional[str] = None,
+        rescore_extra: int = 50,
+        coarse: Optional[str] = None,
+        coarse_dim: int = COARSE_DIM,
+        shortlist: int = COARSE_SHORTLIST,
+    ):
+        self.quantize = quantize or None
+        self.rescore_extra = rescore_extra
+        self.coarse = coarse or None
+        self.coarse_dim = coarse_dim
+        self.shortlist = shortlist
+        self._sources: Dict[Tuple[str, str], Tuple[int, Optional[tuple], SourceMatrix]] = {}
+        self._stacked: Dict[Tuple[str, Tuple[str, ...]], CandidateMatrix] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "loads": 0}
+
+    def candidates(self, repo, embedder, sources: Sequence[str]) -> CandidateMatrix:
+        sources = tuple(sources)
+        generations = repo.get_generations()
+        version = tuple(generations.get(s, 0) for s in sources)
+        key = (embedder.model, sources)
+        with self._lock:
+            entry = self._stacked.get(key)
+            if entry is not None and entry.version == version:
+                self.stats["hits"] += 1
+                return entry
+            projection = ensure_projection(embedder, self.coarse, self.coarse_dim) if self.coarse else None
+            mats = [self._source(repo, embedder, s, g, projection) for s, g in zip(sources, version)]
+            ids = [(m.source, mid) for m in mats for mid in m.market_ids]
+            hashes = [h for m in mats for h in m.hashes]
+            dim = next((m.matrix.shape[1] for m in mats if len(m)), 0)
+            if self.quantize:
+                matrix = QuantizedMatrix.concat([m.matrix for m in mats], dim, self.quantize)
+            elif len(mats) == 1:
+                matrix = mats[0].matrix
+            else:
+                matrix = np.concatenate([m.matrix for m in mats if len(m)]) if ids else np.empty((0, dim), dtype=np.float32)
+            coarse = None
+            if projection is not None and ids:
+                parts = [m.coarse for m in mats if len(m)]
+                coarse = parts[0] if len(parts) == 1 else np.concatenate(parts)
+            entry = CandidateMatrix(version, ids, matrix, hashes, coarse, projection if coarse is not None else None)
+            self._stacked[key] = entry
+            return entry
+
+    def _source(self, repo, embedder, source: str, generation: int, projection: Optional["Projection"]) -> SourceMatrix:
+        pkey = projection.key if projection is not None else None
+        cached = self._sources.get((embedder.model, source))
+        if cached is not None and cached[0] == generation and cached[1] == pkey:
+            return cached[2]
+        self.stats["loads"] += 1
+        m = project_source(load_source_matrix(repo, embedder, source), projection)
+        m = quantize_source(m, self.quantize)
+        self._sources[(embedder.model, source)] = (generation, pkey, m)
+        logger.info("Matrix cache loaded source=%s generation=%d rows=%d", source, generation, len(m))
+        return m
+
+    def rank(self, repo, embedder, query: np.ndarray, sources: Sequence[str], k: int, floor: float = -1.0) -> List[Tuple[str, str, float]]:
+        """Top ``k`` ``(source, market_id, cosine)`` above ``floor``, best first, from one matrix-vector product."""
+        c = self.candidates(repo, embedder, sources)
+        query = np.asarray(query, dtype=np.float32)
+        norm = float(np.linalg.norm(query))
+        if not len(c) or norm == 0.0 or c.matrix.shape[1] != len(query):
+            return []
+        query = query / norm
+        wanted = k + self.rescore_extra if self.quantize else k
+        shortlist = max(self.shortlist, wanted)
+        if c.coarse is not None and _shortlist_pays(len(c), c.matrix.shape[1], c.coarse.shape[1], shortlist):
+            # Full-dimension scores for the coarse shortlist only; ``rows`` maps back to c.ids
+            rows = _top(c.coarse @ c.projection.apply(query), shortlist)
+            matrix = c.matrix.take(rows) if self.quantize else c.matrix[rows]
+            METRICS.inc("coarse_rescored", len(rows))
+        else:
+            rows, matrix = None, c.matrix
+        scores = matrix.scores(query) if self.quantize else matrix @ query
+        top = _top(scores, wanted)
+        if self.quantize:
+            at = top if rows is None else rows[top]
+            exact = embedder.cache.get_many([c.hashes[i] for i in at.tolist()], embedder.model)
+            for t, i in zip(top.tolist(), at.tolist()):
+                vec = exact.get(c.hashes[i])
+                if vec is not None and len(vec) == len(query):
+                    scores[t] = float(vec @ query) / (float(np.linalg.norm(vec)) or 1.0)
+            METRICS.inc("quant_rescored", len(exact))
+        top = top[np.argsort(-scores[top], kind="stable")][:k]
+        at = top if rows is None else rows[top]
+        return [c.ids[i] + (float(scores[t]),) for t, i in zip(top.tolist(), at.tolist()) if scores[t] >= floor]
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    # Unordered indices of the k largest scores
+    if k < len(scores):
+        return np.argpartition(-scores, k - 1)[:k]
+    return np.arange(len(scores))
+
+def topk_blocked(
+    queries: np.ndarray,
+    corpus: np.ndarray,
+    k: int,
+    min_score: float = -1.0,
+    block_bytes: int = DEFAULT_BLOCK_BYTES,
+) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+    """Yield ``(query_row, corpus_rows, scores)`` for every query with hits >= ``min_score``.
+
+    Hits are ordered best first and capped at ``k``. Queries are scored in row blocks
+    sized so that one block of scores, with the temporaries of its top-k selection,
+    stays within ``block_bytes``.
+    """
+    n = corpus.shape[0]
+    if n == 0 or k <= 0 or queries.shape[0] == 0:
+        return
+    k = min(k, n)
+    block_rows = max(1, block_bytes // (n * TOPK_CELL_BYTES))
+    for start in range(0, queries.shape[0], block_rows):
+        yield from topk_rows(queries[start : start + block_rows] @ corpus.T, start, k, min_score)
+
+def topk_rows(scores: np.ndarray, start: int, k: int, min_score: float) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+    """Best ``k`` columns of each row of one score block, as yielded by ``topk_blocked``."""
+    n = scores.shape[1]
+    if k < n:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(scores, idx, axis=1)
+    else:
+        idx = np.broadcast_to(np.arange(n), scores.shape)
+        top = scores
+    order = np.argsort(-top, axis=1, kind="stable")
+    idx = np.take_along_axis(idx, order, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    for r in range(scores.shape[0]):
+        keep = top[r] >= min_score
+        if keep.any():
+            yield start + r, idx[r][keep], top[r][keep]
+
+
+@dataclass
+class QuantizedMatrix:
+    """Compact copy of a row-normalized float32 matrix.
+
+    ``int8`` stores each row scaled by its own max magnitude (``row ~ data * scale``,
+    4x smaller); ``float16`` stores the rows as is (2x smaller). Scoring converts
+    bounded slices back to float32 for BLAS, so no full-size float32 copy is made.
+    """
+    kind: str
+    data: np.ndarray
+    scales: Optional[np.ndarray] = None  # (n,) float32, int8 only
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.data.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    @classmethod
+    def quantize(cls, matrix: np.ndarray, kind: str) -> "QuantizedMatrix":
+        if kind not in QUANT_KINDS:
+            raise ValueError(f"unknown quantization {kind!r}; expected one of {QUANT_KINDS}")
+        if kind == "float16":
+            return cls(kind, matrix.astype(np.float16))
+        n = matrix.shape[0]
+        data = np.empty(matrix.shape, dtype=np.int8)
+        scales = np.ones(n, dtype=np.float32)
+        # In row slices, so the float temporaries stay small next to a large matrix
+        for start in range(0, n, 8192):
+            part = matrix[start : start + 8192]
+            peak = np.abs(part).max(axis=1) / 127.0 if part.shape[1] else np.zeros(len(part), dtype=np.float32)
+            peak[peak == 0.0] = 1.0
+            scales[start : start + len(part)] = peak
+            data[start : start + len(part)] = np.rint(part / peak[:, None])
+        return cls(kind, data, scales)
+
+    @classmethod
+    def concat(cls, parts: Sequence["QuantizedMatrix"], dim: int, kind: str) -> "QuantizedMatrix":
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return cls.quantize(np.empty((0, dim), dtype=np.float32), kind)
+        if len(parts) == 1:
+            return parts[0]
+        scales = np.concatenate([p.scales for p in parts]) if kind == "int8" else None
+        return cls(kind, np.concatenate([p.data for p in parts]), scales)
+
+    def take(self, rows: np.ndarray) -> "QuantizedMatrix":
+        return QuantizedMatrix(self.kind, self.data[rows], None if self.scales is None else self.scales[rows])
+
+    def rows(self, start: int, stop: int) -> np.ndarray:
+        """Rows ``start:stop`` back as float32."""
+        out = self.data[start:stop].astype(np.float32)
+        if self.scales is not None:
+            out *= self.scales[start:stop, None]
+        return out
+
+    def scores(self, queries: np.ndarray, block_bytes: int = DEFAULT_BLOCK_BYTES) -> np.ndarray:
+        """``queries @ self.T`` for float32 ``queries`` (one vector or a block of rows)."""
+        single = queries.ndim == 1
+        q = queries[None, :] if single else queries
+        n, dim = self.data.shape
+        out = np.empty((q.shape[0], n), dtype=np.float32)
+        step = max(1, block_bytes // (4 * max(1, dim)))
+        for start in range(0, n, step):
+            chunk = self.data[start : start + step].astype(np.float32)
+            out[:, start : start + step] = q @ chunk.T
+        if self.scales is not None:
+            out *= self.scales[None, :]
+        return out[0] if single else out
+
+def quantize_source(m: SourceMatrix, kind: Optional[str]) -> SourceMatrix:
+    """``m`` with its matrix replaced by a ``QuantizedMatrix`` (unchanged when ``kind`` is falsy)."""
+    if not kind:
+        return m
+    return SourceMatrix(m.source, m.market_ids, m.titles, m.hashes, QuantizedMatrix.quantize(m.matrix, kind), m.coarse)
+
+def topk_quantized(
+    queries: "np.ndarray | QuantizedMatrix",
+    corpus: QuantizedMatrix,
+    k: int,
+    min_score: float = -1.0,
+    block_bytes: int = DEFAULT_BLOCK_BYTES,
+) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+    """``topk_blocked`` against a quantized corpus (queries either form); scores are approximate."""
+    n = len(corpus)
+    if n == 0 or k <= 0 or len(queries) == 0:
+        return
+    k = min(k, n)
+    block_rows = max(1, block_bytes // (n * TOPK_CELL_BYTES))
+    for start in range(0, len(queries), block_rows):
+        if isinstance(queries, QuantizedMatrix):
+            block = queries.rows(start, start + block_rows)
+        else:
+            block = queries[start : start + block_rows]
+        yield from topk_rows(corpus.scores(block, block_bytes), start, k, min_score)
+
+def exact_scores(embedder, a_hashes: List[str], b_hashes: List[str]) -> np.ndarray:
+    """Full-precision cosine of each ``(a_hashes[i], b_hashes[i])`` pair, read back from the embedding cache.
+
+    Pairs with a vector missing from the cache score ``nan``; callers keep their
+    approximate score for those.
+    """
+    vecs: Dict[str, np.ndarray] = embedder.cache.get_many(list(a_hashes) + list(b_hashes), embedder.model)
+    dim = next((len(v) for v in vecs.values()), 0)
+    out = np.full(len(a_hashes), np.nan, dtype=np.float32)
+    if not dim:
+        return out
+    keys = list(vecs)
+    pos = {h: i for i, h in enumerate(keys)}
+    unit = normalize_rows(np.stack([vecs[h] for h in keys]).astype(np.float32))
+    ok = np.array([a in pos and b in pos for a, b in zip(a_hashes, b_hashes)], dtype=bool)
+    if ok.any():
+        ai = np.fromiter((pos[h] for h, good in zip(a_hashes, ok) if good), dtype=np.int64)
+        bi = np.fromiter((pos[h] for h, good in zip(b_hashes, ok) if good), dtype=np.int64)
+        out[ok] = np.einsum("ij,ij->i", unit[ai], unit[bi])
+    METRICS.inc("quant_rescored", int(ok.sum()))
+    return out
+
+def near_thresholds(scores: np.ndarray, thresholds: Sequence[float], margin: float) -> np.ndarray:
+    """Mask of scores within ``margin`` of any threshold: the ones whose decision quantization could flip."""
+    near = np.zeros(scores.shape, dtype=bool)
+    for t in thresholds:
+        near |= np.abs(scores - t) < margin
+    return near
+
+@dataclass
+class Projection:
+    """Map from full-dimension unit vectors to ``dim`` coarse dimensions for shortlisting.
+
+    ``prefix`` keeps the leading ``dim`` components and renormalizes them (the
+    Matryoshka-style truncation Voyage models are trained for). ``pca`` projects onto
+    the top ``dim`` eigenvectors of the uncentered second moment of a cache sample,
+    so dot products of projected rows approximate the full cosines; without
+    centering no per-row correction term is needed.
+    """
+    kind: str
+    dim: int
+    source_dim: int
+    basis: Optional[np.ndarray] = None  # (source_dim, dim) float32, pca only
+    fitted_rows: int = 0
+    fitted_at: int = 0
+
+    @property
+    def key(self) -> tuple:
+        return (self.kind, self.dim, self.fitted_at)
+
+    @classmethod
+    def fit(cls, kind: str, dim: int, sample: np.ndarray, fitted_rows: int) -> "Projection":
+        if kind not in COARSE_KINDS:
+            raise ValueError(f"unknown projection {kind!r}; expected one of {COARSE_KINDS}")
+        source_dim = sample.shape[1]
+        if kind == "prefix":
+            return cls(kind, dim, source_dim, None, fitted_rows, now_ts())
+        x = normalize_rows(sample.astype(np.float64))
+        _, vecs = np.linalg.eigh(x.T @ x)  # ascending eigenvalues
+        basis = np.ascontiguousarray(vecs[:, ::-1][:, :dim], dtype=np.float32)
+        return cls(kind, dim, source_dim, basis, fitted_rows, now_ts())
+
+    def apply(self, matrix: np.ndarray) -> np.ndarray:
+        """Reduced float32 copy of ``matrix`` (rows of unit vectors, or one vector)."""
+        if self.kind == "pca":
+            return np.ascontiguousarray(matrix @ self.basis, dtype=np.float32)
+        out = np.array(matrix[..., : self.dim], dtype=np.float32)
+        if out.ndim == 1:
+            return out / (float(np.linalg.norm(out)) or 1.0)
+        return normalize_rows(out)
+
+def ensure_projection(embedder, kind: str, dim: int, sample: int = PROJECTION_SAMPLE) -> Optional[Projection]:
+    """The stored projection for ``embedder.model``, fitted (and stored) first when needed.
+
+    A model without a row, a changed ``kind``/``dim``, or (``pca``) a cache that has
+    more than doubled since the fit gets a new one. Returns None, so callers search
+    at full dimension, while ``dim`` is not below the vectors' own dimension or there
+    are fewer cached vectors than ``dim``.
+    """
+    if kind not in COARSE_KINDS:
+        raise ValueError(f"unknown projection {kind!r}; expected one of {COARSE_KINDS}")
+    cache, model = embedder.cache, embedder.model
+    count = cache.count_vectors(model)
+    row = cache.get_projection(model)
+    if row is not None and row[0] == kind and row[1] == dim and (kind == "prefix" or count <= 2 * row[4]):
+        k, d, source_dim, blob, fitted_rows, fitted_at = row
+        basis = np.frombuffer(blob, dtype="<f4").reshape(source_dim, d) if blob is not None else None
+        return Projection(k, d, source_dim, basis, fitted_rows, fitted_at)
+    vecs = cache.sample_vectors(model, sample if kind == "pca" else 1)
+    if not vecs:
+        return None
+    source_dim = len(vecs[0])
+    vecs = [v for v in vecs if len(v) == source_dim]
+    if dim >= source_dim or (kind == "pca" and len(vecs) < dim):
+        logger.debug("No %s projection to %d dims for model=%s (dim=%d, %d vectors)", kind, dim, model, source_dim, len(vecs))
+        return None
+    with METRICS.timer("projection_fit"):
+        p = Projection.fit(kind, dim, np.stack(vecs), count)
+    basis = p.basis.astype("<f4").tobytes() if p.basis is not None else None
+    cache.set_projection(model, p.kind, p.dim, p.source_dim, basis, p.fitted_rows, p.fitted_at)
+    logger.info("Fitted %s projection %d -> %d for model=%s from %d of %d vectors", kind, source_dim, dim, model, len(vecs), count)
+    return p
+
+def project_source(m: SourceMatrix, projection: Optional[Projection]) -> SourceMatrix:
+    """``m`` with ``coarse`` set to its rows under ``projection`` (unchanged when None); call before quantizing."""
+    if projection is None or m.matrix.shape[1] != projection.source_dim:
+        return m
+    return SourceMatrix(m.source, m.market_ids, m.titles, m.hashes, m.matrix, projection.apply(m.matrix))
+
+def _shortlist_pays(n: int, dim: int, coarse_dim: int, shortlist: int) -> bool:
+    # Full dimensions saved on the corpus scan vs the gathered rescoring of the shortlist
+    return shortlist < n and n * (dim - coarse_dim) > GATHER_COST * shortlist * dim
+
+def topk_two_stage(
+    queries: "np.ndarray | QuantizedMatrix",
+    corpus: "np.ndarray | QuantizedMatrix",
+    queries_coarse: np.ndarray,
+    corpus_coarse: np.ndarray,
+    k: int,
+    shortlist: int = COARSE_SHORTLIST,
+    min_score: float = -1.0,
+    block_bytes: int = DEFAULT_BLOCK_BYTES,
+) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+    """``topk_blocked`` that scores the full rows of each query's coarse shortlist only.
+
+    The best ``shortlist`` corpus rows per query by reduced score are rescored at
+    full dimension, so at most ``min(k, shortlist)`` hits come back per query. Falls
+    back to the exhaustive scan when the corpus is too small for that to be cheaper
+    (rescoring gathers rows, which costs about ``GATHER_COST`` times a BLAS product).
+    """
+    n = len(corpus)
+    if n == 0 or k <= 0 or len(queries) == 0:
+        return
+    m = min(shortlist, n)
+    dim = corpus.shape[1]
+    if not _shortlist_pays(n, dim, corpus_coarse.shape[1], m):
+        if isinstance(corpus, QuantizedMatrix):
+            yield from topk_quantized(queries, corpus, k, min_score, block_bytes)
+        else:
+            q = queries.rows(0, len(queries)) if isinstance(queries, QuantizedMatrix) else queries
+            yield from topk_blocked(q, corpus, k, min_score, block_bytes)
+        return
+    k = min(k, m)
+    block_rows = max(1, block_bytes // (n * TOPK_CELL_BYTES))
+    for start in range(0, len(queries), block_rows):
+        coarse = queries_coarse[start : start + block_rows] @ corpus_coarse.T
+        idx = np.argpartition(-coarse, m - 1, axis=1)[:, :m]
+        if isinstance(queries, QuantizedMatrix):
+            q = queries.rows(start, start + len(idx))
+        else:
+            q = queries[start : start + len(idx)]
+        quantized = isinstance(corpus, QuantizedMatrix)
+        data = corpus.data if quantized else corpus
+        scores = np.empty(idx.shape, dtype=np.float32)
+        # One gather and matrix-vector product per query beats a batched matmul over gathered rows
+        for r in range(len(idx)):
+            rows = np.take(data, idx[r], axis=0)
+            scores[r] = (rows.astype(np.float32) if quantized else rows) @ q[r]
+        if quantized and corpus.scales is not None:
+            scores *= corpus.scales[idx]
+        METRICS.inc("coarse_rescored", scores.size)
+        for qi, cols, sims in topk_rows(scores, start, k, min_score):
+            yield qi, idx[qi - start][cols], sims
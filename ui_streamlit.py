@@ -1,17 +1,24 @@
 # ui_streamlit.py
 import os
 import time
+from pathlib import Path
 from typing import Dict, List, Tuple, Optional
+import numpy as np
 import streamlit as st
+import streamlit.components.v1 as components
 
 from dotenv import load_dotenv
-from market_sync.config import DB_PATH, VOYAGE_MODEL
+from market_sync.ann import AnnStore
+from market_sync.config import DB_PATH, VOYAGE_MODEL, EMBED_CONCURRENCY, EMBED_RPM, EMBED_TPM, VECTOR_QUANT, COARSE_SEARCH
 from market_sync.db import open_db
-from market_sync.embeddings import EmbeddingCache, Embedder
+from market_sync.embeddings import EmbeddingCache, Embedder, VectorLRU
+from market_sync.models import embedding_text
+from market_sync.neighbors import NeighborTable
+from market_sync.prefetch import CANDIDATE, VISIBLE, EmbeddingPrefetcher
 from market_sync.repo import Repo
 from market_sync.clients.polymarket import PolymarketClient
 from market_sync.sync import sync_source
-from market_sync.match import cosine
+from market_sync.vectors import MatrixCache
 
 # ---------- Page setup ----------
 st.set_page_config(
@@ -50,28 +57,7 @@ st.markdown("""
 
 /* --- Layout polish ------------------------------------------------------- */
 .main .block-container { padding-top: 1.2rem; padding-bottom: 2rem; max-width: 1400px; }
-.grid { display:grid; gap:12px; grid-template-columns: repeat(4, minmax(0, 1fr)); }
-@media (max-width: 1300px) { .grid { grid-template-columns: repeat(3, minmax(0, 1fr)); } }
-@media (max-width: 1000px) { .grid { grid-template-columns: repeat(2, minmax(0, 1fr)); } }
-
-/* --- Cards --------------------------------------------------------------- */
-.card {
-  border-radius:16px; padding:14px 16px; height:100%;
-  background:var(--card-bg);
-  border:1px solid var(--card-border);
-  box-shadow: var(--shadow);
-  transition: transform .08s ease, box-shadow .08s ease, border-color .2s ease;
-  color:var(--text-primary);
-}
-.card:hover { transform: translateY(-1px); box-shadow: 0 6px 22px rgba(0,0,0,.08); border-color: var(--hover-border); }
-
-.card .title { font-weight:600; line-height:1.2; font-size:0.98rem; color:var(--text-primary); }
-.card .desc  { color:var(--text-secondary); font-size:.88rem; margin-top:.45rem; max-height:5.2em; overflow:hidden; }
-.card .meta  { display:flex; gap:.5rem; align-items:center; margin-top:.65rem; color:var(--text-secondary); font-size:.8rem; }
-.card .pill  {
-  padding:.18rem .55rem; border-radius:999px;
-  border:1px solid var(--pill-border); background:var(--pill-bg); color:var(--text-secondary);
-}
+/* Card grids render inside the card_grid component (ui_components/card_grid), which carries its own styles */
 
 /* --- Section headers ----------------------------------------------------- */
 .badge {
@@ -85,14 +71,22 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ---------- Lazy singletons in session_state ----------
+@st.cache_resource
+def get_vector_lru() -> VectorLRU:
+    # One memory budget for every session's cache and the prefetcher
+    return VectorLRU()
+
 def get_ctx():
     if "ctx" not in st.session_state:
         load_dotenv()
         conn = open_db(DB_PATH)
-        cache = EmbeddingCache(conn)
+        cache = EmbeddingCache(conn, lru=get_vector_lru())
         repo = Repo(conn)
         try:
-            embedder = Embedder(model=VOYAGE_MODEL, cache=cache, api_key=os.getenv("VOYAGE_API_KEY"))
+            embedder = Embedder(
+                model=VOYAGE_MODEL, cache=cache, api_key=os.getenv("VOYAGE_API_KEY"),
+                max_concurrency=EMBED_CONCURRENCY, rpm=EMBED_RPM, tpm=EMBED_TPM,
+            )
         except Exception:
             st.error("Missing or invalid VOYAGE_API_KEY. Set it in your environment to enable embeddings.")
             st.stop()
@@ -104,34 +98,60 @@ def get_ctx():
         }
     return st.session_state.ctx
 
+@st.cache_resource
+def get_ann() -> AnnStore:
+    return AnnStore()
+
+@st.cache_resource
+def get_matrix_cache() -> MatrixCache:
+    # One per server process, shared by every browser session
+    return MatrixCache(quantize=VECTOR_QUANT, coarse=COARSE_SEARCH)
+
+@st.cache_resource
+def get_prefetcher() -> EmbeddingPrefetcher:
+    # Own connection and embedder: its worker thread writes the cache in the background
+    conn = open_db(DB_PATH)
+    embedder = Embedder(
+        model=VOYAGE_MODEL, cache=EmbeddingCache(conn, lru=get_vector_lru()), api_key=os.getenv("VOYAGE_API_KEY"),
+        max_concurrency=EMBED_CONCURRENCY, rpm=EMBED_RPM, tpm=EMBED_TPM,
+    )
+    return EmbeddingPrefetcher(embedder)
+
 CTX = get_ctx()
 REPO: Repo = CTX["repo"]
 EMB: Embedder = CTX["embedder"]
+ANN: AnnStore = get_ann()
+MATRICES: MatrixCache = get_matrix_cache()
+NEIGHBORS = NeighborTable()
+PREFETCH: EmbeddingPrefetcher = get_prefetcher()
 
 # ---------- Data helpers ----------
-@st.cache_data(ttl=5)
-def list_sources() -> List[str]:
-    rows = CTX["conn"].execute("SELECT DISTINCT source FROM bets WHERE is_active=1 ORDER BY source").fetchall()
-    return [r[0] for r in rows]
-
-@st.cache_data(ttl=5)
-def fetch_active_bets(source: str, limit: int = 500, search: str = "") -> List[Dict]:
-    q = """
-    SELECT source, market_id, slug, title, COALESCE(description, ''), url, COALESCE(close_time, '')
-    FROM bets
-    WHERE is_active=1 AND source=?
-    """
-    args: List = [source]
-    if search:
-        q += " AND (title LIKE ? OR description LIKE ?)"
-        like = f"%{search}%"
-        args += [like, like]
-    q += " ORDER BY last_seen_at DESC LIMIT ?"
-    args += [limit]
-    rows = CTX["conn"].execute(q, args).fetchall()
+PAGE_SIZES = [20, 40, 80]
+SEARCH_LIMIT = 800
+
+def generations() -> tuple:
+    # Bumped by every sync that changed a source, in this process or another; keys the cached reads below
+    return tuple(sorted(REPO.get_generations().items()))
+
+@st.cache_data(max_entries=16)
+def list_sources(generations: tuple = ()) -> List[str]:
+    return REPO.list_active_sources()
+
+@st.cache_data(max_entries=256)
+def fetch_page(source: str, page_size: int, after: Optional[tuple] = None, generations: tuple = ()) -> Tuple[List[Dict], Optional[tuple]]:
+    # Keyset page on (last_seen_at, market_id); see Repo.fetch_active_page
+    rows, next_after = REPO.fetch_active_page(source, page_size, after)
+    return bet_dicts(rows), next_after
+
+@st.cache_data(max_entries=64)
+def search_bets(source: str, search: str, limit: int = SEARCH_LIMIT, generations: tuple = ()) -> List[Dict]:
+    # FTS5 with bm25 ranking and prefix matching; see Repo.search_active_bets
+    return bet_dicts(REPO.search_active_bets(source, search, limit))
+
+def bet_dicts(rows) -> List[Dict]:
     out = []
     for s, mid, slug, title, desc, url, close_time in rows:
-        text = title.strip() + ("\n\n" + desc.strip() if desc and desc.strip() else "")
+        text = embedding_text(title, desc)
         out.append({
             "source": s, "market_id": mid, "slug": slug, "title": title, "description": desc,
             "url": url or (f"https://polymarket.com/market/{slug}" if s=="polymarket" and slug else None),
@@ -139,50 +159,86 @@ def fetch_active_bets(source: str, limit: int = 500, search: str = "") -> List[D
         })
     return out
 
-def ensure_embedding(text: str) -> List[float]:
-    h = EMB.text_hash(text)
-    vec = EMB.cache.get(h, EMB.model)
-    if vec is None:
-        vec = EMB.embed_text(text)
-    return vec
-
-def rank_similar(target_vec: List[float], candidates: List[Dict]) -> List[Tuple[Dict, float]]:
-    # 1) Identify which candidates need embeddings
-    missing_idx: List[int] = []
-    missing_texts: List[str] = []
-    hashes: List[Optional[str]] = []
-    for i, c in enumerate(candidates):
-        text = c.get("text")
-        if not text:
-            hashes.append(None)
-            continue
-        h = EMB.text_hash(text)
-        hashes.append(h)
-        if EMB.cache.get(h, EMB.model) is None:
-            missing_idx.append(i)
-            missing_texts.append(text)
-
-    # 2) Batch-embed missing texts (writes into cache)
-    if missing_texts:
-        EMB.embed_texts(missing_texts)
-
-    # 3) Score with cosine
+def ensure_embedding(text: str) -> np.ndarray:
+    # Usually a cache hit thanks to the prefetcher; waits for its batch if the text is in flight
+    return PREFETCH.get(EMB.text_hash(text), text, EMB)
+
+def prefetch_embeddings(bets: List[Dict], sources: List[str], gens: tuple):
+    """Queue the visible cards first, then every unembedded candidate (listed once per generation)."""
+    PREFETCH.submit(((EMB.text_hash(b["text"]), b["text"]) for b in bets), VISIBLE)
+    PREFETCH.submit_once(
+        (EMB.model, tuple(sources), gens),
+        lambda: [(h, embedding_text(t, d)) for h, t, d in REPO.fetch_unembedded(EMB.model, sources)],
+        CANDIDATE,
+    )
+
+def rank_cached(target_vec: np.ndarray, sources: List[str], k: int, floor: float) -> List[Tuple[Dict, float]]:
+    """Exact top-k against the process-wide candidate matrix (one matrix-vector product)."""
+    hits = MATRICES.rank(REPO, EMB, target_vec, sources, k, floor)
+    by_source: Dict[str, Dict[str, float]] = {}
+    for s, mid, sim in hits:
+        by_source.setdefault(s, {})[mid] = sim
     ranked: List[Tuple[Dict, float]] = []
-    for c, h in zip(candidates, hashes):
-        if not c.get("text") or h is None:
-            continue
-        vec = EMB.cache.get(h, EMB.model)
-        if not vec:
-            continue
-        ranked.append((c, float(cosine(target_vec, vec))))
+    for s, scores in by_source.items():
+        for bet in bet_dicts(REPO.fetch_bets_by_ids(s, list(scores))):
+            ranked.append((bet, scores[bet["market_id"]]))
     ranked.sort(key=lambda x: x[1], reverse=True)
     return ranked
 
+def rank_from_table(text: str, sources: List[str], k: int, floor: float) -> Optional[List[Tuple[Dict, float]]]:
+    """Indexed lookup in the materialized neighbour lists; None when they can't answer the query."""
+    if k > NEIGHBORS.k or floor < NEIGHBORS.floor:
+        return None
+    rows = REPO.fetch_neighbors(EMB.model, "polymarket", EMB.text_hash(text), sources, k, floor)
+    if rows is None:
+        return None
+    return [(bet, row[7]) for bet, row in zip(bet_dicts([r[:7] for r in rows]), rows)]
+
+# ---------- Card grid component ----------
+_card_grid = components.declare_component("card_grid", path=str(Path(__file__).with_name("ui_components") / "card_grid"))
+
+def card_grid(bets: List[Dict], key: str, pills, selected_id: Optional[str] = None, selectable: bool = False):
+    """Render one page of cards as a single component; clicks arrive through ``grid_click(key)``."""
+    cards = [
+        {
+            "id": b["market_id"], "title": b["title"], "description": b["description"][:400], "url": b["url"],
+            "pills": pills(b), "selected": b["market_id"] == selected_id,
+        }
+        for b in bets
+    ]
+    _card_grid(cards=cards, selectable=selectable, key=key, default=None)
+
+def grid_click(key: str) -> Optional[str]:
+    """Market id of a card clicked since the last rerun, read before the grid is drawn so it renders selected."""
+    event = st.session_state.get(key)
+    if not event or event.get("nonce") == st.session_state.get(f"{key}_nonce"):
+        return None
+    st.session_state[f"{key}_nonce"] = event["nonce"]
+    return event["id"]
+
+def pager(key: str, reset_on: tuple) -> Dict:
+    """Paging state for one grid: ``cursors[i]`` opens page i. Starts over when ``reset_on`` changes."""
+    state = st.session_state.get(key)
+    if state is None or state["reset_on"] != reset_on:
+        state = {"reset_on": reset_on, "cursors": [None], "page": 0}
+        st.session_state[key] = state
+    return state
+
+def pager_controls(key: str, has_next: bool, label: str):
+    # Callbacks run before the next rerun draws anything, so the new page renders immediately
+    def move(step: int):
+        st.session_state[key]["page"] = max(0, st.session_state[key]["page"] + step)
+    state = st.session_state[key]
+    prev_col, info_col, next_col = st.columns([1, 4, 1])
+    prev_col.button("← Prev", key=f"{key}_prev", disabled=state["page"] == 0, on_click=move, args=(-1,), use_container_width=True)
+    info_col.caption(label)
+    next_col.button("Next →", key=f"{key}_next", disabled=not has_next, on_click=move, args=(1,), use_container_width=True)
+
 # ---------- Actions ----------
 def refresh_sources():
     pm = PolymarketClient()
     bets = pm.fetch_bets(limit=st.session_state.get("pm_limit", 500))
-    new_or_changed, _, inactivated = sync_source(bets, REPO, EMB)
+    new_or_changed, _, inactivated = sync_source(bets, REPO, EMB, ann=ANN, neighbors=NEIGHBORS)
     CTX["last_sync"] = time.time()
     return {"new_or_changed": len(new_or_changed), "inactivated": inactivated, "count": len(bets)}
 
@@ -205,52 +261,44 @@ with st.sidebar:
 
 # ---------- Top / bottom layout ----------
 st.markdown("### Top: Polymarket")
-top_search = st.text_input("Filter Polymarket by text", placeholder="Type to filter title/description…")
-top_limit  = st.slider("Show up to", 20, 800, 120, step=20)
-pm_bets = fetch_active_bets("polymarket", limit=top_limit, search=top_search)
-
-# Selected state
-if "selected_pm" not in st.session_state and pm_bets:
-    st.session_state.selected_pm = pm_bets[0]["market_id"]
-
-# Keep selection valid after filtering
-visible_ids = {b["market_id"] for b in pm_bets}
-if st.session_state.get("selected_pm") not in visible_ids:
-    if pm_bets:
-        st.session_state.selected_pm = pm_bets[0]["market_id"]
-    else:
-        st.session_state.selected_pm = None
-
-# Cards grid
-st.markdown('<div class="grid">', unsafe_allow_html=True)
-for bet in pm_bets:
-    selected = (bet["market_id"] == st.session_state.get("selected_pm"))
-    border = " style='border-color:rgba(99,102,241,.55)'" if selected else ""
-    link = (
-        f"<a href='{bet['url']}' target='_blank' rel='noopener noreferrer' style='text-decoration:none;color:inherit'>🔗</a>"
-        if bet["url"] else ""
-    )
-    st.markdown(
-        f"""
-        <div class="card" {border}>
-            <div class="title">{bet['title']}</div>
-            <div class="desc">{bet['description'][:260] + ('…' if len(bet['description'])>260 else '')}</div>
-            <div class="meta">
-                <span class="pill">#{bet['market_id']}</span>
-                <span class="pill">polymarket</span>
-                {link}
-            </div>
-        </div>
-        """, unsafe_allow_html=True
-    )
-    # Clickable via lightweight form button
-    key = f"sel_{bet['market_id']}"
-    if st.button(("✅ Selected" if selected else "Select"), key=key):
-        st.session_state.selected_pm = bet["market_id"]
-st.markdown('</div>', unsafe_allow_html=True)
+search_col, size_col = st.columns([4, 1])
+top_search = search_col.text_input("Filter Polymarket by text", placeholder="Type to filter title/description…")
+page_size = size_col.selectbox("Cards per page", PAGE_SIZES, index=1)
+gens = generations()
+sources = [s for s in list_sources(gens) if s != "polymarket"]
 
-# Find the selected top bet
-selected_pm: Optional[Dict] = next((b for b in pm_bets if b["market_id"] == st.session_state.get("selected_pm")), None)
+# One page per rerun: keyset on last_seen_at when browsing, a slice of the bm25 hits when searching
+top_pages = pager("pm_pages", (top_search, page_size))
+if top_search:
+    hits = search_bets("polymarket", top_search, generations=gens)
+    start = top_pages["page"] * page_size
+    pm_bets = hits[start : start + page_size]
+    has_next = start + page_size < len(hits)
+    page_label = f"Page {top_pages['page'] + 1} of {max(1, -(-len(hits) // page_size))} • {len(hits)} matches"
+else:
+    pm_bets, next_after = fetch_page("polymarket", page_size, top_pages["cursors"][top_pages["page"]], gens)
+    if next_after is not None:
+        del top_pages["cursors"][top_pages["page"] + 1 :]
+        top_pages["cursors"].append(next_after)
+    has_next = next_after is not None
+    page_label = f"Page {top_pages['page'] + 1}"
+
+# Selection comes from the grid's click event; it survives paging and only falls back to the page's first card
+clicked = grid_click("pm_grid")
+if clicked:
+    st.session_state.selected_pm = clicked
+selected_rows = REPO.fetch_bets_by_ids("polymarket", [st.session_state.selected_pm]) if st.session_state.get("selected_pm") else []
+selected_pm: Optional[Dict] = bet_dicts(selected_rows)[0] if selected_rows else None
+if selected_pm is None and pm_bets:
+    selected_pm = pm_bets[0]
+    st.session_state.selected_pm = selected_pm["market_id"]
+
+card_grid(
+    pm_bets, "pm_grid", lambda b: [f"#{b['market_id']}", "polymarket"],
+    selected_id=st.session_state.get("selected_pm"), selectable=True,
+)
+pager_controls("pm_pages", has_next, page_label)
+prefetch_embeddings(pm_bets, sources, gens)
 
 st.write("---")
 st.markdown(
@@ -258,7 +306,6 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-sources = [s for s in list_sources() if s != "polymarket"]
 if not sources:
     st.info("No other sources yet. Add another market client (e.g., Manifold, Kalshi, etc.), run a sync, and they’ll appear here.")
 else:
@@ -273,48 +320,45 @@ else:
             pass
         st.markdown('</div>', unsafe_allow_html=True)
 
-    # Gather bottom candidates
     cand_sources = sources if target_source == "All" else [target_source]
-    candidates: List[Dict] = []
-    for s in cand_sources:
-        candidates.extend(fetch_active_bets(s, limit=1000, search=""))
 
     if not selected_pm:
         st.warning("Select a Polymarket market above to compute similarities.")
     else:
         # Compute similarity
         with st.spinner("Embedding + ranking by cosine similarity…"):
-            pm_vec = ensure_embedding(selected_pm["text"])
-            ranked = rank_similar(pm_vec, candidates)
-            # Filter & trim
-            ranked = [r for r in ranked if r[1] >= sim_floor][:show_n]
+            ranked = rank_from_table(selected_pm["text"], cand_sources, show_n, sim_floor)
+            if ranked is None:
+                # No stored list covers this query: exact scan of the cached candidate matrix
+                ranked = rank_cached(ensure_embedding(selected_pm["text"]), cand_sources, show_n, sim_floor)
 
         if not ranked:
             st.info("No candidates meet the current filters.")
         else:
-            # Render ranked list as cards
-            st.markdown('<div class="grid">', unsafe_allow_html=True)
-            for cand, score in ranked:
-                link = (
-                    f"<a href='{cand['url']}' target='_blank' rel='noopener noreferrer' style='text-decoration:none;color:inherit'>🔗</a>"
-                    if cand["url"] else ""
-                )
-                st.markdown(
-                        f"""
-                        <div class="card">
-                            <div class="title">{cand['title']}</div>
-                            <div class="desc">{cand['description'][:260] + ('…' if len(cand['description'])>260 else '')}</div>
-                            <div class="meta">
-                                <span class="pill">{cand['source']}</span>
-                                <span class="pill">sim: {score:.3f}</span>
-                                <span class="pill">#{cand['market_id']}</span>
-                                {link}
-                            </div>
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
-                st.button("View", key=f"view_{cand['source']}_{cand['market_id']}")
-            st.markdown('</div>', unsafe_allow_html=True)
+            bottom_pages = pager("ranked_pages", (selected_pm["market_id"], tuple(cand_sources), show_n, sim_floor, page_size))
+            start = bottom_pages["page"] * page_size
+            scores = {(c["source"], c["market_id"]): score for c, score in ranked}
+            card_grid(
+                [c for c, _ in ranked[start : start + page_size]], "ranked_grid",
+                lambda b: [b["source"], f"sim: {scores[(b['source'], b['market_id'])]:.3f}", f"#{b['market_id']}"],
+            )
+            pager_controls(
+                "ranked_pages", start + page_size < len(ranked),
+                f"Page {bottom_pages['page'] + 1} of {-(-len(ranked) // page_size)} • {len(ranked)} ranked",
+            )
 
 st.caption("Tip: hit the sidebar **Refresh** after you add a new client to the codebase.")
+
+# Drawn last so it reflects what this rerun queued
+with st.sidebar:
+    st.write("---")
+    st.caption("Embedding prefetch")
+    queued, in_flight = PREFETCH.depth()
+    stats = PREFETCH.stats
+    st.caption(f"Queue: {queued} • in flight: {in_flight} • embedded: {stats['embedded']}")
+    st.caption(f"Lookups: {stats['hits']} hits • {stats['waited']} waited • {stats['misses']} misses")
+    lru = EMB.cache.lru
+    st.caption(
+        f"Vector LRU: {len(lru)} vectors • {lru.bytes / 2**20:.1f} of {lru.max_bytes / 2**20:.0f} MB • "
+        f"{lru.stats['hits']} hits • {lru.stats['misses']} misses • {lru.stats['evictions']} evicted"
+    )